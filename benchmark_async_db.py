@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""Бенчмарк: задержка обработчиков при синхронном и асинхронном доступе к БД
+
+Моделируется 50 одновременных чатов. Каждый "обработчик" делает то же, что
+/neworder: ищет пользователя, ищет техника по имени, создает заказ и
+отвечает в чат (ответ моделируется asyncio.sleep). Дополнительно часть
+чатов запрашивает отчет по техникам (полный проход по orders).
+
+Запуск:
+    python benchmark_async_db.py [--chats 50] [--updates 10] [--orders 50000]
+"""
+import sys
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import database
+from services.user_manager import UserManager, AsyncUserManager
+from services.order_service import OrderService, AsyncOrderService
+from services.report_service import ReportService, AsyncReportService
+
+TELEGRAM_REPLY_DELAY = 0.005
+
+
+def setup_db(orders_count: int):
+    """Создать временную БД с пользователями и заказами"""
+    db_path = os.path.join(tempfile.mkdtemp(), 'orders.db')
+    database.configure(db_path)
+    database.init_db()
+
+    with database.db_connection() as conn:
+        for i in range(200):
+            conn.execute(
+                'INSERT INTO users (telegram_id, name, role, is_admin) VALUES (?, ?, ?, ?)',
+                (1000 + i, f"Техник{i} Иван Петрович", 'technician' if i % 2 else 'doctor', 1 if i < 5 else 0)
+            )
+        conn.executemany('''
+            INSERT INTO orders (doctor_id, technician_id, patient_name, work_type, quantity, deadline, description)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (random.randint(1, 200), random.randint(1, 200), f"Пациент {i}",
+             random.choice(['металлокерамическая коронка', 'коронка из диоксида циркония на винте', 'бюгельный протез']),
+             random.randint(1, 10), '15.02.2026', '')
+            for i in range(orders_count)
+        ])
+
+
+async def sync_handler(chat_id: int, with_report: bool):
+    """Обработчик, вызывающий синхронный sqlite3 прямо в event loop"""
+    UserManager.get_user_by_telegram_id(1000)
+    technician = UserManager.find_user_by_name(f"Техник{chat_id % 100 * 2 + 1} Иван Петрович", 'technician')
+    OrderService.create_order(None, technician['id'] if technician else None, 'Пациент', 'коронка', 1, '15.02.2026', '', None)
+    if with_report:
+        ReportService.get_technician_statistics()
+    await asyncio.sleep(TELEGRAM_REPLY_DELAY)
+
+
+async def async_handler(chat_id: int, with_report: bool):
+    """Тот же обработчик через асинхронный слой"""
+    await AsyncUserManager.get_user_by_telegram_id(1000)
+    technician = await AsyncUserManager.find_user_by_name(f"Техник{chat_id % 100 * 2 + 1} Иван Петрович", 'technician')
+    await AsyncOrderService.create_order(None, technician['id'] if technician else None, 'Пациент', 'коронка', 1, '15.02.2026', '', None)
+    if with_report:
+        await AsyncReportService.get_technician_statistics()
+    await asyncio.sleep(TELEGRAM_REPLY_DELAY)
+
+
+async def simulate_chat(handler, chat_id: int, updates: int, latencies: list):
+    """Чат, присылающий updates сообщений с небольшими паузами"""
+    rng = random.Random(chat_id)
+    for i in range(updates):
+        await asyncio.sleep(rng.uniform(0, 0.02))
+        started = time.perf_counter()
+        await handler(chat_id, with_report=(i == 0 and chat_id % 10 == 0))
+        latencies.append(time.perf_counter() - started)
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def run(handler, chats: int, updates: int) -> dict:
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*(simulate_chat(handler, chat_id, updates, latencies) for chat_id in range(chats)))
+    elapsed = time.perf_counter() - started
+    return {
+        'p50': percentile(latencies, 50) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'max': max(latencies) * 1000,
+        'total': elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--updates', type=int, default=10)
+    parser.add_argument('--orders', type=int, default=50000)
+    args = parser.parse_args()
+
+    random.seed(42)
+    setup_db(args.orders)
+
+    print("=" * 70)
+    print(f" {args.chats} chats x {args.updates} updates, {args.orders} orders in DB")
+    print("=" * 70)
+
+    for title, handler in (("sync sqlite3 in event loop", sync_handler), ("async (DB executor)", async_handler)):
+        result = asyncio.run(run(handler, args.chats, args.updates))
+        print(f"{title:30} p50={result['p50']:8.1f} ms  p99={result['p99']:8.1f} ms  "
+              f"max={result['max']:8.1f} ms  total={result['total']:.2f} s")
+        database.shutdown_db_executor()
+
+    print(f"Pool stats: {database.get_pool_stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Бенчмарк: нормализация названий работ правилами вместо запроса к ИИ
+
+Корпус - фразы из test_dental_rules.CORPUS и названия работ из реальных
+заказов (data/orders.db открывается только на чтение, если есть).
+Для каждой фразы считается, решают ли ее правила без сетевого запроса,
+и время одной нормализации. Экономия оценивается по средней задержке
+запроса к OpenRouter (--llm-latency, секунды).
+
+Запуск:
+    python benchmark_dental_rules.py [--iterations 2000] [--llm-latency 2.5]
+"""
+import sys
+import os
+import time
+import sqlite3
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from services.dental_rules import DentalRuleNormalizer, classify_token
+from test_dental_rules import CORPUS
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'orders.db')
+
+
+def load_corpus() -> list:
+    """Фразы корпуса теста и названия работ из реальных заказов"""
+    phrases = [text for text, _ in CORPUS if text]
+
+    if os.path.exists(DB_PATH):
+        conn = sqlite3.connect(f'file:{DB_PATH}?mode=ro', uri=True)
+        try:
+            phrases.extend(row[0] for row in conn.execute('SELECT work_type FROM orders') if row[0])
+        except sqlite3.Error as e:
+            print(f"orders.db skipped: {e}")
+        finally:
+            conn.close()
+
+    return phrases
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--llm-latency', type=float, default=2.5)
+    args = parser.parse_args()
+
+    phrases = load_corpus()
+    normalizer = DentalRuleNormalizer()
+
+    handled = [text for text in phrases if normalizer.normalize(text) is not None]
+    escalated = [text for text in phrases if normalizer.normalize(text) is None]
+
+    # холодный прогон: пустой кэш классификации слов
+    classify_token.cache_clear()
+    started = time.perf_counter()
+    for text in phrases:
+        normalizer.normalize(text)
+    cold = (time.perf_counter() - started) / len(phrases)
+
+    started = time.perf_counter()
+    for _ in range(args.iterations):
+        for text in phrases:
+            normalizer.normalize(text)
+    warm = (time.perf_counter() - started) / (args.iterations * len(phrases))
+
+    share = len(handled) / len(phrases)
+
+    print("=" * 70)
+    print(f" {len(phrases)} phrases, {args.iterations} iterations")
+    print("=" * 70)
+    print(f"Handled without network: {len(handled)}/{len(phrases)} ({share:.0%})")
+    print(f"Rule engine latency:     cold {cold * 1e6:.1f} us, warm {warm * 1e6:.1f} us per phrase")
+    print(f"Estimated LLM time saved per phrase: {share * args.llm_latency:.2f} s "
+          f"(at {args.llm_latency:.1f} s per request)")
+    print("\nEscalated to OpenRouter:")
+    for text in escalated:
+        print(f"  {text[:70]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Бенчмарк: выгрузка заказов в XLSX и CSV (/export)
+
+Создается временная БД с N заказами (как в benchmark_period_report.py) и
+выгружаются все заказы в оба формата. Для каждого файла печатаются
+время и размер, с --memory - еще пик памяти Python (tracemalloc, отдельным
+прогоном: с ним выгрузка в несколько раз медленнее). Пик не должен расти
+с числом заказов, так как строки пишутся из курсора по мере чтения.
+Файлы больше 50 МБ бот не отправит - для таких объемов нужен период.
+
+Запуск:
+    python benchmark_export.py [--orders 100000 1000000] [--memory]
+"""
+import sys
+import os
+import time
+import argparse
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import database
+from benchmark_period_report import build_db
+from services.export_service import ExportService, EXPORT_FORMATS, EXPORT_MAX_BYTES
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Orders export to XLSX/CSV')
+    parser.add_argument('--orders', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--doctors', type=int, default=30)
+    parser.add_argument('--technicians', type=int, default=10)
+    parser.add_argument('--memory', action='store_true', help='also measure peak memory with tracemalloc')
+    args = parser.parse_args()
+
+    for orders_count in args.orders:
+        started = time.perf_counter()
+        build_db(orders_count, args.doctors, args.technicians)
+        print(f"== {orders_count} orders (built in {time.perf_counter() - started:.1f}s)")
+
+        for file_format in EXPORT_FORMATS:
+            result = ExportService.export_orders(file_format=file_format)
+            os.remove(result['path'])
+
+            line = (f"   {file_format:4}  {result['elapsed']:6.1f}s  {result['rows'] / result['elapsed']:9.0f} rows/s  "
+                    f"{result['size'] / 1024 / 1024:7.1f} MB")
+
+            if args.memory:
+                tracemalloc.start()
+                os.remove(ExportService.export_orders(file_format=file_format)['path'])
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                line += f"  peak {peak / 1024 / 1024:5.1f} MB"
+
+            if result['size'] > EXPORT_MAX_BYTES:
+                line += '  (over the 50 MB bot limit)'
+            print(line)
+
+        database.close_pool()
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""Бенчмарк: запросы напоминаний и отчетов до и после миграции индексов
+
+Создается временная БД старой схемы (deadline только текстом ДД.ММ.ГГГГ,
+без вторичных индексов) с N заказами за несколько лет. Сначала замеряются
+прежние запросы (o.deadline = 'ДД.ММ.ГГГГ', DATE(created_at) BETWEEN),
+затем init_db добавляет deadline_date, заполняет его и строит индексы, и
+замеряются текущие запросы. Для каждого запроса печатается план
+(EXPLAIN QUERY PLAN): SCAN - полный проход, SEARCH ... USING INDEX - поиск
+по индексу.
+
+Запуск:
+    python benchmark_indexes.py [--orders 1000000] [--repeat 5]
+"""
+import sys
+import os
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import database
+from database import db_connection
+
+LEGACY_SCHEMA = '''
+    CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        telegram_id INTEGER UNIQUE,
+        name TEXT NOT NULL,
+        role TEXT NOT NULL,
+        is_admin INTEGER DEFAULT 0,
+        reference_id INTEGER,
+        is_active INTEGER DEFAULT 1,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        doctor_id INTEGER,
+        technician_id INTEGER,
+        patient_name TEXT,
+        work_type TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        deadline TEXT NOT NULL,
+        description TEXT,
+        photo_id TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        status TEXT DEFAULT 'in_progress'
+    );
+    CREATE TABLE reminders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL,
+        reminder_type TEXT NOT NULL,
+        sent_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+'''
+
+WORK_TYPES = ['металлокерамическая коронка', 'коронка из диоксида циркония на винте', 'бюгельный протез', 'мост']
+
+TOMORROW = datetime(2026, 3, 15)
+PERIOD = ('2026-03-01', '2026-03-31')
+
+LEGACY_QUERIES = {
+    'reminders (due tomorrow)': ('''
+        SELECT o.id FROM orders o
+        LEFT JOIN users t ON o.technician_id = t.id
+        WHERE o.deadline = ? AND o.status = 'in_progress'
+        AND NOT EXISTS (SELECT 1 FROM reminders r WHERE r.order_id = o.id AND r.reminder_type = 'today')
+    ''', (TOMORROW.strftime('%d.%m.%Y'),)),
+    'period report (month)': ('''
+        SELECT COUNT(*), SUM(quantity), COUNT(DISTINCT doctor_id), COUNT(DISTINCT technician_id)
+        FROM orders
+        WHERE status = 'in_progress' AND DATE(created_at) >= ? AND DATE(created_at) <= ?
+    ''', PERIOD),
+    'orders of technician': ('SELECT COUNT(*) FROM orders WHERE technician_id = ?', (17,)),
+    'active technicians': ("SELECT id FROM users WHERE role = 'technician' AND is_active = 1", ()),
+}
+
+CURRENT_QUERIES = {
+    'reminders (due tomorrow)': ('''
+        SELECT o.id FROM orders o
+        LEFT JOIN users t ON o.technician_id = t.id
+        WHERE o.status = 'in_progress' AND o.deadline_date = ?
+        AND NOT EXISTS (SELECT 1 FROM reminders r WHERE r.order_id = o.id AND r.reminder_type = 'today')
+    ''', (TOMORROW.strftime('%Y-%m-%d'),)),
+    'period report (month)': ('''
+        SELECT COUNT(*), SUM(quantity), COUNT(DISTINCT doctor_id), COUNT(DISTINCT technician_id)
+        FROM orders
+        WHERE status = 'in_progress' AND created_at >= ? AND created_at < ?
+    ''', (PERIOD[0], '2026-04-01')),
+    'orders of technician': ('SELECT COUNT(*) FROM orders WHERE technician_id = ?', (17,)),
+    'active technicians': ("SELECT id FROM users WHERE role = 'technician' AND is_active = 1", ()),
+}
+
+
+def build_legacy_db(db_path: str, orders_count: int):
+    """БД старой схемы: заказы равномерно за 5 лет, 1% с напоминаниями"""
+    rng = random.Random(42)
+    start = datetime(2022, 1, 1)
+    span = 5 * 365 * 24 * 3600
+
+    conn = sqlite3.connect(db_path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.executemany(
+        'INSERT INTO users (telegram_id, name, role) VALUES (?, ?, ?)',
+        [(1000 + i, f"Пользователь{i}", 'technician' if i % 2 else 'doctor') for i in range(200)]
+    )
+
+    def rows():
+        for i in range(orders_count):
+            created = start + timedelta(seconds=rng.randrange(span))
+            deadline = created + timedelta(days=rng.randint(1, 21))
+            yield (rng.randint(1, 200), rng.randint(1, 200), f"Пациент {i}", rng.choice(WORK_TYPES),
+                   rng.randint(1, 10), deadline.strftime('%d.%m.%Y'), '',
+                   created.strftime('%Y-%m-%d %H:%M:%S'), 'in_progress' if rng.random() < 0.9 else 'done')
+
+    conn.executemany('''
+        INSERT INTO orders (doctor_id, technician_id, patient_name, work_type, quantity, deadline, description,
+                            created_at, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows())
+    conn.executemany(
+        "INSERT INTO reminders (order_id, reminder_type) VALUES (?, 'today')",
+        [(order_id,) for order_id in range(1, orders_count + 1, 100)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def measure(queries: dict, repeat: int) -> dict:
+    """План и лучшее время каждого запроса"""
+    results = {}
+    with db_connection() as conn:
+        for name, (sql, params) in queries.items():
+            plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+            best = float('inf')
+            for _ in range(repeat):
+                started = time.perf_counter()
+                rows = conn.execute(sql, params).fetchall()
+                best = min(best, time.perf_counter() - started)
+            results[name] = (plan, best, len(rows))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query plans before/after the index migration')
+    parser.add_argument('--orders', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'orders.db')
+    started = time.perf_counter()
+    build_legacy_db(db_path, args.orders)
+    print(f"Built legacy DB with {args.orders} orders in {time.perf_counter() - started:.1f}s")
+
+    database.configure(db_path)
+    before = measure(LEGACY_QUERIES, args.repeat)
+
+    started = time.perf_counter()
+    database.init_db()
+    print(f"Migration (deadline_date backfill + indexes) took {time.perf_counter() - started:.1f}s\n")
+
+    with db_connection() as conn:
+        conn.execute('ANALYZE')
+    after = measure(CURRENT_QUERIES, args.repeat)
+
+    for name in LEGACY_QUERIES:
+        plan_before, time_before, rows_before = before[name]
+        plan_after, time_after, rows_after = after[name]
+        print(f"== {name}")
+        print(f"   before: {time_before * 1000:9.2f} ms  rows={rows_before}")
+        for line in plan_before:
+            print(f"           {line}")
+        print(f"   after:  {time_after * 1000:9.2f} ms  rows={rows_after}  ({time_before / max(time_after, 1e-9):.0f}x)")
+        for line in plan_after:
+            print(f"           {line}")
+        print()
+
+    database.close_pool()
+
+
+if __name__ == '__main__':
+    main()
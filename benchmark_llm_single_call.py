@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""Бенчмарк: разбор заказа одним запросом к ИИ против двух запросов
+
+Для каждого сообщения из корпуса выполняется normalize_message_async в
+режиме двух запросов (разбор заказа + нормализация вида работы) и в режиме
+одного запроса (LLM_SINGLE_CALL). Сравниваются задержка, число запросов,
+объем токенов и совпадение полей результата.
+
+С --live запросы идут в OpenRouter (нужен OPENROUTER_API_KEY). Без него
+используется локальная имитация: задержка = LLM_BASE_LATENCY + время на
+обработку промпта (пропорционально его длине), ответы строятся простым
+парсером и правилами, поэтому совпадение в этом режиме проверяет только
+обвязку, а не качество модели.
+
+Запуск:
+    python benchmark_llm_single_call.py [--live] [--repeat 3]
+"""
+import sys
+import os
+import json
+import time
+import asyncio
+import argparse
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from services.message_processor import MessageProcessor
+from services.dental_rules import DentalRuleNormalizer
+
+ORDERS = [
+    "Мороков циркон на винте 7шт пациент Иванов",
+    "Плюхин металлокерамика 2 шт на 02.04.2026 врач Гаспарянидзе пациент Анохин",
+    "Козлов виниры циркон 5шт от Иванова 15.02.2026 пациент Сидоров",
+    "Сидоров мк 13шт пациент Петров",
+    "Мороков мост циркон 4 зуба на 10.05.2026 пациент Онопко",
+    "Плюхин бюгельный протез 1шт врач Гаспарянидзе",
+    "Козлов керамика 3 шт пациент Широкова",
+    "Мороков элайнеры 2шт пациент Кузнецова",
+    "Плюхин емакс коронка 1шт пациент Анохин",
+    "Сидоров временная шина 1 шт на 20.04.2026",
+]
+
+COMPARED_FIELDS = ('technician_name', 'doctor_name', 'patient_name', 'work_type', 'quantity', 'deadline')
+
+# Имитация OpenRouter: задержка до первого токена и время на 1000 символов промпта
+LLM_BASE_LATENCY = 0.6
+LLM_PROMPT_LATENCY_PER_1K = 0.05
+
+
+class StandInClient:
+    """Локальная замена AsyncOpenAI с задержкой, зависящей от длины промпта"""
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+        self.rules = DentalRuleNormalizer()
+        self.parser = MessageProcessor(single_call=False)
+        self.parser.client = None
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, messages, **kwargs):
+        prompt = ''.join(m['content'] for m in messages)
+        self.stats['requests'] += 1
+        self.stats['prompt_chars'] += len(prompt)
+        await asyncio.sleep(LLM_BASE_LATENCY + LLM_PROMPT_LATENCY_PER_1K * len(prompt) / 1000)
+
+        user_text = messages[-1]['content']
+        if 'response_format' in kwargs:
+            parsed = self.parser.parse_message_simple(user_text, normalize=False)
+            parsed['work_type_raw'] = parsed['work_type']
+            content = json.dumps(parsed, ensure_ascii=False)
+        elif 'Исправь название' in user_text:
+            work_type = user_text.split('"')[1]
+            content = self.rules.normalize(work_type) or work_type
+        else:
+            content = json.dumps(self.parser.parse_message_simple(user_text, normalize=False), ensure_ascii=False)
+
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=None
+        )
+
+
+class RecordingClient:
+    """Обертка над настоящим AsyncOpenAI, считающая запросы и токены"""
+
+    def __init__(self, client, stats: dict):
+        self.client = client
+        self.stats = stats
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.stats['requests'] += 1
+        self.stats['prompt_chars'] += sum(len(m['content']) for m in kwargs['messages'])
+        response = await self.client.chat.completions.create(**kwargs)
+        if getattr(response, 'usage', None):
+            self.stats['tokens'] += response.usage.total_tokens
+        return response
+
+
+def make_processor(single_call: bool, live: bool, stats: dict) -> MessageProcessor:
+    processor = MessageProcessor(single_call=single_call)
+    if live:
+        if not processor.async_client:
+            raise SystemExit("OPENROUTER_API_KEY is required for --live")
+        client = RecordingClient(processor.async_client, stats)
+    else:
+        client = StandInClient(stats)
+    processor.async_client = client
+    processor.dental_service.async_client = client
+    # кэш и правила сравниваются отдельно: здесь каждая фраза идет в ИИ
+    processor.dental_rules.normalize = lambda work_type: None
+    return processor
+
+
+async def run_mode(single_call: bool, live: bool, repeat: int) -> dict:
+    stats = {'requests': 0, 'prompt_chars': 0, 'tokens': 0}
+    latencies = []
+    results = {}
+
+    for _ in range(repeat):
+        processor = make_processor(single_call, live, stats)
+        for text in ORDERS:
+            started = time.perf_counter()
+            results[text] = await processor.normalize_message_async(text)
+            latencies.append(time.perf_counter() - started)
+
+    latencies.sort()
+    return {
+        'p50': latencies[len(latencies) // 2],
+        'mean': sum(latencies) / len(latencies),
+        'requests': stats['requests'] / (repeat * len(ORDERS)),
+        'prompt_chars': stats['prompt_chars'] / (repeat * len(ORDERS)),
+        'tokens': stats['tokens'] / (repeat * len(ORDERS)),
+        'results': results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--live', action='store_true')
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    two_call = asyncio.run(run_mode(False, args.live, args.repeat))
+    single_call = asyncio.run(run_mode(True, args.live, args.repeat))
+
+    print("=" * 70)
+    print(f" {len(ORDERS)} orders x {args.repeat}, {'OpenRouter' if args.live else 'stand-in LLM'}")
+    print("=" * 70)
+    for title, result in (("two calls", two_call), ("single call", single_call)):
+        tokens = f"  tokens={result['tokens']:.0f}" if args.live else ""
+        print(f"{title:12} p50={result['p50'] * 1000:7.0f} ms  mean={result['mean'] * 1000:7.0f} ms  "
+              f"requests={result['requests']:.1f}  prompt={result['prompt_chars']:.0f} chars{tokens}")
+
+    agreement = {field: 0 for field in COMPARED_FIELDS}
+    for text in ORDERS:
+        for field in COMPARED_FIELDS:
+            if two_call['results'][text].get(field) == single_call['results'][text].get(field):
+                agreement[field] += 1
+
+    print("\nAgreement with two-call pipeline:")
+    for field, matched in agreement.items():
+        print(f"  {field:16} {matched}/{len(ORDERS)}")
+
+    print("\nDifferences in work_type:")
+    for text in ORDERS:
+        old, new = two_call['results'][text].get('work_type'), single_call['results'][text].get('work_type')
+        if old != new:
+            print(f"  {text[:40]:40} | {old} | {new}")
+
+
+if __name__ == '__main__':
+    main()
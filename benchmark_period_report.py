@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Бенчмарк: отчет за период четырьмя запросами и одним проходом
+
+Для каждого размера создается временная БД с N заказами за 5 лет
+(врачей, техников и видов работ - как в небольшой лаборатории) и
+сравниваются три способа собрать отчет /report_period:
+    orders      - четыре запроса по orders (до появления итогов order_daily_stats)
+    4 queries   - четыре метода ReportService по итогам
+    single pass - ReportService.get_period_report, один курсор
+Замеряется лучшее время из нескольких повторов для месяца и для года.
+
+Запуск:
+    python benchmark_period_report.py [--orders 100000 1000000] [--repeat 5]
+"""
+import sys
+import os
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import database
+from database import db_connection
+from services.report_service import ReportService
+
+WORK_TYPES = [f'вид работ {i}' for i in range(25)]
+
+PERIODS = {
+    'month': ('01.03.2026', '31.03.2026'),
+    'year': ('01.01.2025', '31.12.2025'),
+}
+
+# Запросы отчета по orders в том виде, в каком они были до итогов
+ORDERS_QUERIES = (
+    '''SELECT u.name, o.work_type, COUNT(o.id) FROM orders o JOIN users u ON o.doctor_id = u.id
+       WHERE o.status = 'in_progress' AND o.created_at >= ? AND o.created_at < ?
+       GROUP BY u.id, o.work_type ORDER BY u.name, o.work_type''',
+    '''SELECT u.name, o.work_type, COUNT(o.id), SUM(o.quantity) FROM orders o JOIN users u ON o.technician_id = u.id
+       WHERE o.status = 'in_progress' AND o.created_at >= ? AND o.created_at < ?
+       GROUP BY u.id, o.work_type ORDER BY u.name, o.work_type''',
+    '''SELECT work_type, COUNT(*), SUM(quantity) FROM orders
+       WHERE status = 'in_progress' AND created_at >= ? AND created_at < ?
+       GROUP BY work_type ORDER BY 2 DESC''',
+    '''SELECT COUNT(*), SUM(quantity), COUNT(DISTINCT doctor_id), COUNT(DISTINCT technician_id) FROM orders
+       WHERE status = 'in_progress' AND created_at >= ? AND created_at < ?''',
+)
+
+
+def build_db(orders_count: int, doctors: int, technicians: int) -> str:
+    """Временная БД текущей схемы; итоги ведут триггеры при вставке"""
+    rng = random.Random(42)
+    db_path = os.path.join(tempfile.mkdtemp(), 'orders.db')
+    database.configure(db_path)
+    database.init_db()
+
+    with db_connection() as conn:
+        conn.executemany(
+            'INSERT INTO users (telegram_id, name, role) VALUES (?, ?, ?)',
+            [(1000 + i, f"Врач {i}", 'doctor') for i in range(doctors)] +
+            [(2000 + i, f"Техник {i}", 'technician') for i in range(technicians)]
+        )
+
+    start = datetime(2021, 6, 1)
+    span = 5 * 365 * 24 * 3600
+
+    def rows():
+        for i in range(orders_count):
+            created = start + timedelta(seconds=rng.randrange(span))
+            yield (rng.randint(1, doctors), doctors + rng.randint(1, technicians), f"Пациент {i}",
+                   rng.choice(WORK_TYPES), rng.randint(1, 10), '', created.strftime('%Y-%m-%d %H:%M:%S'),
+                   'in_progress' if rng.random() < 0.9 else 'done')
+
+    with db_connection() as conn:
+        conn.executemany('''
+            INSERT INTO orders (doctor_id, technician_id, patient_name, work_type, quantity, deadline,
+                                created_at, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows())
+        conn.execute('ANALYZE')
+    return db_path
+
+
+def orders_report(start_date: str, end_date: str):
+    start_sql = datetime.strptime(start_date, '%d.%m.%Y').strftime('%Y-%m-%d')
+    end_sql = (datetime.strptime(end_date, '%d.%m.%Y') + timedelta(days=1)).strftime('%Y-%m-%d')
+    for query in ORDERS_QUERIES:
+        with db_connection() as conn:
+            conn.execute(query, (start_sql, end_sql)).fetchall()
+
+
+def separate_report(start_date: str, end_date: str):
+    ReportService.get_period_statistics(start_date, end_date)
+    ReportService.get_doctor_statistics(start_date, end_date)
+    ReportService.get_technician_statistics(start_date, end_date)
+    ReportService.get_work_type_statistics(start_date, end_date)
+
+
+def single_pass_report(start_date: str, end_date: str):
+    ReportService.get_period_report(start_date, end_date)
+
+
+def best_time(func, period: tuple, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*period)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Period report: four queries vs single pass')
+    parser.add_argument('--orders', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--doctors', type=int, default=30)
+    parser.add_argument('--technicians', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for orders_count in args.orders:
+        started = time.perf_counter()
+        build_db(orders_count, args.doctors, args.technicians)
+        with db_connection() as conn:
+            rollup_rows = conn.execute('SELECT COUNT(*) FROM order_daily_stats').fetchone()[0]
+        print(f"== {orders_count} orders, {rollup_rows} rollup rows (built in {time.perf_counter() - started:.1f}s)")
+
+        for name, period in PERIODS.items():
+            timings = {
+                'orders': best_time(orders_report, period, args.repeat),
+                '4 queries': best_time(separate_report, period, args.repeat),
+                'single pass': best_time(single_pass_report, period, args.repeat),
+            }
+            line = '  '.join(f"{label}: {seconds * 1000:8.2f} ms" for label, seconds in timings.items())
+            print(f"   {name:5}  {line}  ({timings['4 queries'] / timings['single pass']:.1f}x vs 4 queries)")
+
+        database.close_pool()
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""Бенчмарк: прием обновлений по webhook против long polling
+
+Вместо Telegram - локальный заменитель (StandInTelegram): HTTP-сервер с
+методами Bot API, которые вызывает бот (getMe, getUpdates, setWebhook,
+deleteWebhook, sendMessage). Бот - настоящее Application PTB с base_url
+на заменитель и одним обработчиком, который "работает" --work секунд
+(как запрос в БД) и отвечает sendMessage.
+
+Заменитель выпускает --updates обновлений с частотой --rate в секунду
+(0 - все сразу) от --chats разных пользователей: в режиме polling они
+отдаются через getUpdates, в режиме webhook - POST-запросами на
+веб-сервер PTB (updater.start_webhook) через --connections соединений
+(как делает Telegram).
+--latency задает задержку сети в одну сторону (запрос к заменителю, его
+ответ, доставка webhook): локально без нее оба режима почти одинаковы,
+разница - в лишних оборотах getUpdates по медленному каналу (VPN).
+--ordered включает обработчик бота ChatOrderedUpdateProcessor (сообщения
+одного чата по очереди) вместо стандартного параллельного.
+Для каждого обновления измеряется время от выпуска до ответа
+sendMessage; печатаются обновления в секунду и задержка (p50/p95/max).
+
+Запуск:
+    python benchmark_webhook.py [--updates 2000] [--rate 200] [--work 0.02] [--concurrency 8] [--latency 0.05] [--ordered]
+"""
+import sys
+import os
+import json
+import time
+import asyncio
+import socket
+import argparse
+from urllib.parse import parse_qs
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from telegram.ext import Application, MessageHandler, filters
+from utils.update_processor import ChatOrderedUpdateProcessor
+
+TOKEN = '123456:BENCHMARK'
+
+
+async def read_request(reader: asyncio.StreamReader):
+    """Запрос бота к заменителю: (target, body) или None, если соединение закрыто"""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    body = await reader.readexactly(length) if length else b''
+    return request_line.decode('latin-1').split()[1], body
+
+
+def json_response(data: dict) -> bytes:
+    body = json.dumps(data).encode()
+    return (f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class StandInTelegram:
+    """Заменитель Bot API: выпускает обновления и записывает ответы бота"""
+
+    def __init__(self, connections: int, latency: float = 0.0):
+        self.connections = connections
+        self.latency = latency
+        self.issued = {}
+        self.answered = {}
+        self.pending = []
+        self._new_updates = asyncio.Event()
+        self._webhook_queue = asyncio.Queue()
+        self._workers = []
+        self.webhook_url = None
+        self.secret_token = None
+        self.done = asyncio.Event()
+        self.expected = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, '127.0.0.1', 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        self._server.close()
+
+    def issue(self, update_id: int, chat_id: int):
+        """Выпустить обновление: в getUpdates или на webhook"""
+        update = {'update_id': update_id, 'message': {
+            'message_id': update_id, 'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+            'text': f'bench {update_id}'}}
+        self.issued[update_id] = time.perf_counter()
+        if self.webhook_url:
+            self._webhook_queue.put_nowait(update)
+        else:
+            self.pending.append(update)
+            self._new_updates.set()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                target, body = request
+                method = target.rsplit('/', 1)[-1]
+                params = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+                await asyncio.sleep(self.latency)
+                result = await self.call(method, params)
+                await asyncio.sleep(self.latency)
+                writer.write(json_response({'ok': True, 'result': result}))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def call(self, method: str, params: dict):
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        if method == 'getUpdates':
+            return await self.get_updates(int(params.get('offset', 0)), float(params.get('timeout', 0)))
+        if method == 'setWebhook':
+            self.webhook_url = params['url']
+            self.secret_token = params.get('secret_token')
+            self._workers = [asyncio.create_task(self._webhook_worker()) for _ in range(self.connections)]
+            return True
+        if method == 'deleteWebhook':
+            return True
+        if method == 'sendMessage':
+            update_id = int(params['text'].split()[-1])
+            self.answered[update_id] = time.perf_counter()
+            if len(self.answered) >= self.expected:
+                self.done.set()
+            return {'message_id': update_id, 'date': int(time.time()), 'text': params['text'],
+                    'chat': {'id': int(params['chat_id']), 'type': 'private'}}
+        return True
+
+    async def get_updates(self, offset: int, timeout: float) -> list:
+        self.pending = [update for update in self.pending if update['update_id'] >= offset]
+        if not self.pending and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.pending[:100]
+
+    async def _webhook_worker(self):
+        """Одно соединение Telegram с webhook: следующий POST - после ответа на предыдущий"""
+        host_port, path = self.webhook_url.split('://', 1)[1].split('/', 1)
+        host, port = host_port.split(':')
+        writer = None
+        while True:
+            update = await self._webhook_queue.get()
+            if writer is None:
+                # веб-сервер PTB начинает слушать только после ответа на setWebhook
+                reader, writer = await asyncio.open_connection(host, int(port))
+            body = json.dumps(update).encode()
+            await asyncio.sleep(self.latency)
+            writer.write((
+                f"POST /{path} HTTP/1.1\r\nHost: {host_port}\r\nContent-Type: application/json\r\n"
+                f"X-Telegram-Bot-Api-Secret-Token: {self.secret_token}\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n"
+            ).encode() + body)
+            await writer.drain()
+            status_line = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b''):
+                pass
+            if b' 200 ' not in status_line:
+                print(f"   webhook answered {status_line.decode().strip()}")
+            await asyncio.sleep(self.latency)
+
+
+def percentile(values: list, share: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+async def run_mode(mode: str, args) -> dict:
+    telegram = StandInTelegram(args.connections, args.latency)
+    await telegram.start()
+    telegram.expected = args.updates
+
+    async def answer(update, context):
+        await asyncio.sleep(args.work)
+        await update.effective_message.reply_text(update.effective_message.text)
+
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(f'http://127.0.0.1:{telegram.port}/bot')
+        .concurrent_updates(ChatOrderedUpdateProcessor(args.concurrency) if args.ordered else args.concurrency)
+        .build()
+    )
+    application.add_handler(MessageHandler(filters.TEXT, answer))
+    await application.initialize()
+    await application.start()
+
+    if mode == 'webhook':
+        port = free_port()
+        await application.updater.start_webhook(
+            listen='127.0.0.1', port=port, url_path='telegram', webhook_url=f'http://127.0.0.1:{port}/telegram',
+            secret_token='benchmark', max_connections=args.connections)
+    else:
+        await application.updater.start_polling(poll_interval=0, timeout=10)
+
+    started = time.perf_counter()
+    for update_id in range(1, args.updates + 1):
+        if args.rate:
+            delay = started + (update_id - 1) / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        telegram.issue(update_id, 1000 + update_id % args.chats)
+
+    await asyncio.wait_for(telegram.done.wait(), timeout=300)
+    elapsed = max(telegram.answered.values()) - started
+
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    await telegram.stop()
+
+    latencies = sorted(telegram.answered[i] - telegram.issued[i] for i in telegram.answered)
+    return {
+        'updates_per_second': len(latencies) / elapsed,
+        'p50': percentile(latencies, 0.5) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'max': latencies[-1] * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Webhook vs long polling on a stand-in Telegram')
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=200, help='updates per second, 0 = burst')
+    parser.add_argument('--work', type=float, default=0.02, help='handler time per update, seconds')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent_updates of the Application')
+    parser.add_argument('--connections', type=int, default=40, help='webhook connections (max_connections)')
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0, help='one-way network delay to Telegram, seconds')
+    parser.add_argument('--modes', nargs='+', default=['polling', 'webhook'])
+    parser.add_argument('--ordered', action='store_true', help='per-chat ordered update processor')
+    args = parser.parse_args()
+
+    print(f"== {args.updates} updates, rate {args.rate or 'burst'}/s, handler {args.work * 1000:.0f} ms, "
+          f"concurrency {args.concurrency}{' (ordered per chat)' if args.ordered else ''}, network {args.latency * 1000:.0f} ms")
+    for mode in args.modes:
+        result = asyncio.run(run_mode(mode, args))
+        print(f"   {mode:8} {result['updates_per_second']:7.0f} updates/s   latency p50 {result['p50']:6.1f} ms  "
+              f"p95 {result['p95']:6.1f} ms  max {result['max']:6.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
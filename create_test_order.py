@@ -4,7 +4,7 @@ import os
 from datetime import datetime, timedelta
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from database import get_connection
+from database import get_connection, iso_date
 
 def create_test_order():
     """Создать тестовый заказ с дедлайном на завтра"""
@@ -17,8 +17,8 @@ def create_test_order():
 
     try:
         cursor.execute('''
-            INSERT INTO orders (doctor_id, technician_id, patient_name, work_type, quantity, deadline, description, photo_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO orders (doctor_id, technician_id, patient_name, work_type, quantity, deadline, description, photo_id, deadline_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             None,  # doctor_id
             5,     # technician_id (Плюхин)
@@ -27,7 +27,8 @@ def create_test_order():
             1,
             tomorrow,
             "Тестовый заказ для проверки напоминаний",
-            None
+            None,
+            iso_date(tomorrow)
         ))
 
         order_id = cursor.lastrowid
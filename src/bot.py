@@ -1,6 +1,9 @@
 import os
 import sys
+import signal
+import secrets
 import asyncio
+import threading
 import logging
 from dotenv import load_dotenv
 from telegram import Update
@@ -8,19 +11,59 @@ from telegram.ext import Application, CommandHandler, MessageHandler, filters, C
 from telegram.error import NetworkError, TimedOut
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from database import init_db
-from services.message_processor import MessageProcessor
+from database import init_db, run_db, close_pool, shutdown_db_executor
+from migrations import run_backfills
+from services.processor_registry import init_processor_registry, close_processor_registry
+from services.notification_service import NotificationService
+from services.outbox import get_outbox_worker
+from services.media_registry import get_media_registry
+from services.notification_fanout import get_notification_fanout
+from services.conversation_store import SQLitePersistence
 from handlers.registration import register_handler
-from handlers.admin import admin_menu, admin_menu_handler, get_admin_handler
+from handlers.admin import admin_menu, admin_menu_handler, get_admin_handler, terminology_cache_stats, terminology_cache_clear, outbox_stats, report_cache_stats, update_stats
 from handlers.orders import new_order_start, new_order_handler
-from handlers.reports import report_doctors, report_technicians, report_work_types, report_period_handler
+from handlers.reports import report_doctors, report_technicians, report_work_types, report_period_handler, report_page_handler, export_command
 from handlers.change_role import change_role_start, change_role_handler
-from utils.reminder_background import run_background_task
+from utils.reminder_background import get_reminder_scheduler
+from utils.update_processor import get_update_processor
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 
+# polling - getUpdates (по умолчанию), webhook - Telegram сам присылает
+# обновления на WEBHOOK_URL (веб-сервер PTB, python-telegram-bot[webhooks])
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
+# Адрес, на котором бот принимает обновления (обычно за nginx с HTTPS)
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+
+# Публичный адрес для setWebhook без пути, например https://bot.example.com
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+
+# Секрет из заголовка X-Telegram-Bot-Api-Secret-Token (1-256 символов A-Z a-z 0-9 _ -).
+# Если не задан, генерируется при запуске - он все равно передается в setWebhook
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+
+# Сертификат и ключ, если бот сам принимает HTTPS (без nginx); самоподписанный
+# сертификат загружается в Telegram через setWebhook
+WEBHOOK_CERT = os.getenv('WEBHOOK_CERT', '')
+WEBHOOK_KEY = os.getenv('WEBHOOK_KEY', '')
+
+# Сколько соединений одновременно открывает Telegram (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+ALLOWED_UPDATES = ['message', 'callback_query']
+
+# Команды сохраняемых диалогов: о них напоминаем после перезапуска бота
+RESUMABLE_COMMANDS = {
+    'new_order': '/neworder',
+    'registration': '/register',
+    'report_period_conversation': '/report_period',
+}
+
 # Configure logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -31,9 +74,8 @@ logger = logging.getLogger(__name__)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        from services.user_manager import UserManager
-        user_manager = UserManager
-        user = user_manager.get_user_by_telegram_id(update.effective_user.id)
+        from services.user_manager import AsyncUserManager
+        user = await AsyncUserManager.get_user_by_telegram_id(update.effective_user.id)
 
         if user:
             welcome_text = f'👋 Привет, {user["name"]}!\n\n'
@@ -53,6 +95,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /report_technicians - Отчет по техникам
 /report_work_types - Отчет по видам работ
 /report_period - Отчет за период
+/export - Выгрузка заказов или отчета в XLSX/CSV
 
 💡 Для назначения администратора:
 /admin_secret СЕКРЕТНЫЙ_КОД
@@ -83,6 +126,12 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /report_technicians - Отчет по техникам (все время)
 /report_work_types - Отчет по видам работ (все время)
 /report_period - Отчет за период
+/export - Выгрузка заказов или отчета в XLSX/CSV
+/terminology_cache - Кэш терминологии
+/terminology_cache_clear - Очистить кэш терминологии
+/outbox - Очередь уведомлений
+/report_cache - Кэш отчетов
+/updates - Обработка обновлений
 
 💡 Создание заказа:
 Команда /neworder позволяет создать новый заказ.
@@ -113,7 +162,7 @@ async def echo(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def admin_secret(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Секретная команда для назначения администратора"""
-    from services.user_manager import UserManager
+    from services.user_manager import AsyncUserManager
     import os
 
     SECRET_CODE = os.getenv('ADMIN_SECRET_CODE', 'admin123')
@@ -128,13 +177,13 @@ async def admin_secret(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text('❌ Неверный секретный код.')
         return
 
-    user = UserManager.get_user_by_telegram_id(update.effective_user.id)
+    user = await AsyncUserManager.get_user_by_telegram_id(update.effective_user.id)
 
     if not user:
         await update.message.reply_text('❌ Сначала зарегистрируйтесь через команду /register')
         return
 
-    success = UserManager.set_admin(update.effective_user.id)
+    success = await AsyncUserManager.set_admin(update.effective_user.id)
 
     if success:
         await update.message.reply_text(
@@ -148,17 +197,90 @@ async def admin_secret(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text('❌ Ошибка назначения администратора.')
 
 
+async def notify_resumed_conversations(persistence: SQLitePersistence, notification_service: NotificationService):
+    """Сообщить пользователям, что незавершенная команда пережила перезапуск"""
+    commands_by_chat = {}
+    for name, key, state in persistence.recovered:
+        if name in RESUMABLE_COMMANDS:
+            commands_by_chat.setdefault(key[0], []).append(RESUMABLE_COMMANDS[name])
+
+    jobs = [
+        (chat_id, notification_service.delivery(
+            chat_id,
+            f'♻️ Бот был перезапущен. Незавершенная команда {", ".join(commands)} сохранена - '
+            'продолжайте с того же шага или отмените ее через /cancel.'
+        ), 'resume')
+        for chat_id, commands in commands_by_chat.items()
+    ]
+    if jobs:
+        results = await get_notification_fanout().send_all(jobs)
+        logger.info(f'Resumed conversations: notified {sum(r["ok"] for r in results)} of {len(jobs)} chats')
+
+
+async def run_startup_backfills(stop: threading.Event, reminder_scheduler):
+    """Дозаполнить новые колонки в фоне, затем перепроверить напоминания
+
+    Пока deadline_date старых заказов не заполнен, планировщик их не видит -
+    после заполнения он просыпается и досылает положенные напоминания.
+    """
+    try:
+        rows = await run_db(run_backfills, lane='reports', pause=0.01, stop=stop)
+    except Exception:
+        logger.exception('Background backfill failed')
+        return
+    if rows:
+        logger.info(f'Background backfill done: {rows} rows')
+    if not stop.is_set():
+        reminder_scheduler.wake()
+
+
+async def start_webhook(application: Application, listen: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT,
+                        url: str = WEBHOOK_URL, secret_token: str = WEBHOOK_SECRET):
+    """Принимать обновления по webhook вместо long polling
+
+    Веб-сервер PTB проверяет секретный заголовок, кладет обновление в
+    application.update_queue и сразу отвечает 200; непригодные обновления
+    получают 400. Обновления, накопившиеся у Telegram, пока бот был
+    остановлен, не сбрасываются - они придут после запуска.
+    """
+    await application.updater.start_webhook(
+        listen=listen,
+        port=port,
+        url_path=WEBHOOK_PATH.lstrip('/'),
+        cert=WEBHOOK_CERT or None,
+        key=WEBHOOK_KEY or None,
+        webhook_url=url.rstrip('/') + WEBHOOK_PATH,
+        allowed_updates=ALLOWED_UPDATES,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        secret_token=secret_token or secrets.token_urlsafe(32)
+    )
+    logger.info(f'Webhook set to {url.rstrip("/")}{WEBHOOK_PATH}, listening on {listen}:{port}')
+
+
 async def main_async():
-    init_db()
+    # схема обновляется сразу, заполнение новых колонок - пачками в фоне ниже
+    init_db(backfill=False)
+    # годность file_id фото заказ-нарядов (недействительные не отправляются повторно)
+    get_media_registry().load()
+
+    # Общие клиенты OpenRouter и MessageProcessor на все время работы бота
+    processor_registry = init_processor_registry()
+
+    # незавершенные /neworder, /register, /report_period и user_data переживают перезапуск
+    persistence = SQLitePersistence()
 
     # Create application once
     application = (
         Application.builder()
         .token(BOT_TOKEN)
+        .persistence(persistence)
         .connect_timeout(30)
         .pool_timeout(30)
         .read_timeout(30)
         .write_timeout(30)
+        # разные чаты обрабатываются параллельно, сообщения одного чата - по очереди
+        # (UPDATE_CONCURRENCY в utils/update_processor.py)
+        .concurrent_updates(get_update_processor())
         .build()
     )
 
@@ -170,7 +292,14 @@ async def main_async():
     application.add_handler(CommandHandler('report_technicians', report_technicians))
     application.add_handler(CommandHandler('report_work_types', report_work_types))
     application.add_handler(report_period_handler)
+    application.add_handler(report_page_handler)
+    application.add_handler(CommandHandler('export', export_command))
     application.add_handler(CommandHandler('admin_secret', admin_secret))
+    application.add_handler(CommandHandler('terminology_cache', terminology_cache_stats))
+    application.add_handler(CommandHandler('terminology_cache_clear', terminology_cache_clear))
+    application.add_handler(CommandHandler('outbox', outbox_stats))
+    application.add_handler(CommandHandler('report_cache', report_cache_stats))
+    application.add_handler(CommandHandler('updates', update_stats))
     application.add_handler(register_handler)
     for handler in get_admin_handler():
         application.add_handler(handler)
@@ -178,7 +307,7 @@ async def main_async():
     application.add_handler(change_role_handler)
 
     logger.info('Bot started...')
-    logger.info('Reminder background task enabled')
+    logger.info('Reminder scheduler enabled')
 
     # Try to connect to Telegram with retry logic
     retry_count = 0
@@ -216,31 +345,65 @@ async def main_async():
                 logger.error('Max retries reached. Giving up.')
                 raise
 
-    # Start polling (no retry for polling)
-    try:
-        await application.updater.start_polling(
-            timeout=180,
-            drop_pending_updates=True,
-            allowed_updates=['message', 'callback_query']
-        )
-        logger.info('Polling started successfully!')
-    except Exception as e:
-        logger.error(f'Failed to start polling: {e}')
-        raise
+    if BOT_MODE == 'webhook':
+        # обновления принимает веб-сервер PTB, исходящий long polling не нужен
+        await start_webhook(application)
+        logger.info(f'Webhook mode, {get_update_processor().max_concurrent} concurrent updates')
+    else:
+        # Start polling (no retry for polling)
+        try:
+            await application.updater.start_polling(
+                timeout=180,
+                drop_pending_updates=True,
+                allowed_updates=ALLOWED_UPDATES
+            )
+            logger.info('Polling started successfully!')
+        except Exception as e:
+            logger.error(f'Failed to start polling: {e}')
+            raise
 
     # Start background task
-    background_task = asyncio.create_task(run_background_task(BOT_TOKEN))
+    reminder_scheduler = get_reminder_scheduler()
+    reminder_scheduler.notification_service = NotificationService(BOT_TOKEN)
+    reminder_task = asyncio.create_task(reminder_scheduler.run())
+    outbox_worker = get_outbox_worker()
+    outbox_worker.notification_service = NotificationService(BOT_TOKEN)
+    outbox_task = asyncio.create_task(outbox_worker.run())
+    asyncio.create_task(processor_registry.warm_up())
+    backfill_stop = threading.Event()
+    backfill_task = asyncio.create_task(run_startup_backfills(backfill_stop, reminder_scheduler))
+    asyncio.create_task(notify_resumed_conversations(persistence, NotificationService(BOT_TOKEN)))
+
+    # Keep bot running: до Ctrl+C или SIGTERM (supervisor), затем штатная остановка
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: остается KeyboardInterrupt
 
-    # Keep bot running
     try:
-        while True:
-            await asyncio.sleep(1)
-    except KeyboardInterrupt:
-        logger.info('Bot stopped by user')
-        background_task.cancel()
-        await application.stop()
-        await application.shutdown()
-        return
+        await stop_event.wait()
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+    logger.info('Bot stopped by user')
+    # незаконченное заполнение прерывается между пачками и продолжится при запуске
+    backfill_stop.set()
+    # новые обновления больше не принимаются; принятые дорабатывает application.stop()
+    await application.updater.stop()
+    reminder_scheduler.stop()
+    reminder_task.cancel()
+    # текущая пачка уведомлений досылается, остальное останется в outbox до запуска
+    outbox_worker.stop()
+    await asyncio.wait([outbox_task], timeout=30)
+    await application.stop()
+    await application.shutdown()
+    await close_processor_registry()
+    await asyncio.wait([backfill_task], timeout=30)
+    shutdown_db_executor()
+    close_pool()
 
 
 def main():
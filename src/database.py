@@ -1,60 +1,274 @@
 import sqlite3
 import os
+import queue
+import asyncio
+import functools
+import threading
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 
-DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'orders.db')
-
-
-def init_db():
-    """Создание таблиц базы данных"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            telegram_id INTEGER UNIQUE,
-            name TEXT NOT NULL,
-            role TEXT NOT NULL,
-            is_admin INTEGER DEFAULT 0,
-            reference_id INTEGER,
-            is_active INTEGER DEFAULT 1,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS orders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            doctor_id INTEGER,
-            technician_id INTEGER,
-            patient_name TEXT,
-            work_type TEXT NOT NULL,
-            quantity INTEGER NOT NULL,
-            deadline TEXT NOT NULL,
-            description TEXT,
-            photo_id TEXT,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            status TEXT DEFAULT 'in_progress',
-            FOREIGN KEY (doctor_id) REFERENCES users(id),
-            FOREIGN KEY (technician_id) REFERENCES users(id)
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reminders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            order_id INTEGER NOT NULL,
-            reminder_type TEXT NOT NULL,
-            sent_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (order_id) REFERENCES orders(id)
-        )
-    ''')
-
-    conn.commit()
-    conn.close()
+DB_PATH = os.getenv('DB_PATH', os.path.join(os.path.dirname(__file__), '..', 'data', 'orders.db'))
+
+# Размер пула и время ожидания свободного соединения (секунды)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '6'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+
+# Потоки для тяжелых запросов (отчеты), чтобы они не занимали потоки
+# коротких запросов обработчиков
+DB_REPORT_WORKERS = int(os.getenv('DB_REPORT_WORKERS', '2'))
+
+# PRAGMA применяются один раз при создании соединения
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-16000',      # ~16 МБ кэша страниц
+    'PRAGMA mmap_size=134217728',    # 128 МБ memory-mapped I/O
+    'PRAGMA busy_timeout=5000',
+)
+
+
+def _open_connection(db_path: str) -> sqlite3.Connection:
+    """Открыть соединение и применить PRAGMA"""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """Пул долгоживущих соединений SQLite
+
+    Соединения создаются лениво (не больше max_size), переиспользуются
+    между вызовами и потоками (каждое соединение в один момент времени
+    используется только одним потоком). Если все соединения заняты,
+    вызывающий ждет освобождения до timeout секунд.
+    """
+
+    def __init__(self, db_path: str, max_size: int = DB_POOL_SIZE, timeout: float = DB_POOL_TIMEOUT):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+        self._hits = 0
+        self._misses = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+
+    def acquire(self) -> sqlite3.Connection:
+        """Взять соединение из пула"""
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self._hits += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.max_size
+            if can_create:
+                self._created += 1
+
+        if can_create:
+            try:
+                conn = _open_connection(self.db_path)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+            with self._lock:
+                self._misses += 1
+            return conn
+
+        started = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self._timeouts += 1
+            raise sqlite3.OperationalError(
+                f'Connection pool exhausted: no free connection after {self.timeout}s'
+            )
+
+        with self._lock:
+            self._waits += 1
+            self._wait_time += time.perf_counter() - started
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        """Вернуть соединение в пул"""
+        if conn.in_transaction:
+            conn.rollback()
+
+        if self._closed:
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Контекстный менеджер: commit при успехе, rollback при ошибке"""
+        conn = self.acquire()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Закрыть все свободные соединения"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def get_stats(self) -> dict:
+        """Счетчики пула: попадания, промахи, ожидания"""
+        with self._lock:
+            return {
+                'size': self._created,
+                'idle': self._idle.qsize(),
+                'max_size': self.max_size,
+                'hits': self._hits,
+                'misses': self._misses,
+                'waits': self._waits,
+                'wait_time': round(self._wait_time, 6),
+                'timeouts': self._timeouts
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Получить общий пул соединений (создается при первом обращении)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH)
+    return _pool
+
+
+def db_connection():
+    """Соединение из пула в виде контекстного менеджера
+
+    Пример:
+        with db_connection() as conn:
+            conn.execute(...)
+    """
+    return get_pool().connection()
+
+
+def get_pool_stats() -> dict:
+    """Статистика пула соединений"""
+    return get_pool().get_stats()
+
+
+def close_pool():
+    """Закрыть пул соединений (при остановке бота)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def get_db_executor(lane: str = 'default') -> ThreadPoolExecutor:
+    """Пул потоков для работы с БД
+
+    lane='default' - короткие запросы обработчиков,
+    lane='reports' - тяжелые запросы (отчеты), выполняются отдельно,
+    чтобы не задерживать остальные чаты.
+    Всего потоков не больше размера пула соединений.
+    """
+    executor = _executors.get(lane)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(lane)
+            if executor is None:
+                if lane == 'reports':
+                    workers = DB_REPORT_WORKERS
+                else:
+                    workers = max(1, DB_POOL_SIZE - DB_REPORT_WORKERS)
+                executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'db-{lane}')
+                _executors[lane] = executor
+    return executor
+
+
+async def run_db(func, *args, lane: str = 'default', **kwargs):
+    """Выполнить синхронную функцию работы с БД в потоке БД, не блокируя event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(lane), functools.partial(func, *args, **kwargs))
+
+
+def shutdown_db_executor():
+    """Остановить потоки БД (при остановке бота)"""
+    with _executor_lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=True)
+        _executors.clear()
+
+
+def configure(db_path: str):
+    """Переключить БД (используется в тестах и скриптах обслуживания)"""
+    global DB_PATH
+    close_pool()
+    DB_PATH = db_path
+
+
+def iso_date(date_str):
+    """Дата ДД.ММ.ГГГГ (или ДД.ММ.ГГ) -> ГГГГ-ММ-ДД, None если это не дата"""
+    if not date_str:
+        return None
+    for date_format in ('%d.%m.%Y', '%d.%m.%y'):
+        try:
+            return datetime.strptime(date_str.strip(), date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+
+def init_db(backfill: bool = True):
+    """Создание и обновление таблиц базы данных
+
+    Схема описана версионными миграциями (migrations.py), применяются
+    только еще не примененные. backfill=False откладывает заполнение
+    данных новых колонок до migrations.run_backfills().
+    """
+    from migrations import run_migrations
+    run_migrations(backfill=backfill)
 
 
 def get_connection():
-    """Получение соединения с БД"""
-    return sqlite3.connect(DB_PATH)
+    """Получение отдельного (не из пула) соединения с БД
+
+    Оставлено для служебных скриптов, которые сами закрывают соединение.
+    В коде бота используйте db_connection().
+    """
+    return _open_connection(DB_PATH)
@@ -3,7 +3,13 @@ from telegram.ext import ContextTypes, ConversationHandler, CallbackQueryHandler
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from services.user_manager import UserManager
+from services.user_manager import UserManager, AsyncUserManager
+from services.processor_registry import get_terminology_cache
+from services.outbox import AsyncOutboxService, get_outbox_worker
+from services.media_registry import get_media_registry
+from services.report_cache import get_report_cache
+from utils.update_processor import get_update_processor
+from database import run_db
 
 
 SELECTING_USER_TYPE, ENTERING_NAME, ENTERING_TELEGRAM_ID = range(3)
@@ -12,7 +18,7 @@ SELECTING_USER_FOR_DELETE = range(1)
 
 async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Админ-меню для администратора"""
-    user = UserManager.get_user_by_telegram_id(update.effective_user.id)
+    user = await AsyncUserManager.get_user_by_telegram_id(update.effective_user.id)
 
     if not user or not UserManager.is_user_admin(user):
         await update.message.reply_text('❌ У вас нет прав для этой команды.')
@@ -33,7 +39,7 @@ async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def admin_users_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать список всех пользователей"""
     query = update.callback_query
-    user = UserManager.get_user_by_telegram_id(update.effective_user.id)
+    user = await AsyncUserManager.get_user_by_telegram_id(update.effective_user.id)
 
     if not user or not UserManager.is_user_admin(user):
         await query.edit_message_text('❌ У вас нет прав для этой команды.')
@@ -41,7 +47,7 @@ async def admin_users_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     await query.answer()
 
-    users = UserManager.get_all_users()
+    users = await AsyncUserManager.get_all_users()
 
     if not users:
         await query.edit_message_text('📭 Пользователей пока нет.')
@@ -67,7 +73,7 @@ async def admin_users_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def admin_add_user_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало добавления пользователя"""
-    user = UserManager.get_user_by_telegram_id(update.effective_user.id)
+    user = await AsyncUserManager.get_user_by_telegram_id(update.effective_user.id)
 
     if not user or not UserManager.is_user_admin(user):
         if update.callback_query:
@@ -116,7 +122,7 @@ async def admin_add_user_name(update: Update, context: ContextTypes.DEFAULT_TYPE
     name = update.message.text
     role = context.user_data.get('add_role')
 
-    success = UserManager.register_user(
+    success = await AsyncUserManager.register_user(
         telegram_id=None,
         name=name,
         role=role,
@@ -143,7 +149,7 @@ async def admin_add_user_telegram_id(update: Update, context: ContextTypes.DEFAU
 
     role = context.user_data.get('add_role')
 
-    success = UserManager.register_user(
+    success = await AsyncUserManager.register_user(
         telegram_id=telegram_id,
         name=context.user_data.get('add_name'),
         role=role,
@@ -160,7 +166,7 @@ async def admin_add_user_telegram_id(update: Update, context: ContextTypes.DEFAU
 
 async def delete_user_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало удаления пользователя"""
-    user = UserManager.get_user_by_telegram_id(update.effective_user.id)
+    user = await AsyncUserManager.get_user_by_telegram_id(update.effective_user.id)
 
     if not user or not UserManager.is_user_admin(user):
         if update.callback_query:
@@ -169,7 +175,7 @@ async def delete_user_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text('❌ У вас нет прав для этой команды.')
         return ConversationHandler.END
 
-    users = UserManager.get_all_users()
+    users = await AsyncUserManager.get_all_users()
 
     if not users:
         if update.callback_query:
@@ -209,7 +215,7 @@ async def delete_user_selected(update: Update, context: ContextTypes.DEFAULT_TYP
 
     user_id = int(data.split('_')[2])
 
-    user_data = UserManager.get_user_by_id(user_id)
+    user_data = await AsyncUserManager.get_user_by_id(user_id)
 
     if not user_data:
         await query.edit_message_text('❌ Пользователь не найден.')
@@ -252,7 +258,7 @@ async def delete_user_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     user_id = int(data.split('_')[2])
 
-    success = UserManager.delete_user(user_id)
+    success = await AsyncUserManager.delete_user(user_id)
 
     if success:
         await query.edit_message_text(f'✅ Пользователь ID {user_id} успешно удален!')
@@ -277,6 +283,74 @@ async def admin_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await query.edit_message_text('🔙 Вернулись в главное меню.')
 
 
+async def terminology_cache_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Статистика кэша терминологии и самые частые фразы"""
+    user = await AsyncUserManager.get_user_by_telegram_id(update.effective_user.id)
+
+    if not user or not UserManager.is_user_admin(user):
+        await update.message.reply_text('❌ У вас нет прав для этой команды.')
+        return
+
+    cache = get_terminology_cache()
+    stats = cache.get_stats()
+
+    message = "🗂 Кэш терминологии:\n\n"
+    message += f"Записей: {stats['size']} из {stats['max_size']}\n"
+    message += f"Попаданий: {stats['hits']}, промахов: {stats['misses']} ({stats['hit_rate']:.0%})\n"
+    message += f"Вытеснено: {stats['evictions']}, устарело: {stats['expired']}\n"
+    message += f"Запросов к ИИ: {stats['llm_calls']}, в среднем {stats['avg_llm_latency']:.2f} сек\n"
+    message += f"Сэкономлено времени: {stats['latency_saved']:.1f} сек\n"
+
+    top_entries = cache.get_top_entries(10)
+    if top_entries:
+        message += "\n📈 Частые фразы:\n"
+        for i, entry in enumerate(top_entries, 1):
+            message += f"{i}. {entry['raw']} → {entry['normalized']} ({entry['hits']})\n"
+
+    message += "\nОчистка: /terminology_cache_clear [фраза]"
+
+    await update.message.reply_text(message)
+
+
+async def terminology_cache_clear(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Удалить фразу из кэша терминологии или очистить его полностью"""
+    user = await AsyncUserManager.get_user_by_telegram_id(update.effective_user.id)
+
+    if not user or not UserManager.is_user_admin(user):
+        await update.message.reply_text('❌ У вас нет прав для этой команды.')
+        return
+
+    phrase = ' '.join(context.args) if context.args else None
+    removed = await run_db(get_terminology_cache().invalidate, phrase)
+
+    if phrase is None:
+        await update.message.reply_text(f'✅ Кэш терминологии очищен (удалено записей: {removed}).')
+    elif removed:
+        await update.message.reply_text(f'✅ Фраза "{phrase}" удалена из кэша.')
+    else:
+        await update.message.reply_text(f'❌ Фраза "{phrase}" не найдена в кэше.')
+
+
+async def report_cache_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Статистика кэша отчетов"""
+    user = await AsyncUserManager.get_user_by_telegram_id(update.effective_user.id)
+
+    if not user or not UserManager.is_user_admin(user):
+        await update.message.reply_text('❌ У вас нет прав для этой команды.')
+        return
+
+    stats = get_report_cache().get_stats()
+
+    message = "📊 Кэш отчетов:\n\n"
+    message += f"Отчетов в кэше: {stats['size']} из {stats['max_size']} (срок жизни {stats['ttl']:.0f} сек)\n"
+    message += f"Попаданий: {stats['hits']}, промахов: {stats['misses']} ({stats['hit_rate']:.0%})\n"
+    message += f"Сброшено после изменений: {stats['invalidated']}, устарело: {stats['expired']}\n"
+    message += f"Построение отчета: в среднем {stats['avg_build_time'] * 1000:.0f} мс\n"
+    message += f"Сэкономлено времени: {stats['time_saved']:.2f} сек\n"
+
+    await update.message.reply_text(message)
+
+
 def get_admin_handler():
     """Получить обработчики админ-панели"""
     return [
@@ -285,3 +359,61 @@ def get_admin_handler():
         CallbackQueryHandler(delete_user_selected, pattern='^delete_user_|^delete_cancel'),
         CallbackQueryHandler(delete_user_confirm, pattern='^delete_confirm_|^delete_cancel')
     ]
+
+
+async def outbox_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Состояние очереди уведомлений: глубина, задержка доставки, ошибки"""
+    user = await AsyncUserManager.get_user_by_telegram_id(update.effective_user.id)
+
+    if not user or not UserManager.is_user_admin(user):
+        await update.message.reply_text('❌ У вас нет прав для этой команды.')
+        return
+
+    stats = await AsyncOutboxService.get_stats()
+    worker = get_outbox_worker().get_stats()
+
+    message = "📮 Очередь уведомлений:\n\n"
+    message += f"В очереди: {stats['pending']} (готовы к отправке: {stats['due']})\n"
+    message += f"Самое старое ждет: {stats['oldest_pending_age']:.0f} сек\n"
+    message += f"Доставлено: {stats['sent']}, не доставлено: {stats['failed']}\n"
+    message += f"Задержка доставки за сутки: в среднем {stats['avg_latency']:.1f} сек, максимум {stats['max_latency']:.1f} сек\n"
+    message += f"\nС запуска: доставлено {worker['delivered']}, повторов {worker['retried']}, "
+    message += f"отказов {worker['failed']}, пауз по RetryAfter {worker['retry_after_pauses']}\n"
+
+    media = get_media_registry().get_stats()
+    message += f"\n🖼 Фото: отправок по file_id {media['photo_sends']}, только текстом из-за недействительного file_id "
+    message += f"{media['photos_skipped']}, недействительных file_id {media['invalid']}\n"
+
+    if worker['paused_for']:
+        message += f"⏸ Отправка приостановлена Telegram еще на {worker['paused_for']:.0f} сек\n"
+
+    await update.message.reply_text(message)
+
+
+async def update_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработка обновлений: очередь, параллельность, ожидание по чатам"""
+    user = await AsyncUserManager.get_user_by_telegram_id(update.effective_user.id)
+
+    if not user or not UserManager.is_user_admin(user):
+        await update.message.reply_text('❌ У вас нет прав для этой команды.')
+        return
+
+    stats = get_update_processor().get_stats()
+
+    message = "⚙️ Обработка обновлений:\n\n"
+    message += f"Получены и ждут обработки: {context.application.update_queue.qsize()}\n"
+    message += f"Обрабатываются: {stats['running']} из {stats['max_concurrent']} (максимум с запуска {stats['max_running']})\n"
+    message += f"Ждут предыдущего сообщения своего чата: {stats['waiting_for_chat']}, ждут свободного места: {stats['waiting_for_slot']}\n"
+    message += f"Чатов в обработке: {stats['busy_chats']}, наибольшая очередь одного чата: {stats['max_chat_backlog']}\n"
+    message += f"\nС запуска: обработано {stats['processed']}, с ошибкой {stats['failed']}\n"
+    message += f"Ожидание до начала обработки: в среднем {stats['avg_wait'] * 1000:.0f} мс, максимум {stats['max_wait'] * 1000:.0f} мс\n"
+
+    persistence = context.application.persistence
+    if persistence:
+        saved = persistence.get_stats()
+        message += f"\n💾 Диалоги: восстановлено после запуска {saved['recovered']}, "
+        message += f"изменений {saved['changes']} записано за {saved['batches']} транзакций, ждут записи {saved['pending']}\n"
+        if saved['write_errors']:
+            message += f"Ошибок записи: {saved['write_errors']}\n"
+
+    await update.message.reply_text(message)
@@ -3,14 +3,12 @@ from telegram.ext import ContextTypes, CallbackQueryHandler, MessageHandler, fil
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from services.user_manager import UserManager
-from database import get_connection
-import sqlite3
+from services.user_manager import AsyncUserManager
 
 
 async def change_role_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало смены роли"""
-    user = UserManager.get_user_by_telegram_id(update.effective_user.id)
+    user = await AsyncUserManager.get_user_by_telegram_id(update.effective_user.id)
 
     if not user:
         if update.callback_query:
@@ -79,12 +77,7 @@ async def role_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
     }[role]
 
     # Обновляем роль в users
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute('UPDATE users SET role = ? WHERE id = ?', (role, user_id))
-    conn.commit()
-    conn.close()
+    await AsyncUserManager.update_user(user_id, role=role)
 
     # Возвращаем обновленного пользователя
     capabilities = []
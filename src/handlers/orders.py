@@ -5,10 +5,14 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, MessageHandler, filters, CommandHandler, CallbackQueryHandler
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from services.user_manager import UserManager
-from services.message_processor import MessageProcessor
+from services.user_manager import UserManager, AsyncUserManager
+from services.processor_registry import get_message_processor
 from services.notification_service import NotificationService
-from database import get_connection
+from services.media_registry import get_media_registry
+from services.order_service import AsyncOrderService
+from services.outbox import get_outbox_worker
+from utils.reminder_background import get_reminder_scheduler
+from database import run_db
 import sqlite3
 
 
@@ -89,7 +93,7 @@ class OrderHandler:
             telegram_id = int(parts[1])
             role = parts[2]
 
-            selected_user = UserManager.get_user_by_telegram_id(telegram_id)
+            selected_user = await AsyncUserManager.get_user_by_telegram_id(telegram_id)
 
             if selected_user:
                 print(f"[DEBUG] User selected: {selected_user}")
@@ -161,9 +165,11 @@ class OrderHandler:
 
         technician_id = None
         doctor_id = None
+        technician = None
+        doctor = None
 
         if processed_data.get('technician_name'):
-            technician = UserManager.find_user_by_name(processed_data['technician_name'], 'technician')
+            technician = await AsyncUserManager.find_user_by_name(processed_data['technician_name'], 'technician')
             if technician:
                 technician_id = technician['id']
             else:
@@ -171,35 +177,14 @@ class OrderHandler:
                 return ConversationHandler.END
 
         if processed_data.get('doctor_name'):
-            doctor = UserManager.find_user_by_name(processed_data['doctor_name'], 'doctor')
+            doctor = await AsyncUserManager.find_user_by_name(processed_data['doctor_name'], 'doctor')
             if doctor:
                 doctor_id = doctor['id']
             else:
                 print(f"[DEBUG] Doctor NOT FOUND in database")
 
-        conn = get_connection()
-        cursor = conn.cursor()
-
         try:
-            cursor.execute('''
-                INSERT INTO orders (doctor_id, technician_id, patient_name, work_type, quantity, deadline, description, photo_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                doctor_id,
-                technician_id,
-                processed_data.get('patient_name'),
-                processed_data.get('work_type'),
-                processed_data.get('quantity') if processed_data.get('quantity') is not None else 0,
-                processed_data.get('deadline'),
-                processed_data.get('description'),
-                photo_id
-            ))
-
-            order_id = cursor.lastrowid
-            conn.commit()
-
             order_data = {
-                'id': order_id,
                 'doctor_id': doctor_id,
                 'technician_id': technician_id,
                 'doctor_name': processed_data.get('doctor_name'),
@@ -214,17 +199,34 @@ class OrderHandler:
 
             notification_service = NotificationService(os.getenv('BOT_TOKEN'))
 
-            await notification_service.send_to_technician(order_data, photo_id)
-            await notification_service.send_to_doctor(order_data, photo_id)
-            await notification_service.send_to_dispatcher(update.effective_user.id, order_data)
-            await notification_service.send_to_all_admins(order_data, photo_id)
+            # Получатели уже найдены выше - уведомления идут по записям, без поиска по имени.
+            # Уведомления ставятся в outbox в одной транзакции с заказом, отправку с
+            # повторами выполняет OutboxWorker
+            notifications = await notification_service.new_order_notifications(
+                order_data, update.effective_user.id, photo_id, technician=technician, doctor=doctor
+            )
+
+            order_id = await AsyncOrderService.create_order(
+                doctor_id=doctor_id,
+                technician_id=technician_id,
+                patient_name=processed_data.get('patient_name'),
+                work_type=processed_data.get('work_type'),
+                quantity=processed_data.get('quantity'),
+                deadline=processed_data.get('deadline'),
+                description=processed_data.get('description'),
+                photo_id=photo_id,
+                notifications=notifications
+            )
+            get_outbox_worker().wake()
+            # срок нового заказа может оказаться ближе запланированной проверки напоминаний
+            get_reminder_scheduler().wake()
 
-            formatted_message = MessageProcessor().format_message(processed_data)
+            formatted_message = get_message_processor().format_message(processed_data)
 
             await update.message.reply_text(
                 f"🎉 Заказ №{order_id} создан!\n\n"
                 f"{formatted_message}\n\n"
-                "✅ Уведомления отправлены."
+                "📤 Уведомления отправляются."
             )
 
             return ConversationHandler.END
@@ -233,13 +235,10 @@ class OrderHandler:
             await update.message.reply_text(f"❌ Ошибка создания заказа: {e}")
             return ConversationHandler.END
 
-        finally:
-            conn.close()
-
 
 async def new_order_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало создания нового заказа"""
-    user = UserManager.get_user_by_telegram_id(update.effective_user.id)
+    user = await AsyncUserManager.get_user_by_telegram_id(update.effective_user.id)
 
     if not user:
         await update.message.reply_text('❌ Сначала зарегистрируйтесь через команду /register')
@@ -261,6 +260,7 @@ async def photo_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка фото заказ-наряда"""
     photo = update.message.photo[-1]
     context.user_data['photo_id'] = photo.file_id
+    await run_db(get_media_registry().register, photo.file_id, photo.file_unique_id, photo.file_size)
 
     await update.message.reply_text(
         '✅ Фото получено!\n\n'
@@ -277,9 +277,9 @@ async def text_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text
     photo_id = context.user_data.get('photo_id')
 
-    processor = MessageProcessor()
+    processor = get_message_processor()
 
-    processed_data = processor.normalize_message(text)
+    processed_data = await processor.normalize_message_async(text)
     print(f"[DEBUG] Processed data: {processed_data}")
 
     if not processed_data:
@@ -298,10 +298,12 @@ async def text_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     technician_id = None
     doctor_id = None
+    technician = None
+    doctor = None
 
     # Поиск техника с учетом логики дубликатов фамилий
     if processed_data.get('technician_name'):
-        technician = UserManager.find_user_by_name(processed_data['technician_name'], 'technician')
+        technician = await AsyncUserManager.find_user_by_name(processed_data['technician_name'], 'technician')
         if technician:
             technician_id = technician['id']
         else:
@@ -310,36 +312,15 @@ async def text_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Поиск врача с учетом логики дубликатов фамилий
     if processed_data.get('doctor_name'):
-        doctor = UserManager.find_user_by_name(processed_data['doctor_name'], 'doctor')
+        doctor = await AsyncUserManager.find_user_by_name(processed_data['doctor_name'], 'doctor')
         if doctor:
             doctor_id = doctor['id']
         else:
             await update.message.reply_text(f"⚠️ Врач \"{processed_data['doctor_name']}\" не найден в системе.")
             return ConversationHandler.END
 
-    conn = get_connection()
-    cursor = conn.cursor()
-
     try:
-        cursor.execute('''
-            INSERT INTO orders (doctor_id, technician_id, patient_name, work_type, quantity, deadline, description, photo_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            doctor_id,
-            technician_id,
-            processed_data.get('patient_name'),
-            processed_data.get('work_type'),
-            processed_data.get('quantity') if processed_data.get('quantity') is not None else 0,
-            processed_data.get('deadline'),
-            text,
-            photo_id
-        ))
-
-        order_id = cursor.lastrowid
-        conn.commit()
-
         order_data = {
-            'id': order_id,
             'doctor_id': doctor_id,
             'technician_id': technician_id,
             'doctor_name': processed_data.get('doctor_name'),
@@ -354,17 +335,34 @@ async def text_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         notification_service = NotificationService(os.getenv('BOT_TOKEN'))
 
-        await notification_service.send_to_technician(order_data, photo_id)
-        await notification_service.send_to_doctor(order_data, photo_id)
-        await notification_service.send_to_dispatcher(update.effective_user.id, order_data)
-        await notification_service.send_to_all_admins(order_data, photo_id)
+        # Получатели уже найдены выше - уведомления идут по записям, без поиска по имени.
+        # Уведомления ставятся в outbox в одной транзакции с заказом, отправку с
+        # повторами выполняет OutboxWorker
+        notifications = await notification_service.new_order_notifications(
+            order_data, update.effective_user.id, photo_id, technician=technician, doctor=doctor
+        )
+
+        order_id = await AsyncOrderService.create_order(
+            doctor_id=doctor_id,
+            technician_id=technician_id,
+            patient_name=processed_data.get('patient_name'),
+            work_type=processed_data.get('work_type'),
+            quantity=processed_data.get('quantity'),
+            deadline=processed_data.get('deadline'),
+            description=text,
+            photo_id=photo_id,
+            notifications=notifications
+        )
+        get_outbox_worker().wake()
+        # срок нового заказа может оказаться ближе запланированной проверки напоминаний
+        get_reminder_scheduler().wake()
 
-        formatted_message = MessageProcessor().format_message(processed_data)
+        formatted_message = get_message_processor().format_message(processed_data)
 
         await update.message.reply_text(
             f"🎉 Заказ №{order_id} создан!\n\n"
             f"{formatted_message}\n\n"
-            "✅ Уведомления отправлены."
+            "📤 Уведомления отправляются."
         )
 
         return ConversationHandler.END
@@ -373,9 +371,6 @@ async def text_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ Ошибка создания заказа: {e}")
         return ConversationHandler.END
 
-    finally:
-        conn.close()
-
 
 async def cancel_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отмена создания заказа"""
@@ -398,5 +393,7 @@ new_order_handler = ConversationHandler(
             MessageHandler(filters.TEXT & ~filters.COMMAND, order_handler.process_clarification)
         ]
     },
-    fallbacks=[CommandHandler('cancel', cancel_order)]
+    fallbacks=[CommandHandler('cancel', cancel_order)],
+    name='new_order',
+    persistent=True
 )
\ No newline at end of file
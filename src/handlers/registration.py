@@ -3,7 +3,7 @@ from telegram.ext import ContextTypes, ConversationHandler, CallbackQueryHandler
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from services.user_manager import UserManager
+from services.user_manager import AsyncUserManager
 
 
 SELECTING_ROLE, ENTERING_NAME = range(2)
@@ -11,7 +11,7 @@ SELECTING_ROLE, ENTERING_NAME = range(2)
 
 async def register_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало процесса регистрации"""
-    user = UserManager.get_user_by_telegram_id(update.effective_user.id)
+    user = await AsyncUserManager.get_user_by_telegram_id(update.effective_user.id)
 
     if user:
         await update.message.reply_text(
@@ -55,7 +55,7 @@ async def name_entered(update: Update, context: ContextTypes.DEFAULT_TYPE):
     name = update.message.text
     role = context.user_data.get('role')
 
-    success = UserManager.register_user(
+    success = await AsyncUserManager.register_user(
         telegram_id=update.effective_user.id,
         name=name,
         role=role
@@ -88,5 +88,7 @@ register_handler = ConversationHandler(
         SELECTING_ROLE: [CallbackQueryHandler(role_selected)],
         ENTERING_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, name_entered)]
     },
-    fallbacks=[MessageHandler(filters.COMMAND, cancel_registration)]
+    fallbacks=[MessageHandler(filters.COMMAND, cancel_registration)],
+    name='registration',
+    persistent=True
 )
@@ -1,21 +1,75 @@
-from telegram import Update
-from telegram.ext import ContextTypes, MessageHandler, filters, CommandHandler, ConversationHandler
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes, MessageHandler, filters, CommandHandler, ConversationHandler, CallbackQueryHandler
 from datetime import datetime
+from zoneinfo import ZoneInfo
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from services.user_manager import UserManager
-from services.report_service import ReportService
+from services.user_manager import UserManager, AsyncUserManager
+from services.report_service import AsyncReportService
+from services.report_cache import get_report_snapshots
+from services.export_service import AsyncExportService, EXPORT_FORMATS, EXPORT_MAX_BYTES
 
 ENTERING_START_DATE, ENTERING_END_DATE = range(2)
 
 
+def page_keyboard(token, page, total):
+    """Кнопки листания: ◀️ номер/всего ▶️"""
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️", callback_data=f"report_page:{token}:{page - 1}"))
+    buttons.append(InlineKeyboardButton(f"{page + 1}/{total}", callback_data="report_page_noop"))
+    if page < total - 1:
+        buttons.append(InlineKeyboardButton("▶️", callback_data=f"report_page:{token}:{page + 1}"))
+    return InlineKeyboardMarkup([buttons])
+
+
+async def send_report(message, kind, start_date=None, end_date=None):
+    """Отправить отчет одним сообщением; если страниц несколько - с кнопками листания
+
+    Страницы строятся целиком одним вызовом в потоке отчетов (через кэш
+    отчетов): соединение из пула не держится, пока идет отправка в Telegram.
+    """
+    pages = await AsyncReportService.get_report(kind, start_date, end_date)
+    reply_markup = None
+
+    if len(pages) > 1:
+        # снимок не зависит от сообщения - клавиатура уходит вместе с первой страницей
+        token = get_report_snapshots().save(message.chat_id, pages)
+        reply_markup = page_keyboard(token, 0, len(pages))
+
+    await message.reply_text(pages[0], reply_markup=reply_markup)
+
+
+async def report_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Листание отчета кнопками ◀️/▶️ (страницы из снимка отправленного отчета)"""
+    query = update.callback_query
+
+    if query.data == 'report_page_noop':
+        await query.answer()
+        return
+
+    _, token, page = query.data.split(':')
+    pages = get_report_snapshots().get(token, query.message.chat_id)
+
+    if pages is None:
+        await query.answer('Отчет устарел, запросите его заново.', show_alert=True)
+        return
+
+    await query.answer()
+    page = max(0, min(int(page), len(pages) - 1))
+    await query.edit_message_text(pages[page], reply_markup=page_keyboard(token, page, len(pages)))
+
+
+report_page_handler = CallbackQueryHandler(report_page, pattern='^report_page')
+
+
 async def report_period_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало формирования отчета за период"""
     print(f"[DEBUG] report_period_start called for user {update.effective_user.id}")
     
-    user = UserManager.get_user_by_telegram_id(update.effective_user.id)
+    user = await AsyncUserManager.get_user_by_telegram_id(update.effective_user.id)
     print(f"[DEBUG] User found: {user}")
     
     if not user:
@@ -85,22 +139,7 @@ async def report_period_end_date(update: Update, context: ContextTypes.DEFAULT_T
     period = f"{start_date} - {end_date}"
     print(f"[DEBUG] Period: {period}")
 
-    report_service = ReportService()
-
-    period_stats = report_service.get_period_statistics(start_date, end_date)
-    doctor_stats = report_service.get_doctor_statistics(start_date, end_date)
-    technician_stats = report_service.get_technician_statistics(start_date, end_date)
-    work_type_stats = report_service.get_work_type_statistics(start_date, end_date)
-
-    messages = [
-        report_service.format_period_report(period_stats, period),
-        report_service.format_doctor_report(doctor_stats, period),
-        report_service.format_technician_report(technician_stats, period),
-        report_service.format_work_type_report(work_type_stats, period)
-    ]
-
-    for message in messages:
-        await update.message.reply_text(message)
+    await send_report(update.message, 'period', start_date, end_date)
 
     print("[DEBUG] Report sent, ending conversation")
     return ConversationHandler.END
@@ -121,14 +160,14 @@ report_period_handler = ConversationHandler(
     },
     fallbacks=[CommandHandler('cancel', report_period_cancel)],
     name='report_period_conversation',
-    persistent=False,
+    persistent=True,
     block=False
 )
 
 
 async def report_doctors(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отчет по врачам за все время"""
-    user = UserManager.get_user_by_telegram_id(update.effective_user.id)
+    user = await AsyncUserManager.get_user_by_telegram_id(update.effective_user.id)
     
     if not user:
         await update.message.reply_text('❌ Сначала зарегистрируйтесь через команду /register')
@@ -138,16 +177,12 @@ async def report_doctors(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text('❌ Только администратор может просматривать отчеты.')
         return
     
-    report_service = ReportService()
-    stats = report_service.get_doctor_statistics()
-    message = report_service.format_doctor_report(stats)
-    
-    await update.message.reply_text(message)
+    await send_report(update.message, 'doctors')
 
 
 async def report_technicians(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отчет по техникам за все время"""
-    user = UserManager.get_user_by_telegram_id(update.effective_user.id)
+    user = await AsyncUserManager.get_user_by_telegram_id(update.effective_user.id)
     
     if not user:
         await update.message.reply_text('❌ Сначала зарегистрируйтесь через команду /register')
@@ -157,16 +192,12 @@ async def report_technicians(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text('❌ Только администратор может просматривать отчеты.')
         return
     
-    report_service = ReportService()
-    stats = report_service.get_technician_statistics()
-    message = report_service.format_technician_report(stats)
-    
-    await update.message.reply_text(message)
+    await send_report(update.message, 'technicians')
 
 
 async def report_work_types(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отчет по видам работ за все время"""
-    user = UserManager.get_user_by_telegram_id(update.effective_user.id)
+    user = await AsyncUserManager.get_user_by_telegram_id(update.effective_user.id)
     
     if not user:
         await update.message.reply_text('❌ Сначала зарегистрируйтесь через команду /register')
@@ -176,8 +207,84 @@ async def report_work_types(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text('❌ Только администратор может просматривать отчеты.')
         return
     
-    report_service = ReportService()
-    stats = report_service.get_work_type_statistics()
-    message = report_service.format_work_type_report(stats)
-    
-    await update.message.reply_text(message)
+    await send_report(update.message, 'work_types')
+
+
+EXPORT_USAGE = (
+    '📤 Выгрузка в файл:\n'
+    '/export orders [ДД.ММ.ГГГГ ДД.ММ.ГГГГ] [xlsx|csv] - заказы\n'
+    '/export report [ДД.ММ.ГГГГ ДД.ММ.ГГГГ] [xlsx|csv] - отчет за период\n\n'
+    'Без дат - текущий месяц, без формата - xlsx.'
+)
+
+
+def parse_export_args(args):
+    """Аргументы /export -> (что, начало, конец, формат) или None при ошибке"""
+    if not args or args[0] not in ('orders', 'report'):
+        return None
+
+    kind = args[0]
+    rest = list(args[1:])
+    file_format = 'xlsx'
+    if rest and rest[-1].lower() in EXPORT_FORMATS:
+        file_format = rest.pop().lower()
+
+    if not rest:
+        today = datetime.now(ZoneInfo('Europe/Moscow'))
+        return kind, today.replace(day=1).strftime('%d.%m.%Y'), today.strftime('%d.%m.%Y'), file_format
+
+    if len(rest) != 2:
+        return None
+    try:
+        start = datetime.strptime(rest[0], '%d.%m.%Y')
+        end = datetime.strptime(rest[1], '%d.%m.%Y')
+    except ValueError:
+        return None
+    if start > end:
+        return None
+
+    return kind, rest[0], rest[1], file_format
+
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Выгрузка заказов или отчета за период в XLSX/CSV документом"""
+    user = await AsyncUserManager.get_user_by_telegram_id(update.effective_user.id)
+
+    if not user:
+        await update.message.reply_text('❌ Сначала зарегистрируйтесь через команду /register')
+        return
+
+    if not UserManager.is_user_admin(user):
+        await update.message.reply_text('❌ Только администратор может выгружать отчеты.')
+        return
+
+    parsed = parse_export_args(context.args)
+    if parsed is None:
+        await update.message.reply_text(EXPORT_USAGE)
+        return
+
+    kind, start_date, end_date, file_format = parsed
+    await update.message.reply_text(f'⏳ Формирую файл за {start_date} - {end_date}...')
+
+    # файл строится в потоке отчетов, бот в это время отвечает остальным
+    if kind == 'orders':
+        result = await AsyncExportService.export_orders(start_date, end_date, file_format)
+    else:
+        result = await AsyncExportService.export_report(start_date, end_date, file_format)
+
+    try:
+        if result['size'] > EXPORT_MAX_BYTES:
+            await update.message.reply_text(
+                f"❌ Файл получился {result['size'] / 1024 / 1024:.0f} МБ, Telegram принимает до 50 МБ. "
+                'Выберите период короче.'
+            )
+            return
+
+        with open(result['path'], 'rb') as document:
+            await update.message.reply_document(
+                document=document,
+                filename=result['filename'],
+                caption=f"📤 {start_date} - {end_date}: строк {result['rows']}"
+            )
+    finally:
+        os.remove(result['path'])
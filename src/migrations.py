@@ -0,0 +1,552 @@
+"""Версионные миграции схемы БД
+
+Каждая миграция - номер версии, название, шаги схемы (SQL или функция
+от соединения) и, при необходимости, заполнение данных (backfill).
+Примененные версии записываются в таблицу schema_version, поэтому при
+запуске выполняются только новые миграции. Шаги пишутся идемпотентно
+(IF NOT EXISTS, проверка колонок): старые БД без schema_version спокойно
+проходят все миграции с первой.
+
+Заполнение идет небольшими пачками, каждая в своей транзакции, чтобы
+бот продолжал читать и писать БД во время обновления. Режим dry_run
+ничего не меняет: печатает шаги, число строк для заполнения и планы
+запросов (EXPLAIN QUERY PLAN) до и после миграции.
+
+Запуск вручную (например, на VPS перед перезапуском бота):
+    python src/migrations.py --db data/orders.db --dry-run
+    python src/migrations.py --db data/orders.db [--batch-size 1000] [--pause 0.05]
+    python src/migrations.py --db data/orders.db --rebuild-rollups
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import database
+from database import db_connection, iso_date
+
+
+# Размер пачки заполнения и пауза между пачками (секунды)
+MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', '1000'))
+MIGRATION_BATCH_PAUSE = float(os.getenv('MIGRATION_BATCH_PAUSE', '0'))
+
+
+class Migration:
+    """Одна миграция схемы
+
+    steps - SQL-строки или функции step(conn), выполняются одной транзакцией.
+    backfill(conn, last_id, batch_size) - заполнение одной пачки: возвращает
+    (обработано строк, последний id) или (0, last_id), когда данных больше нет.
+    pending_rows(conn) - сколько строк осталось заполнить (для dry_run).
+    probes - запросы (название, SQL, параметры), планы которых показывает dry_run.
+    """
+
+    def __init__(self, version: int, name: str, steps: tuple, backfill=None, pending_rows=None, probes: tuple = ()):
+        self.version = version
+        self.name = name
+        self.steps = steps
+        self.backfill = backfill
+        self.pending_rows = pending_rows
+        self.probes = probes
+
+    def apply_steps(self, conn: sqlite3.Connection):
+        for step in self.steps:
+            if callable(step):
+                step(conn)
+            else:
+                conn.execute(step)
+
+
+def column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    return column in [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def add_column(table: str, column: str, definition: str):
+    """Шаг миграции: ALTER TABLE ADD COLUMN, если колонки еще нет"""
+    def step(conn):
+        if not column_exists(conn, table, column):
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    step.__doc__ = f'ALTER TABLE {table} ADD COLUMN {column} {definition}'
+    return step
+
+
+def backfill_deadline_date(conn: sqlite3.Connection, last_id: int, batch_size: int):
+    """deadline (ДД.ММ.ГГГГ) -> deadline_date (ГГГГ-ММ-ДД) для пачки заказов"""
+    rows = conn.execute('''
+        SELECT id, deadline FROM orders
+        WHERE id > ? AND deadline_date IS NULL
+        ORDER BY id LIMIT ?
+    ''', (last_id, batch_size)).fetchall()
+
+    if not rows:
+        return 0, last_id
+
+    updates = [(iso_date(deadline), order_id) for order_id, deadline in rows]
+    conn.executemany('UPDATE orders SET deadline_date = ? WHERE id = ?', [u for u in updates if u[0]])
+    return len(rows), rows[-1][0]
+
+
+def pending_deadline_dates(conn: sqlite3.Connection) -> int:
+    if not column_exists(conn, 'orders', 'deadline_date'):
+        return conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+    return conn.execute('SELECT COUNT(*) FROM orders WHERE deadline_date IS NULL').fetchone()[0]
+
+
+REPORT_PROBES = (
+    ('period report', '''
+        SELECT COUNT(*), SUM(quantity) FROM orders
+        WHERE status = 'in_progress' AND created_at >= ? AND created_at < ?
+    ''', ('2026-03-01', '2026-04-01')),
+    ('orders of technician', 'SELECT COUNT(*) FROM orders WHERE technician_id = ?', (1,)),
+    ('active users of role', "SELECT id FROM users WHERE role = ? AND is_active = 1", ('technician',)),
+)
+
+REMINDER_PROBE = ('reminders due tomorrow', '''
+    SELECT o.id FROM orders o
+    WHERE o.status = 'in_progress' AND o.deadline_date = ?
+    AND NOT EXISTS (SELECT 1 FROM reminders r WHERE r.order_id = o.id AND r.reminder_type = 'today')
+''', ('2026-03-15',))
+
+
+# Дневные итоги заказов: день x врач x техник x вид работ x статус.
+# Поддерживаются триггерами на orders при любой записи (создание заказа,
+# смена статуса или полей, удаление), поэтому отчет за любой период -
+# короткий проход по итогам, а не по всей истории заказов. Отсутствующий
+# врач или техник хранится как 0: NULL в первичном ключе не совпадает сам
+# с собой, и ON CONFLICT не срабатывал бы.
+ROLLUP_KEY = 'day, doctor_id, technician_id, work_type, status'
+
+ROLLUP_ADD = '''
+    INSERT INTO order_daily_stats (day, doctor_id, technician_id, work_type, status, order_count, total_quantity)
+    VALUES (substr(NEW.created_at, 1, 10), COALESCE(NEW.doctor_id, 0), COALESCE(NEW.technician_id, 0),
+            NEW.work_type, NEW.status, 1, COALESCE(NEW.quantity, 0))
+    ON CONFLICT (day, doctor_id, technician_id, work_type, status) DO UPDATE SET
+        order_count = order_count + 1,
+        total_quantity = total_quantity + excluded.total_quantity;
+'''
+
+ROLLUP_REMOVE = '''
+    UPDATE order_daily_stats
+    SET order_count = order_count - 1, total_quantity = total_quantity - COALESCE(OLD.quantity, 0)
+    WHERE day = substr(OLD.created_at, 1, 10) AND doctor_id = COALESCE(OLD.doctor_id, 0)
+    AND technician_id = COALESCE(OLD.technician_id, 0) AND work_type = OLD.work_type AND status = OLD.status;
+    DELETE FROM order_daily_stats
+    WHERE day = substr(OLD.created_at, 1, 10) AND doctor_id = COALESCE(OLD.doctor_id, 0)
+    AND technician_id = COALESCE(OLD.technician_id, 0) AND work_type = OLD.work_type AND status = OLD.status
+    AND order_count <= 0;
+'''
+
+
+def rebuild_rollups(conn: sqlite3.Connection) -> int:
+    """Пересчитать order_daily_stats с нуля по orders, вернуть число строк итогов"""
+    conn.execute('DELETE FROM order_daily_stats')
+    conn.execute(f'''
+        INSERT INTO order_daily_stats ({ROLLUP_KEY}, order_count, total_quantity)
+        SELECT substr(created_at, 1, 10), COALESCE(doctor_id, 0), COALESCE(technician_id, 0), work_type, status,
+               COUNT(*), COALESCE(SUM(quantity), 0)
+        FROM orders
+        GROUP BY 1, 2, 3, 4, 5
+    ''')
+    return conn.execute('SELECT COUNT(*) FROM order_daily_stats').fetchone()[0]
+
+
+ROLLUP_PROBES = (
+    ('period report from rollups', '''
+        SELECT SUM(order_count), SUM(total_quantity) FROM order_daily_stats
+        WHERE status = 'in_progress' AND day >= ? AND day <= ?
+    ''', ('2026-03-01', '2026-03-31')),
+)
+
+
+# Журнал доставки напоминаний: строка на (заказ, вид напоминания, получатель).
+# reminders остается отметкой "заказу напоминание доставлено всем"; до
+# версии 8 в нем могли быть дубли (повторы и перезапуски), они удаляются
+# перед созданием уникального индекса.
+REMINDER_LEDGER_PROBES = (
+    ('reminders due (anti-join)', '''
+        SELECT o.id FROM orders o
+        LEFT JOIN reminders r ON r.order_id = o.id AND r.reminder_type = 'today'
+        WHERE o.status = 'in_progress' AND o.deadline_date = ? AND r.order_id IS NULL
+    ''', ('2026-03-15',)),
+)
+
+
+MIGRATIONS = (
+    Migration(1, 'base tables: users, orders, reminders', (
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER UNIQUE,
+            name TEXT NOT NULL,
+            role TEXT NOT NULL,
+            is_admin INTEGER DEFAULT 0,
+            reference_id INTEGER,
+            is_active INTEGER DEFAULT 1,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            doctor_id INTEGER,
+            technician_id INTEGER,
+            patient_name TEXT,
+            work_type TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            deadline TEXT NOT NULL,
+            description TEXT,
+            photo_id TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            status TEXT DEFAULT 'in_progress',
+            FOREIGN KEY (doctor_id) REFERENCES users(id),
+            FOREIGN KEY (technician_id) REFERENCES users(id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            reminder_type TEXT NOT NULL,
+            sent_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (order_id) REFERENCES orders(id)
+        )
+        ''',
+    )),
+
+    Migration(2, 'terminology_cache', (
+        '''
+        CREATE TABLE IF NOT EXISTS terminology_cache (
+            key TEXT PRIMARY KEY,
+            raw TEXT NOT NULL,
+            normalized TEXT NOT NULL,
+            hits INTEGER DEFAULT 0,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL
+        )
+        ''',
+    )),
+
+    Migration(3, 'outbox', (
+        '''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER,
+            chat_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            text TEXT NOT NULL,
+            photo_id TEXT,
+            reply_chat_id INTEGER,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            created_at REAL NOT NULL,
+            sent_at REAL,
+            last_error TEXT,
+            UNIQUE (order_id, chat_id, kind)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)',
+    )),
+
+    Migration(4, 'media', (
+        '''
+        CREATE TABLE IF NOT EXISTS media (
+            file_id TEXT PRIMARY KEY,
+            file_unique_id TEXT,
+            file_size INTEGER,
+            valid INTEGER DEFAULT 1,
+            last_error TEXT,
+            created_at REAL NOT NULL
+        )
+        ''',
+    )),
+
+    Migration(5, 'orders.deadline_date (ISO) with backfill', (
+        add_column('orders', 'deadline_date', 'TEXT'),
+    ), backfill=backfill_deadline_date, pending_rows=pending_deadline_dates),
+
+    Migration(6, 'secondary indexes for reminders, reports and users', (
+        'CREATE INDEX IF NOT EXISTS idx_orders_status_deadline ON orders (status, deadline_date)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders (status, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_technician ON orders (technician_id)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_doctor ON orders (doctor_id)',
+        'CREATE INDEX IF NOT EXISTS idx_reminders_order_type ON reminders (order_id, reminder_type)',
+        'CREATE INDEX IF NOT EXISTS idx_users_role_active ON users (role, is_active)',
+    ), probes=(REMINDER_PROBE,) + REPORT_PROBES),
+
+    Migration(7, 'order_daily_stats rollups for reports', (
+        f'''
+        CREATE TABLE IF NOT EXISTS order_daily_stats (
+            day TEXT NOT NULL,
+            doctor_id INTEGER NOT NULL,
+            technician_id INTEGER NOT NULL,
+            work_type TEXT NOT NULL,
+            status TEXT NOT NULL,
+            order_count INTEGER NOT NULL,
+            total_quantity INTEGER NOT NULL,
+            PRIMARY KEY ({ROLLUP_KEY})
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_order_daily_stats_status_day ON order_daily_stats (status, day)',
+        f'CREATE TRIGGER IF NOT EXISTS orders_rollup_insert AFTER INSERT ON orders BEGIN {ROLLUP_ADD} END',
+        f'''CREATE TRIGGER IF NOT EXISTS orders_rollup_update
+        AFTER UPDATE OF created_at, doctor_id, technician_id, work_type, quantity, status ON orders
+        BEGIN {ROLLUP_REMOVE} {ROLLUP_ADD} END''',
+        f'CREATE TRIGGER IF NOT EXISTS orders_rollup_delete AFTER DELETE ON orders BEGIN {ROLLUP_REMOVE} END',
+        # один GROUP BY по orders в той же транзакции, что и триггеры: заказы,
+        # записанные во время обновления, не посчитаются дважды
+        rebuild_rollups,
+    ), probes=ROLLUP_PROBES),
+
+    Migration(8, 'reminder delivery ledger, unique reminders', (
+        'DELETE FROM reminders WHERE id NOT IN (SELECT MIN(id) FROM reminders GROUP BY order_id, reminder_type)',
+        'DROP INDEX IF EXISTS idx_reminders_order_type',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_reminders_order_type ON reminders (order_id, reminder_type)',
+        '''
+        CREATE TABLE IF NOT EXISTS reminder_deliveries (
+            order_id INTEGER NOT NULL,
+            reminder_type TEXT NOT NULL,
+            recipient INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            claimed_until REAL NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            sent_at REAL,
+            PRIMARY KEY (order_id, reminder_type, recipient)
+        ) WITHOUT ROWID
+        ''',
+    ), probes=REMINDER_LEDGER_PROBES),
+
+    Migration(9, 'conversation states and user_data across restarts', (
+        '''
+        CREATE TABLE IF NOT EXISTS conversation_states (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            state TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (name, key)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS conversation_user_data (
+            user_id INTEGER PRIMARY KEY,
+            data BLOB NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        ''',
+    )),
+
+    # очистка пустых итогов в триггерах версии 7 просматривала всю
+    # order_daily_stats; теперь удаляется только строка ключа OLD.*
+    Migration(10, 'order_daily_stats triggers: keyed cleanup', (
+        'DROP TRIGGER IF EXISTS orders_rollup_update',
+        'DROP TRIGGER IF EXISTS orders_rollup_delete',
+        f'''CREATE TRIGGER orders_rollup_update
+        AFTER UPDATE OF created_at, doctor_id, technician_id, work_type, quantity, status ON orders
+        BEGIN {ROLLUP_REMOVE} {ROLLUP_ADD} END''',
+        f'CREATE TRIGGER orders_rollup_delete AFTER DELETE ON orders BEGIN {ROLLUP_REMOVE} END',
+    )),
+)
+
+
+def ensure_version_table(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            backfilled INTEGER DEFAULT 1,
+            duration REAL
+        )
+    ''')
+
+
+def get_applied_versions(conn: sqlite3.Connection) -> dict:
+    """{версия: заполнение завершено} для примененных миграций"""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'").fetchone()
+    if not exists:
+        return {}
+    return {version: bool(backfilled) for version, backfilled in conn.execute('SELECT version, backfilled FROM schema_version')}
+
+
+def get_schema_version() -> int:
+    """Текущая версия схемы (0 - миграции не применялись)"""
+    with db_connection() as conn:
+        applied = get_applied_versions(conn)
+    return max(applied, default=0)
+
+
+def run_backfill(migration: Migration, batch_size: int = MIGRATION_BATCH_SIZE, pause: float = MIGRATION_BATCH_PAUSE,
+                 stop=None) -> int:
+    """Заполнить данные миграции пачками, каждая пачка - отдельная транзакция
+
+    stop - threading.Event: если он установлен (остановка бота), заполнение
+    прерывается между пачками и продолжится при следующем запуске.
+    """
+    last_id = 0
+    total = 0
+    started = time.perf_counter()
+
+    while True:
+        if stop is not None and stop.is_set():
+            print(f"[Migrations] v{migration.version}: backfill interrupted after {total} rows")
+            return total
+        with db_connection() as conn:
+            processed, last_id = migration.backfill(conn, last_id, batch_size)
+        if not processed:
+            break
+        total += processed
+        if pause:
+            time.sleep(pause)
+
+    with db_connection() as conn:
+        conn.execute('UPDATE schema_version SET backfilled = 1 WHERE version = ?', (migration.version,))
+
+    if total:
+        print(f"[Migrations] v{migration.version}: backfilled {total} rows in {time.perf_counter() - started:.1f}s")
+    return total
+
+
+def run_backfills(batch_size: int = MIGRATION_BATCH_SIZE, pause: float = MIGRATION_BATCH_PAUSE, stop=None) -> int:
+    """Завершить незаконченные заполнения (после init_db(backfill=False))"""
+    with db_connection() as conn:
+        applied = get_applied_versions(conn)
+
+    total = 0
+    for migration in MIGRATIONS:
+        if migration.backfill and applied.get(migration.version) is False:
+            total += run_backfill(migration, batch_size, pause, stop)
+    return total
+
+
+def run_migrations(backfill: bool = True, batch_size: int = MIGRATION_BATCH_SIZE, pause: float = MIGRATION_BATCH_PAUSE) -> list:
+    """Применить новые миграции, вернуть список примененных версий
+
+    Шаги схемы каждой миграции выполняются одной транзакцией вместе с
+    записью в schema_version. При backfill=False заполнение данных
+    откладывается до run_backfills() (бот вызывает его в фоне).
+    """
+    with db_connection() as conn:
+        ensure_version_table(conn)
+        applied = get_applied_versions(conn)
+
+    newly_applied = []
+    for migration in MIGRATIONS:
+        if migration.version in applied:
+            continue
+
+        started = time.perf_counter()
+        with db_connection() as conn:
+            # DDL в sqlite3 без явной транзакции выполняется в autocommit
+            conn.execute('BEGIN IMMEDIATE')
+            if conn.execute('SELECT 1 FROM schema_version WHERE version = ?', (migration.version,)).fetchone():
+                continue  # применена параллельно запущенным процессом
+            migration.apply_steps(conn)
+            conn.execute(
+                'INSERT INTO schema_version (version, name, backfilled, duration) VALUES (?, ?, ?, ?)',
+                (migration.version, migration.name, 0 if migration.backfill else 1, time.perf_counter() - started)
+            )
+        newly_applied.append(migration.version)
+        print(f"[Migrations] Applied v{migration.version}: {migration.name}")
+
+    if backfill:
+        run_backfills(batch_size, pause)
+
+    return newly_applied
+
+
+def query_plan(conn: sqlite3.Connection, sql: str, params: tuple) -> list:
+    try:
+        return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+    except sqlite3.Error as e:
+        return [f'n/a ({e})']
+
+
+def describe_step(step) -> str:
+    if callable(step):
+        return step.__doc__ or step.__name__
+    return ' '.join(step.split())
+
+
+def dry_run() -> list:
+    """Показать, что сделают новые миграции, ничего не меняя
+
+    Шаги схемы выполняются в транзакции, которая затем откатывается:
+    так видно, как изменятся планы запросов (probes) после миграции.
+    Возвращает отчет [{'version', 'name', 'steps', 'pending_rows', 'plans'}].
+    """
+    report = []
+
+    with db_connection() as conn:
+        applied = get_applied_versions(conn)
+        pending = [m for m in MIGRATIONS if m.version not in applied]
+
+        conn.execute('BEGIN')
+        try:
+            for migration in pending:
+                before = {label: query_plan(conn, sql, params) for label, sql, params in migration.probes}
+                migration.apply_steps(conn)
+                after = {label: query_plan(conn, sql, params) for label, sql, params in migration.probes}
+
+                report.append({
+                    'version': migration.version,
+                    'name': migration.name,
+                    'steps': [describe_step(step) for step in migration.steps],
+                    'pending_rows': migration.pending_rows(conn) if migration.pending_rows else 0,
+                    'plans': {label: (before[label], after[label]) for label in before}
+                })
+        finally:
+            conn.rollback()
+
+    return report
+
+
+def print_dry_run(report: list, batch_size: int = MIGRATION_BATCH_SIZE):
+    if not report:
+        print("Schema is up to date, nothing to apply")
+        return
+
+    for item in report:
+        print(f"== v{item['version']}: {item['name']}")
+        for step in item['steps']:
+            print(f"   {step[:110]}")
+        if item['pending_rows']:
+            print(f"   backfill: {item['pending_rows']} rows in batches of {batch_size}")
+        for label, (before, after) in item['plans'].items():
+            print(f"   plan [{label}]")
+            print(f"      before: {' | '.join(before)}")
+            print(f"      after:  {' | '.join(after)}")
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply schema migrations')
+    parser.add_argument('--db', default=database.DB_PATH, help='path to the SQLite database')
+    parser.add_argument('--dry-run', action='store_true', help='show pending migrations and query plans only')
+    parser.add_argument('--batch-size', type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=MIGRATION_BATCH_PAUSE, help='sleep between backfill batches')
+    parser.add_argument('--rebuild-rollups', action='store_true', help='recompute order_daily_stats from orders')
+    args = parser.parse_args()
+
+    database.configure(args.db)
+    print(f"Database: {os.path.abspath(args.db)}, schema version {get_schema_version()}")
+
+    if args.dry_run:
+        print_dry_run(dry_run(), args.batch_size)
+    else:
+        applied = run_migrations(batch_size=args.batch_size, pause=args.pause)
+        print(f"Applied {len(applied)} migrations, schema version {get_schema_version()}")
+
+    if args.rebuild_rollups and not args.dry_run:
+        with db_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            print(f"Rebuilt order_daily_stats: {rebuild_rollups(conn)} rows")
+
+    database.close_pool()
+
+
+if __name__ == '__main__':
+    main()
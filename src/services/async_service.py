@@ -0,0 +1,36 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import run_db
+
+
+class AsyncService:
+    """Асинхронная обертка над синхронным сервисом работы с БД
+
+    Каждый метод сервиса становится awaitable и выполняется в потоке БД
+    (database.run_db), поэтому запросы и commit не блокируют event loop.
+    Методы из passthrough не обращаются к БД и вызываются напрямую.
+    lane выбирает пул потоков (см. database.get_db_executor).
+
+    Пример:
+        AsyncUserManager = AsyncService(UserManager, passthrough=('is_user_admin',))
+        user = await AsyncUserManager.get_user_by_telegram_id(telegram_id)
+    """
+
+    def __init__(self, service, passthrough: tuple = (), lane: str = 'default'):
+        self._service = service
+        self._passthrough = set(passthrough)
+        self._lane = lane
+
+    def __getattr__(self, name):
+        attr = getattr(self._service, name)
+
+        if not callable(attr) or name in self._passthrough:
+            return attr
+
+        async def method(*args, **kwargs):
+            return await run_db(attr, *args, lane=self._lane, **kwargs)
+
+        method.__name__ = name
+        method.__doc__ = attr.__doc__
+        return method
@@ -0,0 +1,204 @@
+import os
+import sys
+import json
+import time
+import pickle
+import asyncio
+from telegram.ext import BasePersistence, PersistenceInput
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import db_connection, run_db
+
+
+# Как часто Application передает изменения (секунды); все изменения за
+# интервал записываются одной транзакцией, а не на каждое сообщение
+PERSISTENCE_INTERVAL = float(os.getenv('PERSISTENCE_INTERVAL', '10'))
+
+# Незавершенные диалоги и user_data старше этого срока при запуске удаляются
+PERSISTENCE_MAX_AGE = float(os.getenv('PERSISTENCE_MAX_AGE_HOURS', '24')) * 3600
+
+
+class SQLitePersistence(BasePersistence):
+    """Состояния ConversationHandler и context.user_data в data/orders.db
+
+    Без нее перезапуск бота (autorestart supervisor, restart-скрипты)
+    обрывал незавершенные /neworder, /register и /report_period: фото уже
+    загружено, а текст бот больше не ждет.
+
+    Application раз в update_interval передает только изменившиеся записи
+    (update_user_data, update_conversation - по одному вызову на запись).
+    Здесь они собираются в буфер и записываются одной транзакцией в
+    фоновой задаче; при остановке (Application.shutdown) flush() дописывает
+    остаток. При запуске load() удаляет записи старше max_age и читает
+    остальное; восстановленные диалоги доступны в recovered, чтобы бот
+    мог напомнить пользователям, где они остановились.
+
+    user_data хранится через pickle (как в PicklePersistence PTB): в нем
+    лежат словари заказа и пользователей из БД, не все из них - JSON.
+    """
+
+    def __init__(self, update_interval: float = PERSISTENCE_INTERVAL, max_age: float = PERSISTENCE_MAX_AGE):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.max_age = max_age
+        self._user_data = None
+        self._conversations = None
+        self._pending_users = {}
+        self._pending_conversations = {}
+        self._write_task = None
+        self.recovered = []
+        self.pruned = 0
+        self.changes = 0
+        self.batches = 0
+        self.rows_written = 0
+        self.write_errors = 0
+
+    def load(self) -> int:
+        """Удалить устаревшие записи и прочитать остальные, вернуть число диалогов"""
+        expire_before = time.time() - self.max_age
+
+        with db_connection() as conn:
+            pruned = conn.execute('DELETE FROM conversation_states WHERE updated_at < ?', (expire_before,)).rowcount
+            pruned += conn.execute('DELETE FROM conversation_user_data WHERE updated_at < ?', (expire_before,)).rowcount
+            conversations = conn.execute('SELECT name, key, state FROM conversation_states').fetchall()
+            users = conn.execute('SELECT user_id, data FROM conversation_user_data').fetchall()
+
+        self._conversations = {}
+        self.recovered = []
+        for name, key, state in conversations:
+            key = tuple(json.loads(key))
+            state = json.loads(state)
+            self._conversations.setdefault(name, {})[key] = state
+            self.recovered.append((name, key, state))
+
+        self._user_data = {}
+        for user_id, data in users:
+            try:
+                self._user_data[user_id] = pickle.loads(data)
+            except Exception as e:
+                print(f"[Persistence] Skipping unreadable user_data of {user_id}: {e}")
+
+        self.pruned = pruned
+        print(f"[Persistence] Restored {len(self.recovered)} conversations, {len(self._user_data)} user_data "
+              f"(removed {pruned} older than {self.max_age / 3600:.0f}h)")
+        return len(self.recovered)
+
+    async def _ensure_loaded(self):
+        if self._conversations is None:
+            await run_db(self.load)
+
+    def write_batch(self, users: dict, conversations: dict):
+        """Записать пачку изменений одной транзакцией (None - удалить запись)"""
+        now = time.time()
+        with db_connection() as conn:
+            conn.executemany('''
+                INSERT INTO conversation_user_data (user_id, data, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+            ''', [(user_id, data, now) for user_id, data in users.items() if data is not None])
+            conn.executemany('DELETE FROM conversation_user_data WHERE user_id = ?',
+                             [(user_id,) for user_id, data in users.items() if data is None])
+            conn.executemany('''
+                INSERT INTO conversation_states (name, key, state, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(name, key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+            ''', [(name, key, state, now) for (name, key), state in conversations.items() if state is not None])
+            conn.executemany('DELETE FROM conversation_states WHERE name = ? AND key = ?',
+                             [(name, key) for (name, key), state in conversations.items() if state is None])
+
+    def _schedule_write(self):
+        self.changes += 1
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_pending())
+
+    async def _write_pending(self):
+        # Application вызывает update_* всех записей одним gather - даем им попасть в буфер
+        await asyncio.sleep(0)
+        while self._pending_users or self._pending_conversations:
+            users, self._pending_users = self._pending_users, {}
+            conversations, self._pending_conversations = self._pending_conversations, {}
+            try:
+                await run_db(self.write_batch, users, conversations)
+            except Exception as e:
+                # вернуть в буфер (если их не заменили более новые) - запишутся со следующей пачкой
+                self.write_errors += 1
+                for user_id, data in users.items():
+                    self._pending_users.setdefault(user_id, data)
+                for key, state in conversations.items():
+                    self._pending_conversations.setdefault(key, state)
+                print(f"[Persistence] Failed to write {len(users) + len(conversations)} changes: {e}")
+                return
+            self.batches += 1
+            self.rows_written += len(users) + len(conversations)
+
+    async def get_user_data(self) -> dict:
+        await self._ensure_loaded()
+        return {user_id: dict(data) for user_id, data in self._user_data.items()}
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        await self._ensure_loaded()
+        return dict(self._conversations.get(name, {}))
+
+    async def update_conversation(self, name: str, key: tuple, new_state):
+        self._pending_conversations[(name, json.dumps(list(key)))] = None if new_state is None else json.dumps(new_state)
+        self._schedule_write()
+
+    async def update_user_data(self, user_id: int, data: dict):
+        try:
+            self._pending_users[user_id] = pickle.dumps(data)
+        except Exception as e:
+            print(f"[Persistence] user_data of {user_id} can not be saved: {e}")
+            return
+        self._schedule_write()
+
+    async def drop_user_data(self, user_id: int):
+        self._pending_users[user_id] = None
+        self._schedule_write()
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        pass
+
+    async def update_bot_data(self, data: dict):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id: int):
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict):
+        pass
+
+    async def flush(self):
+        """Дописать буфер при остановке бота"""
+        if self._write_task is not None:
+            await self._write_task
+        if self._pending_users or self._pending_conversations:
+            await self._write_pending()
+        print(f"[Persistence] Flushed: {self.changes} changes in {self.batches} transactions")
+
+    def get_stats(self) -> dict:
+        return {
+            'recovered': len(self.recovered),
+            'pruned': self.pruned,
+            'changes': self.changes,
+            'batches': self.batches,
+            'rows_written': self.rows_written,
+            'pending': len(self._pending_users) + len(self._pending_conversations),
+            'write_errors': self.write_errors
+        }
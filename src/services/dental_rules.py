@@ -0,0 +1,241 @@
+import re
+from functools import lru_cache
+
+
+# Окончания, допустимые после основы слова ("коронк" + "а", "мост" + "ов",
+# "керамическ" + "ая"). Слово с другим окончанием основе не соответствует.
+ENDINGS = {
+    '', 'а', 'я', 'ы', 'и', 'у', 'ю', 'е', 'о', 'ь',
+    'ом', 'ем', 'ой', 'ей', 'ам', 'ям', 'ами', 'ями', 'ах', 'ях', 'ов', 'ев',
+    'ия', 'ии', 'ию', 'ием',
+    'ая', 'яя', 'ий', 'ый', 'ое', 'ее', 'ые', 'ие', 'ых', 'их',
+    'ого', 'его', 'ому', 'ему', 'ую', 'юю', 'ыми', 'ими'
+}
+
+# Виды работ: основа -> (название, род/число)
+PRODUCTS = {
+    'коронк': ('коронка', 'f'),
+    'винир': ('виниры', 'pl'),
+    'мост': ('мост', 'm'),
+    'протез': ('протез', 'm'),
+    'шин': ('шина', 'f'),
+    'вкладк': ('вкладка', 'f'),
+    'брекет': ('брекеты', 'pl'),
+    'абатмент': ('абатмент', 'm'),
+    'оттиск': ('оттиск', 'm'),
+    'кламмер': ('кламмеры', 'pl'),
+    'элайнер': ('элайнеры', 'pl'),
+}
+
+# Материалы: основа -> материал
+MATERIAL_STEMS = {
+    'циркон': 'zirconia',
+    'циркониев': 'zirconia',
+    'цирконев': 'zirconia',
+    'цельноциркониев': 'zirconia',
+    'цельноцирконев': 'zirconia',
+    'диоксид': 'zirconia',
+    'оксид': 'zirconia',
+    'металлокерамик': 'metal_ceramic',
+    'металлокерамическ': 'metal_ceramic',
+    'керамик': 'ceramic',
+    'керамическ': 'ceramic',
+    'безметаллов': 'metal_free',
+    'пластмасс': 'plastic',
+    'пластмассов': 'plastic',
+    'цельнометаллическ': 'solid_metal',
+    'металлическ': 'metal',
+}
+
+# Материал в согласованной форме (ж.р., м.р., мн.ч.) и в форме "из ..."
+MATERIALS = {
+    'metal_ceramic': (('металлокерамическая', 'металлокерамический', 'металлокерамические'), 'из металлокерамики'),
+    'ceramic': (('керамическая', 'керамический', 'керамические'), 'из керамики'),
+    'metal_free': (('безметалловая', 'безметалловый', 'безметалловые'), 'из безметалловой керамики'),
+    'plastic': (('пластмассовая', 'пластмассовый', 'пластмассовые'), 'из пластмассы'),
+    'solid_metal': (('цельнометаллическая', 'цельнометаллический', 'цельнометаллические'), 'из металла'),
+    'metal': (('металлическая', 'металлический', 'металлические'), 'из металла'),
+    'zirconia': (None, 'из диоксида циркония'),
+}
+
+# Определения вида работы: основа -> (формы ж.р./м.р./мн.ч., допустимые виды
+# работ, вид работы по умолчанию если он не указан)
+MODIFIERS = {
+    'полн': (('полная', 'полный', 'полные'), {'протез'}, None),
+    'частичн': (('частичная', 'частичный', 'частичные'), {'протез'}, None),
+    'съемн': (('съемная', 'съемный', 'съемные'), {'протез'}, 'протез'),
+    'бюгельн': (('бюгельная', 'бюгельный', 'бюгельные'), {'протез'}, 'протез'),
+    'нейлонов': (('нейлоновая', 'нейлоновый', 'нейлоновые'), {'протез'}, None),
+    'временн': (('временная', 'временный', 'временные'), {'шина', 'коронка', 'мост'}, None),
+    'ортодонтическ': (('ортодонтическая', 'ортодонтический', 'ортодонтические'), {'шина'}, None),
+    'иммобилизующ': (('иммобилизующая', 'иммобилизующий', 'иммобилизующие'), {'шина'}, None),
+    'индиректн': (('индиректная', 'индиректный', 'индиректные'), {'вкладка'}, None),
+    'онлеев': (('онлеевая', 'онлеевый', 'онлеевые'), {'вкладка'}, None),
+    'корнев': (('корневая', 'корневой', 'корневые'), {'вкладка'}, None),
+}
+
+# Конструкции: основа -> каноническая форма
+CONSTRUCTIONS = {
+    'винт': 'на винте',
+    'имплант': 'на имплантах',
+    'имплантат': 'на имплантах',
+}
+
+# Слова, которые распознаются только целиком (сокращения, опечатки)
+SYNONYMS = {
+    'мк': ('material', 'metal_ceramic'),
+    'м/к': ('material', 'metal_ceramic'),
+    'цм': ('material', 'solid_metal'),
+    'металокерамика': ('material', 'metal_ceramic'),
+    'металлокерамка': ('material', 'metal_ceramic'),
+    'коронок': ('product', 'коронк'),
+    'вкладок': ('product', 'вкладк'),
+    'елайнеры': ('product', 'элайнер'),
+}
+
+# Слова без смысловой нагрузки для вида работы
+STOPWORDS = {'на', 'из', 'для', 'с', 'со', 'и', 'в', 'шт', 'штук', 'штуки', 'ед', 'зуб', 'зуба', 'зубов', 'зубы'}
+
+GENDER_INDEX = {'f': 0, 'm': 1, 'pl': 2}
+
+
+def _build_stem_table() -> list:
+    """Все основы, отсортированные по убыванию длины (сначала самая длинная)"""
+    table = []
+    table.extend((stem, ('product', stem)) for stem in PRODUCTS)
+    table.extend((stem, ('material', material)) for stem, material in MATERIAL_STEMS.items())
+    table.extend((stem, ('modifier', stem)) for stem in MODIFIERS)
+    table.extend((stem, ('construction', stem)) for stem in CONSTRUCTIONS)
+    table.sort(key=lambda item: len(item[0]), reverse=True)
+    return table
+
+
+STEM_TABLE = _build_stem_table()
+
+
+@lru_cache(maxsize=4096)
+def classify_token(token: str):
+    """Определить смысл слова: ('product', основа), ('material', материал),
+    ('modifier', основа), ('construction', основа), ('stop', None) или None"""
+    if token in STOPWORDS:
+        return ('stop', None)
+
+    if token in SYNONYMS:
+        return SYNONYMS[token]
+
+    for stem, meaning in STEM_TABLE:
+        if token.startswith(stem) and token[len(stem):] in ENDINGS:
+            return meaning
+
+    return None
+
+
+class DentalRuleNormalizer:
+    """Нормализация названия работы по правилам, без запроса к ИИ
+
+    Повторяет правила конвертации из WORK_TYPE_SYSTEM_PROMPT: слова
+    распознаются по основам с допустимыми окончаниями, из найденных вида
+    работы, материала, определений и конструкции собирается каноническое
+    название. Если встретилось незнакомое слово или сочетание неоднозначно,
+    возвращается None и название отправляется в OpenRouter.
+    """
+
+    def normalize(self, work_type: str):
+        """Каноническое название работы или None, если правила не применимы"""
+        if not work_type:
+            return None
+
+        text = work_type.lower().replace('ё', 'е')
+        text = re.sub(r'\d{1,2}\.\d{1,2}\.\d{4}', ' ', text)
+        text = re.sub(r'\d+', ' ', text)
+        text = re.sub(r'[^\w/\s]', ' ', text)
+
+        products = []
+        materials = []
+        modifiers = []
+        constructions = []
+        previous = None
+
+        for token in text.split():
+            meaning = classify_token(token)
+            if meaning is None:
+                return None
+
+            kind, value = meaning
+            if kind == 'product' and value == 'абатмент' and previous == 'на':
+                constructions.append('на абатменте')
+            elif kind == 'product':
+                products.append(value)
+            elif kind == 'material':
+                materials.append(value)
+            elif kind == 'modifier':
+                modifiers.append(value)
+            elif kind == 'construction':
+                constructions.append(CONSTRUCTIONS[value])
+            previous = token
+
+        return self._compose(products, materials, modifiers, constructions)
+
+    def _compose(self, products: list, materials: list, modifiers: list, constructions: list):
+        """Собрать название по шаблону: [определения] [материал] вид [из ...] [конструкция]"""
+        # "коронка на абатменте": абатмент при другом виде работы - конструкция
+        products = list(dict.fromkeys(products))
+        if 'абатмент' in products and len(products) > 1:
+            products.remove('абатмент')
+            constructions.append('на абатменте')
+
+        if len(products) > 1:
+            return None
+
+        if products:
+            product = products[0]
+        else:
+            implied = {MODIFIERS[m][2] for m in modifiers} - {None}
+            if len(implied) == 1:
+                product = implied.pop()
+            elif materials and not modifiers:
+                product = 'коронк'
+            else:
+                return None
+
+        noun, gender = PRODUCTS[product]
+
+        for modifier in modifiers:
+            if noun not in MODIFIERS[modifier][1]:
+                return None
+
+        materials = list(dict.fromkeys(materials))
+        if noun == 'коронка' and ('ceramic' in materials or 'metal_free' in materials):
+            # керамическая коронка - всегда безметалловая керамическая коронка
+            materials = ['metal_free', 'ceramic'] + [m for m in materials if m not in ('metal_free', 'ceramic')]
+
+        adjective_materials = [m for m in materials if m != 'zirconia']
+        has_zirconia = 'zirconia' in materials
+
+        if len(adjective_materials) > 1 and adjective_materials[:2] != ['metal_free', 'ceramic']:
+            return None
+        if len(adjective_materials) > 2:
+            return None
+
+        if noun in ('коронка', 'вкладка') and has_zirconia and adjective_materials:
+            return None
+        if noun == 'виниры' and has_zirconia and not adjective_materials:
+            adjective_materials = ['ceramic']
+
+        index = GENDER_INDEX[gender]
+        parts = [MODIFIERS[m][0][index] for m in modifiers]
+
+        if noun == 'вкладка':
+            # у вкладок материал указывается через "из": "вкладка из керамики"
+            parts.append(noun)
+            parts.extend(MATERIALS[m][1] for m in adjective_materials[:1])
+        else:
+            parts.extend(MATERIALS[m][0][index] for m in adjective_materials)
+            parts.append(noun)
+
+        if has_zirconia:
+            parts.append(MATERIALS['zirconia'][1])
+
+        parts.extend(dict.fromkeys(constructions))
+
+        return ' '.join(dict.fromkeys(parts))
@@ -1,4 +1,5 @@
 import os
+import asyncio
 import httpx
 from openai import OpenAI
 
@@ -10,46 +11,7 @@ except ImportError:
     pass
 
 
-class DentalTerminologyService:
-    """Сервис для коррекции стоматологической терминологии через OpenRouter AI"""
-
-    def __init__(self):
-        # Минимальная конфигурация для совместимости
-        api_key = os.getenv('OPENROUTER_API_KEY')
-
-        if not api_key:
-            print("WARNING: OPENROUTER_API_KEY not found")
-            self.client = None
-        else:
-            try:
-                # Создаем кастомный httpx клиент без прокси
-                http_client = httpx.Client(
-                    timeout=30.0,
-                    follow_redirects=True
-                )
-
-                self.client = OpenAI(
-                    api_key=api_key,
-                    base_url="https://openrouter.ai/api/v1",
-                    http_client=http_client
-                )
-                print("[Dental] OpenAI client initialized successfully")
-            except Exception as e:
-                print(f"ERROR: Failed to initialize OpenAI client: {e}")
-                print(f"Falling back to simple parser")
-                self.client = None
-
-    def normalize_work_type(self, work_type: str) -> str:
-        """Нормализовать название работы с использованием стоматологической терминологии"""
-
-        if not work_type or work_type.strip() == "":
-            return work_type
-
-        if not self.client:
-            print("[Dental] OpenAI client not available, returning original")
-            return work_type
-
-        system_prompt = """
+WORK_TYPE_SYSTEM_PROMPT = """
         Ты эксперт по стоматологической терминологии. Твоя задача - исправить и нормализовать название стоматологической работы на грамотный термин.
 
         ПРАВИЛА КОНВЕРТАЦИИ:
@@ -217,6 +179,44 @@ class DentalTerminologyService:
         ТЕПЕРЬ ТЕБЯ!
         """
 
+
+class DentalTerminologyService:
+    """Сервис для коррекции стоматологической терминологии через OpenRouter AI"""
+
+    def __init__(self, client=None, async_client=None):
+        # Клиенты передаются из MessageProcessor (общий пул соединений)
+        self.async_client = async_client
+
+        # Минимальная конфигурация для совместимости
+        api_key = os.getenv('OPENROUTER_API_KEY')
+
+        if client is not None:
+            self.client = client
+        elif not api_key:
+            print("WARNING: OPENROUTER_API_KEY not found")
+            self.client = None
+        else:
+            try:
+                # Создаем кастомный httpx клиент без прокси
+                http_client = httpx.Client(
+                    timeout=30.0,
+                    follow_redirects=True
+                )
+
+                self.client = OpenAI(
+                    api_key=api_key,
+                    base_url="https://openrouter.ai/api/v1",
+                    http_client=http_client
+                )
+                print("[Dental] OpenAI client initialized successfully")
+            except Exception as e:
+                print(f"ERROR: Failed to initialize OpenAI client: {e}")
+                print(f"Falling back to simple parser")
+                self.client = None
+
+    @staticmethod
+    def _build_messages(work_type: str) -> list:
+        """Сообщения для запроса нормализации"""
         user_prompt = f"""Исправь название стоматологической работы: "{work_type}"
  
         Верни ТОЛЬКО исправленное название работы в правильной форме, БЕЗ лишних слов и символов.
@@ -224,28 +224,81 @@ class DentalTerminologyService:
         Если название уже правильное, верни его без изменений.
         """
 
+        return [
+            {"role": "system", "content": WORK_TYPE_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    @staticmethod
+    def _clean_response(corrected: str) -> str:
+        """Очистить ответ модели от лишних символов"""
+        corrected = corrected.strip()
+        corrected = corrected.strip('"\'')  # Убираем кавычки в начале и конце
+        corrected = corrected.replace('"', '').replace("'", '')  # Убираем все кавычки
+        corrected = corrected.replace('\\n', ' ').replace('\\r', '')  # Убираем переносы строк
+        corrected = ' '.join(corrected.split())  # Убираем лишние пробелы
+        return corrected
+
+    def normalize_work_type(self, work_type: str) -> str:
+        """Нормализовать название работы с использованием стоматологической терминологии"""
+
+        if not work_type or work_type.strip() == "":
+            return work_type
+
+        if not self.client:
+            print("[Dental] OpenAI client not available, returning original")
+            return work_type
+
         try:
             print(f"[Dental] Processing: '{work_type[:50]}...'")
             response = self.client.chat.completions.create(
                 model="meta-llama/llama-3-8b-instruct",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=self._build_messages(work_type),
                 temperature=0.3
             )
 
-            corrected = response.choices[0].message.content.strip()
+            corrected = self._clean_response(response.choices[0].message.content)
 
-            # Очищаем ответ от лишних символов
-            corrected = corrected.strip('"\'')  # Убираем кавычки в начале и конце
-            corrected = corrected.replace('"', '').replace("'", '')  # Убираем все кавычки
-            corrected = corrected.replace('\\n', ' ').replace('\\r', '')  # Убираем переносы строк
-            corrected = ' '.join(corrected.split())  # Убираем лишние пробелы
+            print(f"[Dental] '{work_type}' -> '{corrected}'")
+            return corrected
+
+        except Exception as e:
+            print(f"[Dental] Error: {e}")
+            print(f"[Dental] Falling back to original: {work_type}")
+            return work_type
+
+    async def normalize_work_type_async(self, work_type: str, timeout: float = 20.0) -> str:
+        """Асинхронно нормализовать название работы (с крайним сроком timeout секунд)"""
+
+        if not work_type or work_type.strip() == "":
+            return work_type
+
+        if not self.async_client:
+            if not self.client:
+                print("[Dental] OpenAI client not available, returning original")
+                return work_type
+            return await asyncio.to_thread(self.normalize_work_type, work_type)
+
+        try:
+            print(f"[Dental] Processing async: '{work_type[:50]}...'")
+            response = await asyncio.wait_for(
+                self.async_client.chat.completions.create(
+                    model="meta-llama/llama-3-8b-instruct",
+                    messages=self._build_messages(work_type),
+                    temperature=0.3,
+                    timeout=timeout
+                ),
+                timeout=timeout
+            )
+
+            corrected = self._clean_response(response.choices[0].message.content)
 
             print(f"[Dental] '{work_type}' -> '{corrected}'")
             return corrected
 
+        except asyncio.TimeoutError:
+            print(f"[Dental] Deadline {timeout}s exceeded, falling back to original: {work_type}")
+            return work_type
         except Exception as e:
             print(f"[Dental] Error: {e}")
             print(f"[Dental] Falling back to original: {work_type}")
@@ -0,0 +1,199 @@
+import os
+import sys
+import csv
+import time
+import tempfile
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import db_connection
+from services.async_service import AsyncService
+from services.report_service import ReportService, convert_date_format
+from utils.xlsx_writer import XlsxWriter
+
+
+# Строк за одно чтение из курсора
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', '2000'))
+
+# Ограничение Telegram на размер документа, отправляемого ботом
+EXPORT_MAX_BYTES = 50 * 1024 * 1024
+
+EXPORT_FORMATS = ('xlsx', 'csv')
+
+ORDER_COLUMNS = ['№', 'Создан', 'Врач', 'Техник', 'Пациент', 'Вид работ', 'Количество', 'Срок сдачи', 'Статус', 'Описание']
+
+REPORT_COLUMNS = ['Сотрудник', 'Вид работ', 'Заказов', 'Единиц']
+
+STATUS_NAMES = {'in_progress': 'в работе'}
+
+# Первые символы, с которых Excel/LibreOffice начинают формулу при открытии CSV
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def csv_value(value):
+    """Значение ячейки CSV: текст, похожий на формулу, экранируется апострофом
+
+    Поля заказа вводят пользователи бота; без апострофа "=HYPERLINK(...)"
+    в описании выполнился бы как формула у бухгалтера.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class CsvTableWriter:
+    """CSV с тем же интерфейсом, что XlsxWriter
+
+    Разделитель ';' и BOM в начале - файл сразу открывается в Excel с
+    русской локалью; текст, похожий на формулу, экранируется (csv_value). Листы CSV не поддерживает: add_sheet() пишет
+    название раздела отдельной строкой (для отчета разделы идут подряд).
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self._writer = csv.writer(self._file, delimiter=';')
+        self._sheets = 0
+        self.rows = 0
+
+    def add_sheet(self, title: str, header: list = None):
+        if self._sheets:
+            self._writer.writerow([])
+        self._sheets += 1
+        self._writer.writerow([title])
+        if header:
+            self._writer.writerow(header)
+
+    def write_row(self, values):
+        self._writer.writerow([csv_value(value) for value in values])
+        self.rows += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def open_writer(path: str, file_format: str):
+    if file_format == 'xlsx':
+        return XlsxWriter(path)
+    if file_format == 'csv':
+        return CsvTableWriter(path)
+    raise ValueError(f"Unknown export format: {file_format}")
+
+
+def export_path(prefix: str, file_format: str) -> str:
+    handle, path = tempfile.mkstemp(prefix=f'{prefix}_', suffix=f'.{file_format}')
+    os.close(handle)
+    return path
+
+
+def period_suffix(start_date, end_date) -> str:
+    if start_date and end_date:
+        return f"{convert_date_format(start_date)}_{convert_date_format(end_date)}"
+    return 'all'
+
+
+class ExportService:
+    """Выгрузка заказов и отчетов в CSV/XLSX для бухгалтерии
+
+    Файл пишется во временный каталог построчно прямо из курсора SQLite
+    (fetchmany по EXPORT_FETCH_SIZE строк), поэтому память не растет с
+    числом заказов. Методы синхронные и долгие - из бота вызываются через
+    AsyncExportService (поток отчетов). Возвращают словарь с путем к файлу,
+    именем для Telegram, числом строк и размером; файл удаляет вызывающий.
+    """
+
+    @staticmethod
+    def export_orders(start_date=None, end_date=None, file_format='xlsx') -> dict:
+        """Заказы (все или созданные за период) - одна строка на заказ"""
+        query = '''
+            SELECT o.id, o.created_at, d.name, t.name, o.patient_name, o.work_type, o.quantity,
+                   o.deadline, o.status, o.description
+            FROM orders o
+            LEFT JOIN users d ON o.doctor_id = d.id
+            LEFT JOIN users t ON o.technician_id = t.id
+        '''
+        params = []
+        start_date_sql = convert_date_format(start_date) if start_date else None
+        end_date_sql = convert_date_format(end_date) if end_date else None
+        if start_date_sql and end_date_sql:
+            query += ' WHERE o.created_at >= ? AND o.created_at < ?'
+            end_exclusive = datetime.strptime(end_date_sql, '%Y-%m-%d') + timedelta(days=1)
+            params = [start_date_sql, end_exclusive.strftime('%Y-%m-%d')]
+        query += ' ORDER BY o.id'
+
+        started = time.perf_counter()
+        path = export_path('orders', file_format)
+
+        try:
+            with db_connection() as conn, open_writer(path, file_format) as writer:
+                writer.add_sheet('Заказы', ORDER_COLUMNS)
+                cursor = conn.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+                    if not rows:
+                        break
+                    for row in rows:
+                        row = list(row)
+                        row[8] = STATUS_NAMES.get(row[8], row[8])
+                        writer.write_row(row)
+                rows_written = writer.rows
+        except BaseException:
+            os.remove(path)
+            raise
+
+        return ExportService._result(path, f"orders_{period_suffix(start_date, end_date)}.{file_format}",
+                                     rows_written, started)
+
+    @staticmethod
+    def export_report(start_date, end_date, file_format='xlsx') -> dict:
+        """Отчет за период: итоги, врачи, техники, виды работ (в XLSX - отдельные листы)"""
+        started = time.perf_counter()
+        report = ReportService.get_period_report(start_date, end_date)
+        period = report['period']
+        path = export_path('report', file_format)
+
+        try:
+            with open_writer(path, file_format) as writer:
+                writer.add_sheet('Итого', ['Показатель', 'Значение'])
+                writer.write_row(['Период', f"{start_date} - {end_date}"])
+                writer.write_row(['Всего заказов', period['total_orders']])
+                writer.write_row(['Всего единиц', period['total_quantity']])
+                writer.write_row(['Врачей', period['total_doctors']])
+                writer.write_row(['Техников', period['total_technicians']])
+
+                writer.add_sheet('Врачи', REPORT_COLUMNS[:3])
+                for doctor in report['doctors']:
+                    for wt in doctor['work_types']:
+                        writer.write_row([doctor['name'], wt['work_type'], wt['order_count']])
+
+                writer.add_sheet('Техники', REPORT_COLUMNS)
+                for technician in report['technicians']:
+                    for wt in technician['work_types']:
+                        writer.write_row([technician['name'], wt['work_type'], wt['order_count'], wt['total_quantity']])
+
+                writer.add_sheet('Виды работ', REPORT_COLUMNS[1:])
+                for wt in report['work_types']:
+                    writer.write_row([wt['work_type'], wt['order_count'], wt['total_quantity']])
+                rows_written = writer.rows
+        except BaseException:
+            os.remove(path)
+            raise
+
+        return ExportService._result(path, f"report_{period_suffix(start_date, end_date)}.{file_format}",
+                                     rows_written, started)
+
+    @staticmethod
+    def _result(path: str, filename: str, rows: int, started: float) -> dict:
+        size = os.path.getsize(path)
+        elapsed = time.perf_counter() - started
+        print(f"[Export] {filename}: {rows} rows, {size / 1024:.0f} KB in {elapsed:.1f}s")
+        return {'path': path, 'filename': filename, 'rows': rows, 'size': size, 'elapsed': elapsed}
+
+
+AsyncExportService = AsyncService(ExportService, lane='reports')
@@ -0,0 +1,152 @@
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import db_connection
+
+
+# Максимальная длина подписи к фото в Telegram
+CAPTION_LIMIT = 1024
+
+# По скольким последним заказам хранятся счетчики отправок фото
+MEDIA_STATS_ORDERS = int(os.getenv('MEDIA_STATS_ORDERS', '512'))
+
+# За сколько дней file_id загружаются из БД при старте
+MEDIA_LOAD_DAYS = float(os.getenv('MEDIA_LOAD_DAYS', '30'))
+
+# Ошибки BadRequest, означающие, что file_id больше не годится
+FILE_ID_ERRORS = ('wrong file identifier', 'file_id', 'file reference', 'wrong remote file', 'file not found')
+
+
+def is_file_id_error(error: Exception) -> bool:
+    """Ошибка Telegram из-за недействительного file_id (а не из-за текста или чата)"""
+    message = str(error).lower()
+    return any(marker in message for marker in FILE_ID_ERRORS)
+
+
+class MediaRegistry:
+    """Учет фото заказ-нарядов, отправляемых по file_id
+
+    Фото загружается в Telegram один раз (диспетчером), дальше всем
+    получателям уходит только file_id. Реестр хранит признак годности
+    file_id (таблица media, в памяти после load()) - проверки при отправке
+    не обращаются к БД. Если Telegram отверг file_id, остальным получателям
+    сразу уходит текст без фото, без заведомо неудачных запросов. Счетчики
+    по заказу: сколько фото отправлено по file_id и сколько получателей
+    получили только текст из-за недействительного file_id.
+    """
+
+    def __init__(self, stats_orders: int = MEDIA_STATS_ORDERS):
+        self._lock = threading.Lock()
+        self._media = {}
+        self._order_stats = OrderedDict()
+        self.stats_orders = stats_orders
+
+    def register(self, file_id: str, file_unique_id: str = None, file_size: int = None):
+        """Запомнить присланное фото (вызывается при получении фото от диспетчера)"""
+        now = time.time()
+
+        with self._lock:
+            self._media[file_id] = {'valid': True, 'confirmed': False}
+
+        with db_connection() as conn:
+            conn.execute('''
+                INSERT INTO media (file_id, file_unique_id, file_size, created_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(file_id) DO UPDATE SET
+                    file_unique_id = excluded.file_unique_id,
+                    file_size = excluded.file_size
+            ''', (file_id, file_unique_id, file_size, now))
+
+    def load(self, days: float = MEDIA_LOAD_DAYS) -> int:
+        """Загрузить недействительные и недавние file_id из БД (при старте)"""
+        with db_connection() as conn:
+            rows = conn.execute(
+                'SELECT file_id, valid FROM media WHERE valid = 0 OR created_at >= ?',
+                (time.time() - days * 24 * 3600,)
+            ).fetchall()
+
+        with self._lock:
+            for file_id, valid in rows:
+                self._media[file_id] = {'valid': bool(valid), 'confirmed': False}
+
+        print(f"[Media] Loaded {len(rows)} file_ids")
+        return len(rows)
+
+    def _get_media(self, file_id: str) -> dict:
+        """Запись о фото; незнакомый file_id считается годным"""
+        with self._lock:
+            return self._media.setdefault(file_id, {'valid': True, 'confirmed': False})
+
+    def is_valid(self, file_id: str) -> bool:
+        """Можно ли отправлять фото по этому file_id"""
+        return self._get_media(file_id)['valid']
+
+    def is_confirmed(self, file_id: str) -> bool:
+        """Отправлялось ли фото по этому file_id успешно хотя бы раз"""
+        return self._get_media(file_id)['confirmed']
+
+    def _order_counters(self, order_id) -> dict:
+        counters = self._order_stats.get(order_id)
+        if counters is None:
+            counters = {'photo_sends': 0, 'photos_skipped': 0}
+            self._order_stats[order_id] = counters
+            while len(self._order_stats) > self.stats_orders:
+                self._order_stats.popitem(last=False)
+        return counters
+
+    def record_send(self, file_id: str, order_id: int = None):
+        """Фото отправлено по file_id"""
+        media = self._get_media(file_id)
+
+        with self._lock:
+            media['confirmed'] = True
+            self._order_counters(order_id)['photo_sends'] += 1
+
+    def record_skipped(self, order_id: int = None):
+        """Фото не отправлялось из-за недействительного file_id - только текст"""
+        with self._lock:
+            self._order_counters(order_id)['photos_skipped'] += 1
+
+    def mark_invalid(self, file_id: str, error: str):
+        """Telegram отверг file_id - дальше отправлять только текст"""
+        media = self._get_media(file_id)
+        with self._lock:
+            media['valid'] = False
+
+        print(f"[Media] file_id {file_id[:16]}... is no longer valid: {error}")
+
+        with db_connection() as conn:
+            conn.execute('''
+                INSERT INTO media (file_id, valid, last_error, created_at)
+                VALUES (?, 0, ?, ?)
+                ON CONFLICT(file_id) DO UPDATE SET valid = 0, last_error = excluded.last_error
+            ''', (file_id, error, time.time()))
+
+    def get_order_stats(self, order_id: int) -> dict:
+        """Счетчики одного заказа: отправки фото по file_id и пропущенные фото"""
+        with self._lock:
+            return dict(self._order_stats.get(order_id) or {'photo_sends': 0, 'photos_skipped': 0})
+
+    def get_stats(self) -> dict:
+        """Суммарные счетчики по всем заказам в памяти"""
+        with self._lock:
+            totals = {'photo_sends': 0, 'photos_skipped': 0}
+            for counters in self._order_stats.values():
+                for name in totals:
+                    totals[name] += counters[name]
+            totals.update(
+                media=len(self._media),
+                invalid=sum(1 for media in self._media.values() if not media['valid'])
+            )
+            return totals
+
+
+_registry = MediaRegistry()
+
+
+def get_media_registry() -> MediaRegistry:
+    """Общий на бота реестр фото"""
+    return _registry
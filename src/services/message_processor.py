@@ -1,7 +1,15 @@
 import os
+import re
 import sys
+import json
+import time
+import asyncio
 import httpx
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, BadRequestError
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import run_db
+from services.terminology_cache import TerminologyCache
+from services.dental_rules import DentalRuleNormalizer
 
 # Загружаем переменные окружения из .env файла
 try:
@@ -11,40 +19,231 @@ except ImportError:
     pass
 
 
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+LLM_MODEL = "meta-llama/llama-3-8b-instruct"
+
+# Крайний срок одного запроса к OpenRouter (секунды). После него
+# запрос отменяется и используется простой парсер.
+LLM_REQUEST_TIMEOUT = float(os.getenv('LLM_REQUEST_TIMEOUT', '20'))
+
+# Пул keep-alive соединений к OpenRouter: TLS-рукопожатие выполняется один
+# раз на соединение, дальше запросы идут по уже открытому соединению
+LLM_HTTP_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=300)
+
+
+def create_http_clients() -> tuple:
+    """Создать пару (httpx.Client, httpx.AsyncClient) с общим SSL-контекстом"""
+    ssl_context = httpx.create_ssl_context()
+
+    http_client = httpx.Client(
+        timeout=30.0,
+        limits=LLM_HTTP_LIMITS,
+        follow_redirects=True,
+        verify=ssl_context
+    )
+    async_http_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=10.0),
+        limits=LLM_HTTP_LIMITS,
+        follow_redirects=True,
+        verify=ssl_context
+    )
+    return http_client, async_http_client
+
+
+ORDER_SYSTEM_PROMPT = """
+        Ты эксперт-помощник для обработки заказов в зуботехнической лаборатории со знанием стоматологической терминологии.
+        На вход ты получаешь короткое сообщение с информацией о заказе.
+        Твоя задача - распознать структуру данных и вернуть в формате JSON, используя ПРАВИЛЬНУЮ стоматологическую терминологию.
+
+        ПРАВИЛЬНАЯ ТЕРМИНОЛОГИЯ:
+
+        1. Материалы (правильное написание):
+           - "циркон" → "из диоксида циркония"
+           - "металлокерамика" → "металлокерамическая коронка"
+           - "керамика" → "безметалловая керамическая коронка"
+           - "пластмасса" → "пластмассовая коронка"
+
+        2. Виды работ:
+           - "циркон на винте" → "цельнометаллическая коронка на винте"
+           - "металлокерамика" → "металлокерамическая коронка"
+           - "виниры циркон" → "керамические виниры из диоксида циркония"
+           - "мост циркон" → "мост из диоксида циркония"
+           - "бюгельный протез" → "бюгельный протез"
+
+        Формат ответа:
+        {
+            "technician_name": "ФИО техники (фамилия)",
+            "doctor_name": "ФИО врача (если есть)",
+            "patient_name": "ФИО пациента (если есть)",
+            "work_type": "вид работы (С ПРАВИЛЬНОЙ терминологией)",
+            "quantity": количество (число),
+            "deadline": "дата дедлайна (в формате ДД.ММ.ГГГГ или null)",
+            "notes": "дополнительные заметки (если есть)"
+        }
+
+        Примеры:
+
+        Вход: "Мороков циркон на винте 7шт пациент Иванов"
+        Выход: {"technician_name": "Мороков", "work_type": "цельнометаллическая коронка на винте", "quantity": 7, "deadline": null, "patient_name": "Иванов", "notes": ""}
+
+        Вход: "Сидоров металлокерамика 13шт на завтра пациент Петров"
+        Выход: {"technician_name": "Сидоров", "work_type": "металлокерамическая коронка", "quantity": 13, "deadline": null, "patient_name": "Петров", "notes": "на завтра"}
+
+        Вход: "Козлов виниры 5шт от Иванова 15.02.2026 пациент Сидоров"
+        Выход: {"technician_name": "Козлов", "work_type": "керамические виниры из диоксида циркония", "quantity": 5, "deadline": "15.02.2026", "doctor_name": "Иванов", "patient_name": "Сидоров"}
+
+        Вход: "Плюхин металлокерамика 2 шт на 02.04.2026 врач Гаспарянидзе пациент Анохин"
+        Выход: {"technician_name": "Плюхин", "work_type": "металлокерамическая коронка", "quantity": 2, "deadline": "02.04.2026", "doctor_name": "Гаспарянидзе", "patient_name": "Анохин", "notes": ""}
+        """
+
+
+# Один запрос вместо двух: разбор заказа и нормализация вида работы
+# (WORK_TYPE_SYSTEM_PROMPT) выполняются моделью за один вызов.
+# LLM_SINGLE_CALL=0 возвращает прежний режим из двух запросов.
+LLM_SINGLE_CALL = os.getenv('LLM_SINGLE_CALL', '1') == '1'
+
+STRUCTURED_ORDER_SYSTEM_PROMPT = """
+        Ты эксперт-помощник для обработки заказов в зуботехнической лаборатории со знанием стоматологической терминологии.
+        На вход ты получаешь короткое сообщение с информацией о заказе.
+        Верни ТОЛЬКО JSON по схеме, без пояснений и markdown.
+
+        Поле work_type_raw - вид работы как написано в сообщении (без количества, дат и имен).
+        Поле work_type - тот же вид работы в канонической стоматологической терминологии.
+
+        ПРАВИЛА ДЛЯ work_type:
+        - "циркон", "циркониевый", "цирконий", "диоксид" → "из диоксида циркония"
+        - "мк", "металлокерамика" → "металлокерамическая коронка"
+        - "керамика", "безметалловая" → "безметалловая керамическая коронка"
+        - "пластмасса" → "пластмассовая коронка"
+        - "цельнометаллический" → "цельнометаллическая коронка"
+        - "винт", "на винт", "винтах" → "на винте"
+        - "абатмент" при другом виде работы → "на абатменте"
+        - "имплант", "на импланте" → "на имплантах"
+        - материал без вида работы - это коронка: "циркон на винте" → "коронка из диоксида циркония на винте"
+        - виниры из циркония - "керамические виниры из диоксида циркония"
+        - не добавляй "для", имена и количество в work_type
+        - если название уже правильное, верни его без изменений
+
+        Канонические названия: "металлокерамическая коронка на винте", "коронка из диоксида циркония",
+        "безметалловая керамическая коронка", "мост из диоксида циркония на имплантах", "пластмассовый мост",
+        "керамические виниры из диоксида циркония", "полный съемный протез", "частичный съемный протез",
+        "бюгельный протез", "ортодонтическая шина", "индиректная вкладка", "керамические брекеты", "абатмент".
+
+        Примеры:
+
+        Вход: "Мороков циркон на винте 7шт пациент Иванов"
+        Выход: {"technician_name": "Мороков", "doctor_name": null, "patient_name": "Иванов", "work_type_raw": "циркон на винте", "work_type": "коронка из диоксида циркония на винте", "quantity": 7, "deadline": null, "notes": null}
+
+        Вход: "Плюхин металлокерамика 2 шт на 02.04.2026 врач Гаспарянидзе пациент Анохин"
+        Выход: {"technician_name": "Плюхин", "doctor_name": "Гаспарянидзе", "patient_name": "Анохин", "work_type_raw": "металлокерамика", "work_type": "металлокерамическая коронка", "quantity": 2, "deadline": "02.04.2026", "notes": null}
+
+        Вход: "Козлов виниры циркон 5шт от Иванова на завтра"
+        Выход: {"technician_name": "Козлов", "doctor_name": "Иванов", "patient_name": null, "work_type_raw": "виниры циркон", "work_type": "керамические виниры из диоксида циркония", "quantity": 5, "deadline": null, "notes": "на завтра"}
+        """
+
+# Формат ответа одного запроса. По умолчанию - json_object: его принимает
+# больше провайдеров OpenRouter, схема все равно описана в промпте, а ответ
+# проверяется. LLM_JSON_SCHEMA=1 - строгая схема ORDER_RESPONSE_FORMAT для
+# моделей с поддержкой json_schema.
+LLM_JSON_SCHEMA = os.getenv('LLM_JSON_SCHEMA', '0') == '1'
+
+JSON_OBJECT_FORMAT = {"type": "json_object"}
+
+# Признаки ошибки 400, означающей, что модель не поддерживает response_format
+# (а не длину контекста, неверную модель или фильтр содержимого)
+RESPONSE_FORMAT_ERRORS = ('response_format', 'json_schema', 'json_object', 'json mode', 'structured output')
+
+
+def is_response_format_error(error: Exception) -> bool:
+    """Ошибка OpenRouter из-за неподдерживаемого response_format"""
+    message = str(error).lower()
+    return any(marker in message for marker in RESPONSE_FORMAT_ERRORS)
+
+
+# JSON Schema ответа (structured output)
+ORDER_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "dental_order",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "technician_name": {"type": ["string", "null"]},
+                "doctor_name": {"type": ["string", "null"]},
+                "patient_name": {"type": ["string", "null"]},
+                "work_type_raw": {"type": "string"},
+                "work_type": {"type": "string"},
+                "quantity": {"type": ["integer", "null"]},
+                "deadline": {"type": ["string", "null"], "pattern": "^\\d{2}\\.\\d{2}\\.\\d{4}$"},
+                "notes": {"type": ["string", "null"]}
+            },
+            "required": [
+                "technician_name", "doctor_name", "patient_name", "work_type_raw",
+                "work_type", "quantity", "deadline", "notes"
+            ],
+            "additionalProperties": False
+        }
+    }
+}
+
+
 class MessageProcessor:
     """Обработка сообщений с помощью ИИ"""
 
-    def __init__(self):
+    def __init__(self, http_client: httpx.Client = None, async_http_client: httpx.AsyncClient = None,
+                 terminology_cache: TerminologyCache = None, single_call: bool = None,
+                 json_schema: bool = None):
+        """http_client / async_http_client передаются из ProcessorRegistry,
+        чтобы все запросы шли через один пул соединений. Без них клиенты
+        создаются заново (служебные скрипты). terminology_cache - общий
+        постоянный кэш нормализованных названий работ. single_call -
+        разбор заказа одним запросом (по умолчанию LLM_SINGLE_CALL).
+        json_schema - строгая схема ответа (по умолчанию LLM_JSON_SCHEMA)."""
+        self.single_call = LLM_SINGLE_CALL if single_call is None else single_call
+        json_schema = LLM_JSON_SCHEMA if json_schema is None else json_schema
+        # Сбрасывается в None, если модель отвергла response_format
+        self.response_format = ORDER_RESPONSE_FORMAT if json_schema else JSON_OBJECT_FORMAT
         # Минимальная конфигурация для совместимости
         api_key = os.getenv('OPENROUTER_API_KEY')
 
         if not api_key:
             print("WARNING: OPENROUTER_API_KEY not found, using simple parser only")
             self.client = None
+            self.async_client = None
         else:
             try:
-                # Создаем кастомный httpx клиент без прокси
-                http_client = httpx.Client(
-                    timeout=30.0,
-                    follow_redirects=True
-                )
+                if http_client is None or async_http_client is None:
+                    http_client, async_http_client = create_http_clients()
 
                 self.client = OpenAI(
                     api_key=api_key,
-                    base_url="https://openrouter.ai/api/v1",
+                    base_url=OPENROUTER_BASE_URL,
                     http_client=http_client
                 )
+
+                # Асинхронный клиент для обработчиков бота: не блокирует
+                # event loop во время запроса
+                self.async_client = AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=OPENROUTER_BASE_URL,
+                    http_client=async_http_client,
+                    max_retries=0
+                )
                 print(f"[OpenAI] Client initialized successfully")
             except Exception as e:
                 print(f"ERROR: Failed to initialize OpenAI client: {e}")
                 print(f"Falling back to simple parser")
                 self.client = None
+                self.async_client = None
 
         from services.dental_terminology_service import DentalTerminologyService
-        self.dental_service = DentalTerminologyService()
-        self.dental_cache = {}
+        self.dental_service = DentalTerminologyService(client=self.client, async_client=self.async_client)
+        # Без переданного кэша (скрипты, тесты) кэш живет только в памяти
+        self.terminology_cache = terminology_cache or TerminologyCache(persistent=False)
+        self.dental_rules = DentalRuleNormalizer()
 
-    def parse_message_simple(self, text: str) -> dict:
+    def parse_message_simple(self, text: str, normalize: bool = True) -> dict:
         """Простой парсер сообщения без ИИ"""
         print(f"[DEBUG parse_message_simple] Parsing: '{text}'")
         result = {
@@ -128,7 +327,11 @@ class MessageProcessor:
             result['work_type'] = 'Не указано'
 
         if result.get('work_type') and result['work_type'] != 'Не указано':
-            result['work_type'] = self.normalize_dental_terminology(result['work_type'])
+            if normalize:
+                result['work_type'] = self.normalize_dental_terminology(result['work_type'])
+            else:
+                # Без запроса к ИИ применяем только правила
+                result['work_type'] = self.dental_rules.normalize(result['work_type']) or result['work_type']
 
         print(f"[DEBUG parse_message_simple] Result: {result}")
         return result
@@ -139,102 +342,261 @@ class MessageProcessor:
             print("[OpenRouter] OpenAI client not available, using simple parser")
             return self.parse_message_simple(text)
 
-        system_prompt = """
-        Ты эксперт-помощник для обработки заказов в зуботехнической лаборатории со знанием стоматологической терминологии.
-        На вход ты получаешь короткое сообщение с информацией о заказе.
-        Твоя задача - распознать структуру данных и вернуть в формате JSON, используя ПРАВИЛЬНУЮ стоматологическую терминологию.
-
-        ПРАВИЛЬНАЯ ТЕРМИНОЛОГИЯ:
-
-        1. Материалы (правильное написание):
-           - "циркон" → "из диоксида циркония"
-           - "металлокерамика" → "металлокерамическая коронка"
-           - "керамика" → "безметалловая керамическая коронка"
-           - "пластмасса" → "пластмассовая коронка"
-
-        2. Виды работ:
-           - "циркон на винте" → "цельнометаллическая коронка на винте"
-           - "металлокерамика" → "металлокерамическая коронка"
-           - "виниры циркон" → "керамические виниры из диоксида циркония"
-           - "мост циркон" → "мост из диоксида циркония"
-           - "бюгельный протез" → "бюгельный протез"
+        try:
+            print(f"[OpenRouter] Starting request for: {text[:50]}...")
+            response = self.client.chat.completions.create(
+                model=LLM_MODEL,
+                messages=[
+                    {"role": "system", "content": ORDER_SYSTEM_PROMPT},
+                    {"role": "user", "content": text}
+                ],
+                temperature=0.3
+            )
 
-        Формат ответа:
-        {
-            "technician_name": "ФИО техники (фамилия)",
-            "doctor_name": "ФИО врача (если есть)",
-            "patient_name": "ФИО пациента (если есть)",
-            "work_type": "вид работы (С ПРАВИЛЬНОЙ терминологией)",
-            "quantity": количество (число),
-            "deadline": "дата дедлайна (в формате ДД.ММ.ГГГГ или null)",
-            "notes": "дополнительные заметки (если есть)"
-        }
+            result = self._parse_order_response(response.choices[0].message.content)
+            if result is None:
+                return self.parse_message_simple(text)
 
-        Примеры:
+            if result.get('work_type'):
+                normalized_work_type = self.normalize_dental_terminology(result['work_type'])
+                result['work_type'] = normalized_work_type
 
-        Вход: "Мороков циркон на винте 7шт пациент Иванов"
-        Выход: {"technician_name": "Мороков", "work_type": "цельнометаллическая коронка на винте", "quantity": 7, "deadline": null, "patient_name": "Иванов", "notes": ""}
+            print(f"[OpenRouter] Parsed result: {result}")
+            return result
 
-        Вход: "Сидоров металлокерамика 13шт на завтра пациент Петров"
-        Выход: {"technician_name": "Сидоров", "work_type": "металлокерамическая коронка", "quantity": 13, "deadline": null, "patient_name": "Петров", "notes": "на завтра"}
+        except Exception as e:
+            print(f"OpenAI Error: {e}")
+            print("Falling back to simple parser...")
+            return self.parse_message_simple(text)
 
-        Вход: "Козлов виниры 5шт от Иванова 15.02.2026 пациент Сидоров"
-        Выход: {"technician_name": "Козлов", "work_type": "керамические виниры из диоксида циркония", "quantity": 5, "deadline": "15.02.2026", "doctor_name": "Иванов", "patient_name": "Сидоров"}
+    async def normalize_message_async(self, text: str, timeout: float = LLM_REQUEST_TIMEOUT) -> dict:
+        """Асинхронная нормализация сообщения (не блокирует другие чаты)
 
-        Вход: "Плюхин металлокерамика 2 шт на 02.04.2026 врач Гаспарянидзе пациент Анохин"
-        Выход: {"technician_name": "Плюхин", "work_type": "металлокерамическая коронка", "quantity": 2, "deadline": "02.04.2026", "doctor_name": "Гаспарянидзе", "patient_name": "Анохин", "notes": ""}
+        Каждый запрос к OpenRouter ограничен timeout секундами; по истечении
+        запрос отменяется и используется простой парсер. Отмена самой задачи
+        (CancelledError) пробрасывается дальше.
         """
+        if not self.async_client:
+            print("[OpenRouter] OpenAI client not available, using simple parser")
+            return await self._parse_message_simple_async(text, timeout)
+
+        if self.single_call:
+            return await self._normalize_message_single_call(text, timeout)
 
         try:
-            print(f"[OpenRouter] Starting request for: {text[:50]}...")
-            response = self.client.chat.completions.create(
-                model="meta-llama/llama-3-8b-instruct",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": text}
-                ],
-                temperature=0.3
+            print(f"[OpenRouter] Starting async request for: {text[:50]}...")
+            response = await asyncio.wait_for(
+                self.async_client.chat.completions.create(
+                    model=LLM_MODEL,
+                    messages=[
+                        {"role": "system", "content": ORDER_SYSTEM_PROMPT},
+                        {"role": "user", "content": text}
+                    ],
+                    temperature=0.3,
+                    timeout=timeout
+                ),
+                timeout=timeout
             )
 
-            corrected_text = response.choices[0].message.content.strip()
-            print(f"[OpenRouter] Raw response: {corrected_text[:200]}")
+            result = self._parse_order_response(response.choices[0].message.content)
+            if result is None:
+                return await self._parse_message_simple_async(text, timeout)
 
-            # Парсим JSON
-            import json
-            try:
-                result = json.loads(corrected_text)
+            if result.get('work_type'):
+                result['work_type'] = await self.normalize_dental_terminology_async(result['work_type'], timeout)
 
-                if result.get('work_type'):
-                    normalized_work_type = self.normalize_dental_terminology(result['work_type'])
-                    result['work_type'] = normalized_work_type
+            print(f"[OpenRouter] Parsed result: {result}")
+            return result
 
-                print(f"[OpenRouter] Parsed result: {result}")
-                return result
+        except asyncio.TimeoutError:
+            # OpenRouter не ответил вовремя - не ждем второй запрос на нормализацию
+            print(f"[OpenRouter] Deadline {timeout}s exceeded, falling back to simple parser...")
+            return self.parse_message_simple(text, normalize=False)
+        except Exception as e:
+            print(f"OpenAI Error: {e}")
+            print("Falling back to simple parser...")
+            return await self._parse_message_simple_async(text, timeout)
 
-            except json.JSONDecodeError as e:
-                print(f"[OpenRouter] JSON decode error: {e}")
-                print("[OpenRouter] Falling back to simple parser...")
-                return self.parse_message_simple(text)
+    async def _normalize_message_single_call(self, text: str, timeout: float) -> dict:
+        """Разбор заказа и нормализация вида работы одним запросом к OpenRouter
+
+        Ответ проверяется (_validate_structured_order); при неверном ответе
+        или ошибке используется простой парсер, как и в режиме двух запросов.
+        Если модель отвергла response_format, он больше не отправляется,
+        а запрос повторяется без него в оставшееся до крайнего срока время.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        response_format = self.response_format
+        request = {}
+        if response_format is not None:
+            request['response_format'] = response_format
 
+        try:
+            print(f"[OpenRouter] Starting single-call request for: {text[:50]}...")
+            response = await asyncio.wait_for(
+                self.async_client.chat.completions.create(
+                    model=LLM_MODEL,
+                    messages=[
+                        {"role": "system", "content": STRUCTURED_ORDER_SYSTEM_PROMPT},
+                        {"role": "user", "content": text}
+                    ],
+                    temperature=0.3,
+                    timeout=timeout,
+                    **request
+                ),
+                timeout=timeout
+            )
+
+            result = self._validate_structured_order(self._parse_order_response(response.choices[0].message.content))
+            if result is None:
+                print("[OpenRouter] Structured response rejected, falling back to simple parser...")
+                return await self._parse_message_simple_async(text, timeout)
+
+        except asyncio.TimeoutError:
+            print(f"[OpenRouter] Deadline {timeout}s exceeded, falling back to simple parser...")
+            return self.parse_message_simple(text, normalize=False)
+        except BadRequestError as e:
+            if response_format is None or not is_response_format_error(e):
+                print(f"OpenAI Error: {e}")
+                print("Falling back to simple parser...")
+                return await self._parse_message_simple_async(text, timeout)
+            print(f"[OpenRouter] {LLM_MODEL} rejected response_format {response_format['type']}, "
+                  f"no longer sending it: {e}")
+            self.response_format = None
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                print(f"[OpenRouter] Deadline {timeout}s exceeded, falling back to simple parser...")
+                return self.parse_message_simple(text, normalize=False)
+            return await self._normalize_message_single_call(text, remaining)
         except Exception as e:
             print(f"OpenAI Error: {e}")
             print("Falling back to simple parser...")
-            return self.parse_message_simple(text)
+            return await self._parse_message_simple_async(text, timeout)
+
+        work_type_raw = result.pop('work_type_raw')
+
+        # Правила детерминированы и имеют приоритет над ответом модели;
+        # остальное запоминаем в кэше терминологии для режима двух запросов
+        rule_result = self.dental_rules.normalize(work_type_raw)
+        if rule_result is not None:
+            result['work_type'] = rule_result
+        elif self.terminology_cache.persistent:
+            await run_db(self.terminology_cache.put, work_type_raw, result['work_type'])
+        else:
+            self.terminology_cache.put(work_type_raw, result['work_type'])
+
+        print(f"[OpenRouter] Parsed result: {result}")
+        return result
+
+    @staticmethod
+    def _validate_structured_order(data):
+        """Проверить ответ по ORDER_RESPONSE_FORMAT, None если ответ непригоден"""
+        if not isinstance(data, dict):
+            return None
+
+        work_type = data.get('work_type')
+        if not isinstance(work_type, str) or not work_type.strip():
+            return None
+
+        work_type_raw = data.get('work_type_raw')
+        if not isinstance(work_type_raw, str) or not work_type_raw.strip():
+            work_type_raw = work_type
+
+        def text_or_none(value):
+            if isinstance(value, str) and value.strip():
+                return value.strip()
+            return None
+
+        quantity = data.get('quantity')
+        if isinstance(quantity, str) and quantity.strip().isdigit():
+            quantity = int(quantity.strip())
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 0:
+            quantity = None
+
+        deadline = text_or_none(data.get('deadline'))
+        if deadline and not re.fullmatch(r'\d{1,2}\.\d{1,2}\.\d{4}', deadline):
+            deadline = None
+
+        return {
+            'technician_name': text_or_none(data.get('technician_name')),
+            'doctor_name': text_or_none(data.get('doctor_name')),
+            'patient_name': text_or_none(data.get('patient_name')),
+            'work_type': ' '.join(work_type.strip().strip('"\'').split()),
+            'work_type_raw': work_type_raw.strip(),
+            'quantity': quantity,
+            'deadline': deadline,
+            'notes': text_or_none(data.get('notes'))
+        }
+
+    async def _parse_message_simple_async(self, text: str, timeout: float) -> dict:
+        """Простой парсер с асинхронной нормализацией вида работы"""
+        result = self.parse_message_simple(text, normalize=False)
+
+        if result.get('work_type') and result['work_type'] != 'Не указано':
+            result['work_type'] = await self.normalize_dental_terminology_async(result['work_type'], timeout)
+
+        return result
+
+    def _parse_order_response(self, content: str):
+        """Разобрать JSON-ответ модели, None если ответ не JSON"""
+        corrected_text = content.strip()
+        print(f"[OpenRouter] Raw response: {corrected_text[:200]}")
+
+        try:
+            return json.loads(corrected_text)
+        except json.JSONDecodeError as e:
+            print(f"[OpenRouter] JSON decode error: {e}")
+            print("[OpenRouter] Falling back to simple parser...")
+            return None
 
     def normalize_dental_terminology(self, work_type: str) -> str:
         """Нормализация стоматологической терминологии с кэшированием"""
         if not work_type:
             return work_type
 
-        work_type_lower = work_type.lower().strip()
+        rule_result = self.dental_rules.normalize(work_type)
+        if rule_result is not None:
+            print(f"[Dental Rules] '{work_type}' -> '{rule_result}'")
+            return rule_result
 
-        if work_type_lower in self.dental_cache:
-            print(f"[Dental Cache HIT] '{work_type}' -> '{self.dental_cache[work_type_lower]}'")
-            return self.dental_cache[work_type_lower]
+        cached = self.terminology_cache.get(work_type)
+        if cached is not None:
+            print(f"[Dental Cache HIT] '{work_type}' -> '{cached}'")
+            return cached
 
         try:
+            started = time.perf_counter()
             normalized = self.dental_service.normalize_work_type(work_type)
-            self.dental_cache[work_type_lower] = normalized
+            self.terminology_cache.put(work_type, normalized, time.perf_counter() - started)
+            return normalized
+        except Exception as e:
+            print(f"[Dental Error] {e}, using original: {work_type}")
+            return work_type
+
+    async def normalize_dental_terminology_async(self, work_type: str, timeout: float = LLM_REQUEST_TIMEOUT) -> str:
+        """Асинхронная нормализация стоматологической терминологии с кэшированием"""
+        if not work_type:
+            return work_type
+
+        rule_result = self.dental_rules.normalize(work_type)
+        if rule_result is not None:
+            print(f"[Dental Rules] '{work_type}' -> '{rule_result}'")
+            return rule_result
+
+        cached = self.terminology_cache.get(work_type)
+        if cached is not None:
+            print(f"[Dental Cache HIT] '{work_type}' -> '{cached}'")
+            return cached
+
+        try:
+            started = time.perf_counter()
+            normalized = await self.dental_service.normalize_work_type_async(work_type, timeout)
+            latency = time.perf_counter() - started
+            if self.terminology_cache.persistent:
+                await run_db(self.terminology_cache.put, work_type, normalized, latency)
+            else:
+                self.terminology_cache.put(work_type, normalized, latency)
             return normalized
         except Exception as e:
             print(f"[Dental Error] {e}, using original: {work_type}")
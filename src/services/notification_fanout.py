@@ -0,0 +1,123 @@
+import os
+import time
+import asyncio
+
+
+# Ограничения Telegram Bot API: около 30 сообщений в секунду на бота и
+# не чаще одного сообщения в секунду в один чат
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+TELEGRAM_CHAT_INTERVAL = float(os.getenv('TELEGRAM_CHAT_INTERVAL', '1.0'))
+
+# Сколько отправок выполняется одновременно
+NOTIFY_CONCURRENCY = int(os.getenv('NOTIFY_CONCURRENCY', '8'))
+
+
+class TelegramRateLimiter:
+    """Ограничитель частоты отправки: общий на бота и по каждому чату
+
+    Каждому сообщению выдается время отправки (слот): сначала в своем
+    чате, затем в общем потоке бота. Слоты выдаются без await, поэтому
+    в одном event loop гонок нет.
+    """
+
+    def __init__(self, rate: float = TELEGRAM_GLOBAL_RATE, chat_interval: float = TELEGRAM_CHAT_INTERVAL):
+        self.interval = 1.0 / rate
+        self.chat_interval = chat_interval
+        self._next_global = 0.0
+        self._next_chat = {}
+        self.waits = 0
+        self.wait_time = 0.0
+
+    async def acquire(self, chat_id: int):
+        """Дождаться разрешенного момента отправки в chat_id"""
+        now = time.monotonic()
+        chat_slot = max(now, self._next_chat.get(chat_id, 0.0))
+        self._next_chat[chat_id] = chat_slot + self.chat_interval
+        await self._wait_until(chat_slot)
+
+        now = time.monotonic()
+        global_slot = max(now, self._next_global)
+        self._next_global = global_slot + self.interval
+        await self._wait_until(global_slot)
+
+        if len(self._next_chat) > 1000:
+            now = time.monotonic()
+            self._next_chat = {chat: slot for chat, slot in self._next_chat.items() if slot > now}
+
+    async def _wait_until(self, slot: float):
+        delay = slot - time.monotonic()
+        if delay > 0:
+            self.waits += 1
+            self.wait_time += delay
+            await asyncio.sleep(delay)
+
+
+class NotificationFanout:
+    """Параллельная рассылка с ограничением числа одновременных отправок
+
+    send() выполняет одну отправку (корутину от send_func) с учетом
+    семафора и TelegramRateLimiter и возвращает результат по получателю:
+    {'label', 'chat_id', 'ok', 'error', 'exception', 'elapsed'}. send_all() рассылает
+    список заданий одновременно.
+    """
+
+    def __init__(self, max_concurrency: int = NOTIFY_CONCURRENCY, rate_limiter: TelegramRateLimiter = None):
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = rate_limiter or TelegramRateLimiter()
+        self._semaphore = None
+        self._semaphore_loop = None
+        self.sent = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Семафор текущего event loop (в тестах loop создается заново)"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def send(self, chat_id: int, send_func, label: str = '') -> dict:
+        """Отправить одно сообщение: send_func() возвращает корутину отправки"""
+        started = time.monotonic()
+
+        async with self._get_semaphore():
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                await self.rate_limiter.acquire(chat_id)
+                await send_func()
+                self.sent += 1
+                return {'label': label, 'chat_id': chat_id, 'ok': True, 'error': None, 'exception': None,
+                        'elapsed': time.monotonic() - started}
+            except Exception as e:
+                self.failed += 1
+                print(f"[Fanout] Failed to send {label} to {chat_id}: {e}")
+                return {'label': label, 'chat_id': chat_id, 'ok': False, 'error': str(e), 'exception': e,
+                        'elapsed': time.monotonic() - started}
+            finally:
+                self.in_flight -= 1
+
+    async def send_all(self, jobs: list) -> list:
+        """Разослать задания (chat_id, send_func, label) одновременно"""
+        return await asyncio.gather(*(self.send(chat_id, send_func, label) for chat_id, send_func, label in jobs))
+
+    def get_stats(self) -> dict:
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'rate_limit_waits': self.rate_limiter.waits,
+            'rate_limit_wait_time': self.rate_limiter.wait_time
+        }
+
+
+_fanout = NotificationFanout()
+
+
+def get_notification_fanout() -> NotificationFanout:
+    """Общая на бота рассылка (ограничения Telegram действуют на токен)"""
+    return _fanout
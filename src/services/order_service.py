@@ -0,0 +1,49 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import db_connection, iso_date
+from services.async_service import AsyncService
+from services.report_cache import get_report_cache
+from services.outbox import enqueue_messages
+
+
+class OrderService:
+    """Работа с заказами"""
+
+    @staticmethod
+    def create_order(doctor_id, technician_id, patient_name, work_type, quantity, deadline, description, photo_id,
+                     notifications=None) -> int:
+        """Создать заказ, вернуть его ID
+
+        notifications(order_id) - сообщения о заказе для outbox (см.
+        NotificationService.new_order_notifications): они вставляются в той же
+        транзакции, что и заказ, поэтому заказ не может остаться без уведомлений.
+        """
+        with db_connection() as conn:
+            cursor = conn.execute('''
+                INSERT INTO orders (doctor_id, technician_id, patient_name, work_type, quantity, deadline, description, photo_id, deadline_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                doctor_id,
+                technician_id,
+                patient_name,
+                work_type,
+                quantity if quantity is not None else 0,
+                deadline,
+                description,
+                photo_id,
+                iso_date(deadline)
+            ))
+
+            order_id = cursor.lastrowid
+            created_day = conn.execute('SELECT substr(created_at, 1, 10) FROM orders WHERE id = ?', (order_id,)).fetchone()[0]
+            if notifications is not None:
+                enqueue_messages(conn, notifications(order_id))
+            conn.commit()
+
+        # отчеты, в период которых попадает новый заказ, больше не актуальны
+        get_report_cache().invalidate(created_day)
+        return order_id
+
+
+AsyncOrderService = AsyncService(OrderService)
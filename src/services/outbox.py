@@ -0,0 +1,351 @@
+import os
+import sys
+import time
+import asyncio
+from telegram.error import RetryAfter, Forbidden, BadRequest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import db_connection
+from services.async_service import AsyncService
+
+
+# Повторные попытки: после n-й неудачи следующая через BASE * 2^(n-1) секунд
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_BACKOFF_BASE = float(os.getenv('OUTBOX_BACKOFF_BASE', '2'))
+OUTBOX_BACKOFF_MAX = float(os.getenv('OUTBOX_BACKOFF_MAX', '600'))
+
+# Сколько сообщений worker берет за раз и на сколько секунд они скрываются
+# от повторной выборки (если процесс упадет во время отправки, сообщение
+# снова станет доступным через OUTBOX_LEASE секунд)
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))
+OUTBOX_LEASE = float(os.getenv('OUTBOX_LEASE', '60'))
+
+# Как часто worker проверяет очередь без сигнала wake() и сколько дней
+# хранятся доставленные сообщения
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '5'))
+OUTBOX_RETENTION_DAYS = float(os.getenv('OUTBOX_RETENTION_DAYS', '7'))
+
+OUTBOX_COLUMNS = 'id, order_id, chat_id, kind, text, photo_id, reply_chat_id, attempts, created_at'
+
+
+def backoff_delay(attempts: int) -> float:
+    """Пауза перед следующей попыткой после attempts неудачных"""
+    return min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** max(0, attempts - 1))
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """RetryAfter.retry_after - число секунд или timedelta (зависит от настроек PTB)"""
+    retry_after = error.retry_after
+    if hasattr(retry_after, 'total_seconds'):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+def enqueue_messages(conn, messages: list) -> int:
+    """Вставить сообщения в outbox на соединении conn (в его транзакции), вернуть число новых
+
+    Используется OrderService.create_order: заказ и уведомления о нем
+    записываются одной транзакцией.
+    """
+    now = time.time()
+    rows = [
+        (m.get('order_id'), m['chat_id'], m['kind'], m['text'], m.get('photo_id'), m.get('reply_chat_id'), now, now)
+        for m in messages
+    ]
+    before = conn.total_changes
+    conn.executemany('''
+        INSERT INTO outbox (order_id, chat_id, kind, text, photo_id, reply_chat_id, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (order_id, chat_id, kind) DO NOTHING
+    ''', rows)
+    return conn.total_changes - before
+
+
+class OutboxService:
+    """Очередь исходящих сообщений (таблица outbox)
+
+    Сообщение ставится в очередь один раз на (заказ, получатель, вид):
+    повторная постановка того же уведомления игнорируется. Статусы:
+    pending - ждет отправки, sent - доставлено, failed - попытки исчерпаны
+    или Telegram отказал окончательно.
+    """
+
+    @staticmethod
+    def enqueue(messages: list) -> int:
+        """Поставить сообщения в очередь одной транзакцией, вернуть число новых
+
+        Каждое сообщение - словарь с ключами order_id, chat_id, kind, text
+        и необязательными photo_id, reply_chat_id (кому сообщить, если
+        доставить не удастся).
+        """
+        with db_connection() as conn:
+            return enqueue_messages(conn, messages)
+
+    @staticmethod
+    def claim_due(limit: int = OUTBOX_BATCH_SIZE, lease: float = OUTBOX_LEASE) -> list:
+        """Взять сообщения, которым пора уходить, и скрыть их на lease секунд"""
+        now = time.time()
+
+        with db_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(f'''
+                SELECT {OUTBOX_COLUMNS}
+                FROM outbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at
+                LIMIT ?
+            ''', (now, limit)).fetchall()
+
+            conn.executemany(
+                'UPDATE outbox SET next_attempt_at = ? WHERE id = ?',
+                [(now + lease, row[0]) for row in rows]
+            )
+
+        return [
+            {
+                'id': row[0],
+                'order_id': row[1],
+                'chat_id': row[2],
+                'kind': row[3],
+                'text': row[4],
+                'photo_id': row[5],
+                'reply_chat_id': row[6],
+                'attempts': row[7],
+                'created_at': row[8]
+            }
+            for row in rows
+        ]
+
+    @staticmethod
+    def mark_sent(message_ids: list):
+        """Отметить сообщения доставленными"""
+        now = time.time()
+        with db_connection() as conn:
+            conn.executemany(
+                "UPDATE outbox SET status = 'sent', sent_at = ?, attempts = attempts + 1, last_error = NULL WHERE id = ?",
+                [(now, message_id) for message_id in message_ids]
+            )
+
+    @staticmethod
+    def reschedule(message_id: int, error: str, delay: float, count_attempt: bool = True):
+        """Повторить отправку через delay секунд"""
+        with db_connection() as conn:
+            conn.execute('''
+                UPDATE outbox
+                SET next_attempt_at = ?, attempts = attempts + ?, last_error = ?
+                WHERE id = ?
+            ''', (time.time() + delay, 1 if count_attempt else 0, error, message_id))
+
+    @staticmethod
+    def mark_failed(message_id: int, error: str):
+        """Окончательно отказаться от отправки"""
+        with db_connection() as conn:
+            conn.execute(
+                "UPDATE outbox SET status = 'failed', attempts = attempts + 1, last_error = ? WHERE id = ?",
+                (error, message_id)
+            )
+
+    @staticmethod
+    def purge(retention_days: float = OUTBOX_RETENTION_DAYS) -> int:
+        """Удалить доставленные сообщения старше retention_days"""
+        with db_connection() as conn:
+            cursor = conn.execute(
+                "DELETE FROM outbox WHERE status = 'sent' AND sent_at < ?",
+                (time.time() - retention_days * 24 * 3600,)
+            )
+            return cursor.rowcount
+
+    @staticmethod
+    def get_stats() -> dict:
+        """Глубина очереди и задержка доставки (от постановки до отправки)"""
+        now = time.time()
+
+        with db_connection() as conn:
+            counts = dict(conn.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status').fetchall())
+            due, oldest = conn.execute('''
+                SELECT SUM(next_attempt_at <= ?), MIN(created_at)
+                FROM outbox WHERE status = 'pending'
+            ''', (now,)).fetchone()
+            latency = conn.execute('''
+                SELECT AVG(sent_at - created_at), MAX(sent_at - created_at), COUNT(*)
+                FROM outbox WHERE status = 'sent' AND sent_at >= ?
+            ''', (now - 24 * 3600,)).fetchone()
+
+        return {
+            'pending': counts.get('pending', 0),
+            'due': due or 0,
+            'sent': counts.get('sent', 0),
+            'failed': counts.get('failed', 0),
+            'oldest_pending_age': now - oldest if oldest else 0.0,
+            'avg_latency': latency[0] or 0.0,
+            'max_latency': latency[1] or 0.0,
+            'sent_last_day': latency[2]
+        }
+
+
+AsyncOutboxService = AsyncService(OutboxService)
+
+
+class OutboxWorker:
+    """Фоновая отправка сообщений из outbox
+
+    Берет созревшие сообщения пачками, отправляет их параллельно через
+    NotificationFanout сервиса уведомлений (фото с новым file_id - сначала
+    одному получателю, см. process_batch) и записывает результат:
+    - RetryAfter: Telegram просит подождать - пауза для всей очереди,
+      попытка не засчитывается;
+    - Forbidden / BadRequest: получатель заблокировал бота или сообщение
+      некорректно - повтор бессмыслен, сообщение failed;
+    - прочие ошибки (сеть, 5xx): повтор с экспоненциальной паузой,
+      после OUTBOX_MAX_ATTEMPTS попыток - failed.
+    О недоставленном сообщении сообщается reply_chat_id (диспетчеру).
+    """
+
+    def __init__(self, notification_service=None, max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL):
+        self.notification_service = notification_service
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.running = False
+        self._wake_event = None
+        self._paused_until = 0.0
+        self._last_purge = 0.0
+        self.delivered = 0
+        self.retried = 0
+        self.failed = 0
+        self.retry_after_pauses = 0
+
+    def wake(self):
+        """Сообщить, что в очереди появились сообщения"""
+        if self._wake_event is not None:
+            self._wake_event.set()
+
+    async def process_batch(self) -> int:
+        """Отправить одну пачку созревших сообщений, вернуть ее размер"""
+        if time.time() < self._paused_until:
+            return 0
+
+        messages = await AsyncOutboxService.claim_due()
+        if not messages:
+            return 0
+
+        service = self.notification_service
+
+        # Фото, которое еще ни разу не ушло успешно, сначала отправляется
+        # одному получателю, остальным - после него: если file_id
+        # недействителен, они сразу получат текст без лишних запросов с фото
+        first_wave, second_wave, probing = [], [], set()
+        for message in messages:
+            photo_id = message['photo_id']
+            if photo_id and photo_id in probing:
+                second_wave.append(message)
+                continue
+            if photo_id and not service.media.is_confirmed(photo_id):
+                probing.add(photo_id)
+            first_wave.append(message)
+
+        messages = first_wave + second_wave
+        results = []
+        for wave in (first_wave, second_wave):
+            results += await service.fanout.send_all([
+                (m['chat_id'], service.delivery(m['chat_id'], m['text'], m['photo_id'], m['order_id']), m['kind'])
+                for m in wave
+            ])
+
+        delivered = [m['id'] for m, result in zip(messages, results) if result['ok']]
+        if delivered:
+            await AsyncOutboxService.mark_sent(delivered)
+            self.delivered += len(delivered)
+
+        for message, result in zip(messages, results):
+            if not result['ok']:
+                await self._handle_failure(message, result['exception'])
+
+        return len(messages)
+
+    async def _handle_failure(self, message: dict, error: Exception):
+        """Решить, повторять ли неудачную отправку"""
+        attempts = message['attempts'] + 1
+
+        if isinstance(error, RetryAfter):
+            delay = retry_after_seconds(error)
+            self._paused_until = max(self._paused_until, time.time() + delay)
+            self.retry_after_pauses += 1
+            print(f"[Outbox] Flood control, pausing queue for {delay:.0f}s")
+            await AsyncOutboxService.reschedule(message['id'], str(error), delay, count_attempt=False)
+            return
+
+        if isinstance(error, (Forbidden, BadRequest)) or attempts >= self.max_attempts:
+            self.failed += 1
+            print(f"[Outbox] Giving up on message {message['id']} ({message['kind']} -> {message['chat_id']}): {error}")
+            await AsyncOutboxService.mark_failed(message['id'], str(error))
+            await self._report_failure(message)
+            return
+
+        delay = backoff_delay(attempts)
+        self.retried += 1
+        print(f"[Outbox] Message {message['id']} failed (attempt {attempts}), retry in {delay:.0f}s: {error}")
+        await AsyncOutboxService.reschedule(message['id'], str(error), delay)
+
+    async def _report_failure(self, message: dict):
+        """Поставить в очередь предупреждение диспетчеру о недоставленном сообщении"""
+        if not message['reply_chat_id'] or message['reply_chat_id'] == message['chat_id']:
+            return
+
+        await AsyncOutboxService.enqueue([{
+            'order_id': message['order_id'],
+            'chat_id': message['reply_chat_id'],
+            'kind': f"undelivered:{message['kind']}:{message['chat_id']}",
+            'text': f"⚠️ Заказ №{message['order_id']}: уведомление НЕ доставлено ({message['kind']})"
+        }])
+
+    async def run(self):
+        """Основной цикл: отправлять, пока есть созревшие сообщения, иначе ждать"""
+        self.running = True
+        self._wake_event = asyncio.Event()
+        print("[Outbox] Worker started")
+
+        while self.running:
+            try:
+                if time.time() - self._last_purge > 3600:
+                    self._last_purge = time.time()
+                    await AsyncOutboxService.purge()
+
+                if await self.process_batch():
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Outbox] Worker error: {e}")
+
+            timeout = self.poll_interval
+            if self._paused_until > time.time():
+                timeout = min(timeout, self._paused_until - time.time())
+
+            try:
+                await asyncio.wait_for(self._wake_event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake_event.clear()
+
+    def stop(self):
+        """Остановить цикл (неотправленные сообщения остаются в outbox)"""
+        self.running = False
+        self.wake()
+
+    def get_stats(self) -> dict:
+        """Счетчики worker с начала работы"""
+        return {
+            'delivered': self.delivered,
+            'retried': self.retried,
+            'failed': self.failed,
+            'retry_after_pauses': self.retry_after_pauses,
+            'paused_for': max(0.0, self._paused_until - time.time())
+        }
+
+
+_worker = OutboxWorker()
+
+
+def get_outbox_worker() -> OutboxWorker:
+    """Общий на бота worker очереди (notification_service задается при старте)"""
+    return _worker
@@ -0,0 +1,82 @@
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.message_processor import MessageProcessor, create_http_clients, OPENROUTER_BASE_URL
+from services.terminology_cache import TerminologyCache
+
+
+class ProcessorRegistry:
+    """Общие на все приложение клиенты OpenRouter и MessageProcessor
+
+    Создается один раз при старте бота (bot.main_async): один keep-alive
+    пул HTTP-соединений, один MessageProcessor и его кэш терминологии
+    живут все время работы бота, поэтому обработка заказа не тратит время
+    на создание клиентов и установку соединения. Кэш терминологии хранится
+    в БД и прогревается при создании реестра (init_db уже должен быть вызван).
+    """
+
+    def __init__(self):
+        self.http_client, self.async_http_client = create_http_clients()
+        self.terminology_cache = TerminologyCache()
+        try:
+            self.terminology_cache.load()
+        except Exception as e:
+            print(f"[Terminology Cache] Warm load failed: {e}")
+        self.message_processor = MessageProcessor(
+            http_client=self.http_client,
+            async_http_client=self.async_http_client,
+            terminology_cache=self.terminology_cache
+        )
+
+    async def warm_up(self, timeout: float = 10.0):
+        """Заранее открыть соединение с OpenRouter (TLS-рукопожатие до первого заказа)
+
+        HEAD-запрос без тела ответа: нужно только соединение, статус не важен.
+        """
+        if not self.message_processor.async_client:
+            return
+
+        try:
+            await asyncio.wait_for(self.async_http_client.head(OPENROUTER_BASE_URL), timeout=timeout)
+            print("[OpenRouter] Connection pool warmed up")
+        except Exception as e:
+            print(f"[OpenRouter] Warm-up failed: {e}")
+
+    async def close(self):
+        """Сохранить счетчики кэша и закрыть пулы соединений"""
+        try:
+            self.terminology_cache.flush()
+        except Exception as e:
+            print(f"[Terminology Cache] Flush failed: {e}")
+        await self.async_http_client.aclose()
+        self.http_client.close()
+
+
+_registry = None
+
+
+def init_processor_registry() -> ProcessorRegistry:
+    """Создать реестр при старте приложения"""
+    global _registry
+    if _registry is None:
+        _registry = ProcessorRegistry()
+    return _registry
+
+
+def get_terminology_cache() -> TerminologyCache:
+    """Общий кэш терминологии"""
+    return init_processor_registry().terminology_cache
+
+
+def get_message_processor() -> MessageProcessor:
+    """Общий MessageProcessor (реестр создается при первом обращении)"""
+    return init_processor_registry().message_processor
+
+
+async def close_processor_registry():
+    """Закрыть реестр при остановке приложения"""
+    global _registry
+    if _registry is not None:
+        await _registry.close()
+        _registry = None
@@ -1,41 +1,92 @@
-from datetime import datetime, timedelta
+from datetime import datetime, date, time, timedelta
 from zoneinfo import ZoneInfo
 import sqlite3
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from database import get_connection
+from database import db_connection
+from services.async_service import AsyncService
+from services.report_service import split_block, MESSAGE_LIMIT
+
+
+MOSCOW = ZoneInfo('Europe/Moscow')
+
+# За сколько дней до срока напоминать (0 - в день сдачи), например "3,1,0"
+REMINDER_OFFSETS = tuple(sorted({int(days) for days in os.getenv('REMINDER_OFFSETS', '1').split(',')}, reverse=True))
+
+# Окно отправки напоминаний по Москве
+REMINDER_WINDOW_START = time.fromisoformat(os.getenv('REMINDER_WINDOW_START', '10:00'))
+REMINDER_WINDOW_END = time.fromisoformat(os.getenv('REMINDER_WINDOW_END', '12:00'))
+
+# На сколько секунд взятые в отправку строки журнала скрываются от других
+# процессов (если процесс упадет во время отправки, они снова станут доступны)
+REMINDER_LEASE = float(os.getenv('REMINDER_LEASE', '120'))
+
+# После скольких неудачных попыток получателю больше не повторять
+# (ошибки сети и 5xx; Forbidden/BadRequest - сразу без повторов)
+REMINDER_MAX_ATTEMPTS = int(os.getenv('REMINDER_MAX_ATTEMPTS', '5'))
+
+
+def reminder_type(days_left: int) -> str:
+    """Вид напоминания в таблице reminders ('today' - исторически "за 1 день")"""
+    return 'today' if days_left == 1 else f'{days_left}d'
+
+
+def reminder_window(day: date) -> tuple:
+    """Начало и конец окна напоминаний дня day (aware datetime по Москве)"""
+    return (datetime.combine(day, REMINDER_WINDOW_START, MOSCOW),
+            datetime.combine(day, REMINDER_WINDOW_END, MOSCOW))
+
+
+def reminder_due_line(order: dict) -> str:
+    """Строка "сколько осталось до срока" для напоминания (пусто, если неизвестно)"""
+    days_left = order.get('days_left')
+    if days_left is None:
+        return ''
+    if days_left == 0:
+        return "⚠️ Срок сдачи СЕГОДНЯ\n"
+    if days_left == 1:
+        return "⚠️ Срок сдачи завтра\n"
+    return f"⚠️ До срока сдачи {days_left} дн.\n"
 
 
 class ReminderService:
     """Сервис для проверки сроков выполнения заказов и отправки напоминаний"""
 
     @staticmethod
-    def get_orders_due_tomorrow():
-        """Получить заказы с дедлайном на завтра (напоминание за 1 день до дедлайна)"""
-        now_moscow = datetime.now(ZoneInfo('Europe/Moscow'))
-        today = now_moscow.strftime('%d.%m.%Y')
-        tomorrow = (now_moscow + timedelta(days=1)).strftime('%d.%m.%Y')
-        print(f"[DEBUG] Today: {today}, Tomorrow (for reminder): {tomorrow}")
-
-        conn = get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            SELECT o.id, o.doctor_id, o.technician_id, t.name as technician_name, d.name as doctor_name,
-                   o.patient_name, o.work_type, o.quantity, o.deadline, o.description, o.photo_id
-            FROM orders o
-            LEFT JOIN users t ON o.technician_id = t.id
-            LEFT JOIN users d ON o.doctor_id = d.id
-            WHERE o.deadline = ? AND o.status = 'in_progress'
-            AND NOT EXISTS (
-                SELECT 1 FROM reminders r WHERE r.order_id = o.id AND r.reminder_type = 'today'
-            )
-        ''', (tomorrow,))
+    def get_due_reminders(today: date = None, offsets: tuple = REMINDER_OFFSETS) -> list:
+        """Заказы, которым сегодня положено напоминание, по всем offsets сразу
 
-        rows = cursor.fetchall()
-        conn.close()
+        Для каждого offset срок сдачи - today + offset дней; все пары
+        (срок, вид напоминания) передаются одним списком VALUES, и запрос
+        проходит по индексу (status, deadline_date) один раз; доставленные
+        отсекаются анти-join по уникальному ключу reminders (order_id,
+        reminder_type). У заказа в ответе есть reminder_type и days_left.
+        """
+        today = today or datetime.now(MOSCOW).date()
+        if not offsets:
+            return []
+
+        due = []
+        for days_left in offsets:
+            due += [(today + timedelta(days=days_left)).isoformat(), reminder_type(days_left), days_left]
+        values = ', '.join(['(?, ?, ?)'] * len(offsets))
+
+        with db_connection() as conn:
+            rows = conn.execute(f'''
+                WITH due (deadline_date, reminder_type, days_left) AS (VALUES {values})
+                SELECT o.id, o.doctor_id, o.technician_id, t.name as technician_name, d.name as doctor_name,
+                       o.patient_name, o.work_type, o.quantity, o.deadline, o.description, o.photo_id,
+                       due.reminder_type, due.days_left
+                FROM due
+                JOIN orders o ON o.status = 'in_progress' AND o.deadline_date = due.deadline_date
+                LEFT JOIN reminders r ON r.order_id = o.id AND r.reminder_type = due.reminder_type
+                LEFT JOIN users t ON o.technician_id = t.id
+                LEFT JOIN users d ON o.doctor_id = d.id
+                WHERE r.order_id IS NULL
+                ORDER BY o.id
+            ''', due).fetchall()
 
         orders = []
         for row in rows:
@@ -50,11 +101,42 @@ class ReminderService:
                 'quantity': row[7],
                 'deadline': row[8],
                 'description': row[9],
-                'photo_id': row[10]
+                'photo_id': row[10],
+                'reminder_type': row[11],
+                'days_left': row[12]
             })
 
         return orders
 
+    @staticmethod
+    def get_orders_due_tomorrow():
+        """Получить заказы с дедлайном на завтра (напоминание за 1 день до дедлайна)"""
+        today = datetime.now(MOSCOW).date()
+        print(f"[DEBUG] Today: {today}, Tomorrow (for reminder): {today + timedelta(days=1)}")
+        return ReminderService.get_due_reminders(today, offsets=(1,))
+
+    @staticmethod
+    def next_reminder_day(today: date = None, offsets: tuple = REMINDER_OFFSETS):
+        """Ближайший день после today, когда кому-то положено напоминание (или None)
+
+        Для каждого offset - один поиск минимального срока по индексу
+        (status, deadline_date), без просмотра заказов.
+        """
+        today = today or datetime.now(MOSCOW).date()
+        days = []
+
+        with db_connection() as conn:
+            for days_left in offsets:
+                first = (today + timedelta(days=days_left + 1)).isoformat()
+                deadline = conn.execute('''
+                    SELECT MIN(deadline_date) FROM orders
+                    WHERE status = 'in_progress' AND deadline_date >= ?
+                ''', (first,)).fetchone()[0]
+                if deadline:
+                    days.append(date.fromisoformat(deadline) - timedelta(days=days_left))
+
+        return min(days, default=None)
+
     @staticmethod
     def format_reminder_message(order: dict) -> str:
         """Форматирование сообщения напоминания"""
@@ -66,25 +148,171 @@ class ReminderService:
             f"🔨 Вид работы: {order.get('work_type', 'Не указано')}\n"
             f"📊 Количество: {order.get('quantity', 0)} шт\n"
             f"📅 Срок выполнения: {order.get('deadline', 'Не указан')}\n"
+            f"{reminder_due_line(order)}"
         )
 
         return message
 
     @staticmethod
-    def mark_reminder_sent(order_id: int, reminder_type: str = 'today'):
-        """Отметить напоминание как отправленное"""
-        conn = get_connection()
-        cursor = conn.cursor()
+    def reminder_digest(orders: list, for_admin: bool = False, limit: int = MESSAGE_LIMIT) -> list:
+        """Одно напоминание на получателя: [(текст страницы, [(order_id, reminder_type)] на ней)]
+
+        Технику - его заказы, администратору - все (с техником), ближайшие
+        сроки первыми. Текст делится на страницы по лимиту Telegram, заказ не
+        разрывается; по спискам заказов результат отправки каждой страницы
+        относится только к ее заказам.
+        """
+        orders = sorted(orders, key=lambda order: (order.get('days_left', 0), order['id']))
+        blocks = [(None, f"⏰ НАПОМИНАНИЕ О СРОКАХ ВЫПОЛНЕНИЯ!\n📋 Заказов: {len(orders)}\n\n")]
 
+        for order in orders:
+            block = (
+                f"📋 Заказ №{order['id']}\n"
+                f"👤 Пациент: {order.get('patient_name') or 'Не указан'}\n"
+                f"👨‍⚕️ Врач: {order.get('doctor_name') or 'Не указан'}\n"
+            )
+            if for_admin:
+                block += f"🔧 Техник: {order.get('technician_name') or 'Не указан'}\n"
+            block += (
+                f"🔨 Вид работы: {order.get('work_type', 'Не указано')}\n"
+                f"📊 Количество: {order.get('quantity', 0)} шт\n"
+                f"📅 Срок выполнения: {order.get('deadline', 'Не указан')}\n"
+                f"{reminder_due_line(order)}\n"
+            )
+            blocks.append(((order['id'], order.get('reminder_type')), block))
+
+        # как paginate, но с учетом, какие заказы попали на страницу
+        pages = []
+        page, keys = '', []
+        for key, block in blocks:
+            for part in split_block(block, limit):
+                if page and len(page) + len(part) > limit:
+                    pages.append((page, keys))
+                    page, keys = '', []
+                page += part
+                if key is not None and key not in keys:
+                    keys.append(key)
+        if page:
+            pages.append((page, keys))
+
+        return [(text.rstrip('\n'), keys) for text, keys in pages]
+
+    @staticmethod
+    def reminder_digest_pages(orders: list, for_admin: bool = False, limit: int = MESSAGE_LIMIT) -> list:
+        """Страницы напоминания получателю (текст, см. reminder_digest)"""
+        return [text for text, _ in ReminderService.reminder_digest(orders, for_admin, limit)]
+
+    @staticmethod
+    def claim_deliveries(deliveries: list, lease: float = REMINDER_LEASE) -> list:
+        """Взять в отправку строки журнала, которые еще не доставлены
+
+        deliveries - [(order_id, reminder_type, recipient, role)], recipient -
+        chat_id получателя. Новые строки добавляются (pending) одной пачкой,
+        уже известные не меняются. Возвращаются ключи (order_id,
+        reminder_type, recipient), которые не доставлены, не отклонены
+        (rejected) и не взяты другим процессом; они скрываются на lease секунд. Все - одна транзакция
+        BEGIN IMMEDIATE, поэтому два процесса не возьмут один ключ.
+        """
+        if not deliveries:
+            return []
+        now = datetime.now().timestamp()
+
+        with db_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('''
+                INSERT INTO reminder_deliveries (order_id, reminder_type, recipient, role, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (order_id, reminder_type, recipient) DO NOTHING
+            ''', [(*delivery, now) for delivery in deliveries])
+
+            claimed = []
+            for order_id, kind, recipient, _ in deliveries:
+                cursor = conn.execute('''
+                    UPDATE reminder_deliveries SET claimed_until = ?
+                    WHERE order_id = ? AND reminder_type = ? AND recipient = ?
+                    AND status NOT IN ('sent', 'rejected') AND claimed_until <= ?
+                ''', (now + lease, order_id, kind, recipient, now))
+                if cursor.rowcount:
+                    claimed.append((order_id, kind, recipient))
+
+        return claimed
+
+    @staticmethod
+    def record_deliveries(deliveries: list, results: dict, permanent=(),
+                          max_attempts: int = REMINDER_MAX_ATTEMPTS) -> list:
+        """Записать результаты отправки и отметить заказы, обработанные для всех
+
+        results - {(order_id, reminder_type, recipient): None или текст ошибки},
+        permanent - ключи, ошибка которых не исправится повтором (получатель
+        заблокировал бота, некорректный запрос). Доставленные строки - sent,
+        неудачные - failed с attempts + 1 (их снова возьмет claim_deliveries),
+        а постоянные ошибки и исчерпавшие max_attempts - rejected, без
+        повторов. Заказ попадает в reminders, когда все его текущие получатели
+        из deliveries в статусе sent или rejected. Одна транзакция.
+        Возвращает [(order_id, reminder_type)] завершенных.
+        """
+        now = datetime.now().timestamp()
+        permanent = set(permanent)
+        sent = [(now, *key) for key, error in results.items() if error is None]
+        failed = [(key in permanent, max_attempts, error, *key) for key, error in results.items() if error is not None]
+
+        with db_connection() as conn:
+            conn.executemany('''
+                UPDATE reminder_deliveries
+                SET status = 'sent', sent_at = ?, attempts = attempts + 1, claimed_until = 0, last_error = NULL
+                WHERE order_id = ? AND reminder_type = ? AND recipient = ?
+            ''', sent)
+            conn.executemany('''
+                UPDATE reminder_deliveries
+                SET status = CASE WHEN ? OR attempts + 1 >= ? THEN 'rejected' ELSE 'failed' END,
+                    attempts = attempts + 1, claimed_until = 0, last_error = ?
+                WHERE order_id = ? AND reminder_type = ? AND recipient = ?
+            ''', failed)
+
+            order_ids = list({delivery[0] for delivery in deliveries})
+            handled = set()
+            if order_ids:
+                handled = set(conn.execute(f'''
+                    SELECT order_id, reminder_type, recipient FROM reminder_deliveries
+                    WHERE order_id IN ({', '.join('?' * len(order_ids))}) AND status IN ('sent', 'rejected')
+                ''', order_ids).fetchall())
+
+            pending = {(order_id, kind) for order_id, kind, recipient, _ in deliveries
+                       if (order_id, kind, recipient) not in handled}
+            completed = sorted({(order_id, kind) for order_id, kind, _, _ in deliveries} - pending)
+            ReminderService._insert_reminders(conn, completed)
+
+        return completed
+
+    @staticmethod
+    def get_delivery_stats() -> dict:
+        """Строки журнала напоминаний по статусам"""
+        with db_connection() as conn:
+            return dict(conn.execute('SELECT status, COUNT(*) FROM reminder_deliveries GROUP BY status').fetchall())
+
+    @staticmethod
+    def _insert_reminders(conn: sqlite3.Connection, reminders: list):
+        conn.executemany('''
+            INSERT INTO reminders (order_id, reminder_type)
+            VALUES (?, ?)
+            ON CONFLICT (order_id, reminder_type) DO NOTHING
+        ''', reminders)
+
+    @staticmethod
+    def mark_reminders_sent(reminders: list) -> int:
+        """Отметить пачку напоминаний [(order_id, reminder_type)] одной транзакцией"""
+        with db_connection() as conn:
+            ReminderService._insert_reminders(conn, reminders)
+        return len(reminders)
+
+    @staticmethod
+    def mark_reminder_sent(order_id: int, reminder_type: str = 'today'):
+        """Отметить напоминание как отправленное (повторная отметка ничего не меняет)"""
         try:
-            cursor.execute('''
-                INSERT INTO reminders (order_id, reminder_type)
-                VALUES (?, ?)
-            ''', (order_id, reminder_type))
-            conn.commit()
+            ReminderService.mark_reminders_sent([(order_id, reminder_type)])
             return True
         except Exception as e:
             print(f"Ошибка отметки напоминания: {e}")
             return False
-        finally:
-            conn.close()
+
+AsyncReminderService = AsyncService(ReminderService, passthrough=('format_reminder_message', 'reminder_digest', 'reminder_digest_pages'))
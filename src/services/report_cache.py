@@ -0,0 +1,169 @@
+import os
+import sys
+import time
+import secrets
+import threading
+from collections import OrderedDict
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+
+# Срок жизни отчета в кэше (страховка от записей в обход invalidate) и размер кэша
+REPORT_CACHE_TTL = float(os.getenv('REPORT_CACHE_TTL', '600'))
+REPORT_CACHE_SIZE = int(os.getenv('REPORT_CACHE_SIZE', '64'))
+
+# Сколько хранятся страницы отправленных отчетов для листания
+REPORT_SNAPSHOT_TTL = float(os.getenv('REPORT_SNAPSHOT_TTL', '3600'))
+REPORT_SNAPSHOT_SIZE = int(os.getenv('REPORT_SNAPSHOT_SIZE', '200'))
+
+
+class ReportCache:
+    """Кэш готовых отчетов по ключу (вид отчета, период)
+
+    Хранит готовые страницы текста отчета вместе со временем его
+    построения. Запись заказа сбрасывает только отчеты, в период
+    которых попадает день заказа (и отчеты за все время): отчеты за
+    прошлые месяцы остаются в кэше. Изменение пользователей сбрасывает
+    все (в отчетах их имена). TTL - страховка на случай записей в БД
+    другими процессами. Кэш привязан к database.DB_PATH, как UserDirectory.
+    """
+
+    def __init__(self, ttl: float = REPORT_CACHE_TTL, max_size: int = REPORT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._invalidated = 0
+        self._build_time = 0.0
+        self._time_saved = 0.0
+
+    def lookup(self, kind: str, start_date_sql: str, end_date_sql: str):
+        """(отчет или None, версия кэша) - версию передать в store() после построения"""
+        key = (database.DB_PATH, kind, start_date_sql, end_date_sql)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry['created_at'] > self.ttl:
+                del self._entries[key]
+                self._expired += 1
+                entry = None
+
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                self._time_saved += entry['build_time']
+                return entry['value'], self._version
+
+            self._misses += 1
+            return None, self._version
+
+    def store(self, kind: str, start_date_sql: str, end_date_sql: str, value, version: int, build_time: float = 0.0):
+        """Сохранить отчет, построенный при версии version"""
+        key = (database.DB_PATH, kind, start_date_sql, end_date_sql)
+
+        with self._lock:
+            self._build_time += build_time
+            # за время построения заказы могли измениться - такой отчет не сохраняем
+            if version != self._version:
+                return
+            self._entries[key] = {'value': value, 'created_at': time.time(), 'build_time': build_time}
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, kind: str, start_date_sql: str, end_date_sql: str, build):
+        """Отчет из кэша или построенный build() (границы периода - ГГГГ-ММ-ДД или None)"""
+        value, version = self.lookup(kind, start_date_sql, end_date_sql)
+        if value is not None:
+            return value
+
+        started = time.perf_counter()
+        value = build()
+        self.store(kind, start_date_sql, end_date_sql, value, version, time.perf_counter() - started)
+        return value
+
+    def invalidate(self, day: str = None) -> int:
+        """Сбросить отчеты, в период которых входит day (ГГГГ-ММ-ДД), или все"""
+        with self._lock:
+            self._version += 1
+            stale = [
+                key for key in self._entries
+                if day is None or ((key[2] is None or key[2] <= day) and (key[3] is None or day <= key[3]))
+            ]
+            for key in stale:
+                del self._entries[key]
+            self._invalidated += len(stale)
+            return len(stale)
+
+    def get_stats(self) -> dict:
+        """Попадания, промахи, сброшенные записи и сэкономленное время"""
+        with self._lock:
+            requests = self._hits + self._misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / requests if requests else 0.0,
+                'expired': self._expired,
+                'invalidated': self._invalidated,
+                'avg_build_time': self._build_time / self._misses if self._misses else 0.0,
+                'time_saved': self._time_saved
+            }
+
+
+class ReportSnapshots:
+    """Страницы отправленных отчетов для кнопок ◀️/▶️
+
+    Листание показывает тот же снимок отчета, что был отправлен, даже если
+    кэш отчетов уже сброшен новыми заказами. Снимок доступен только в том
+    чате, куда ушел отчет, и живет REPORT_SNAPSHOT_TTL секунд.
+    """
+
+    def __init__(self, ttl: float = REPORT_SNAPSHOT_TTL, max_size: int = REPORT_SNAPSHOT_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def save(self, chat_id: int, pages: list) -> str:
+        """Запомнить страницы отчета, вернуть токен для callback_data"""
+        token = secrets.token_urlsafe(6)
+        with self._lock:
+            self._snapshots[token] = {'chat_id': chat_id, 'pages': list(pages), 'created_at': time.time()}
+            while len(self._snapshots) > self.max_size:
+                self._snapshots.popitem(last=False)
+        return token
+
+    def get(self, token: str, chat_id: int):
+        """Страницы снимка или None, если он устарел или из другого чата"""
+        with self._lock:
+            snapshot = self._snapshots.get(token)
+            if snapshot is None:
+                return None
+            if time.time() - snapshot['created_at'] > self.ttl:
+                del self._snapshots[token]
+                return None
+            if snapshot['chat_id'] != chat_id:
+                return None
+            return snapshot['pages']
+
+
+_cache = ReportCache()
+
+
+def get_report_cache() -> ReportCache:
+    """Общий на бота кэш отчетов"""
+    return _cache
+
+
+_snapshots = ReportSnapshots()
+
+
+def get_report_snapshots() -> ReportSnapshots:
+    """Общее на бота хранилище страниц отправленных отчетов"""
+    return _snapshots
@@ -1,9 +1,17 @@
-from datetime import datetime, timedelta
+from datetime import datetime
+from itertools import chain
 import sqlite3
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from database import get_connection
+from database import db_connection
+from migrations import rebuild_rollups
+from services.async_service import AsyncService
+from services.report_cache import get_report_cache
+
+
+# Максимальная длина сообщения Telegram
+MESSAGE_LIMIT = 4096
 
 
 def convert_date_format(date_str):
@@ -15,157 +23,234 @@ def convert_date_format(date_str):
         return None
 
 
-class ReportService:
-    """Сервис для сбора статистики и формирования отчетов"""
-
-    @staticmethod
-    def get_doctor_statistics(start_date=None, end_date=None):
-        """Получить статистику по врачам"""
-        conn = get_connection()
-        cursor = conn.cursor()
-
-        base_query = '''
-            FROM orders o
-            JOIN users u ON o.doctor_id = u.id
-            WHERE o.status = 'in_progress'
-        '''
+def day_filter(start_date, end_date, column='s.day'):
+    """Условие по дню создания заказа (таблица итогов order_daily_stats) и его параметры"""
+    clause = ''
+    params = []
+
+    start_date_sql = convert_date_format(start_date) if start_date else None
+    if start_date_sql:
+        clause += f' AND {column} >= ?'
+        params.append(start_date_sql)
+
+    end_date_sql = convert_date_format(end_date) if end_date else None
+    if end_date_sql:
+        clause += f' AND {column} <= ?'
+        params.append(end_date_sql)
+
+    return clause, params
+
+
+def group_by_name(rows, with_quantity=False):
+    """Строки (имя, вид работ, заказов[, единиц]), упорядоченные по имени -> записи сотрудников
+
+    Генератор: запись отдается, как только начинается следующее имя, поэтому
+    курсор читается потоком и в памяти одна запись. Сотрудники с
+    одинаковым именем объединяются в одну запись.
+    """
+    current = None
+    for row in rows:
+        name = row[0]
+        if current is None or current['name'] != name:
+            if current is not None:
+                yield current
+            current = {'name': name, 'work_types': []}
+
+        work_type = {'work_type': row[1], 'order_count': row[2]}
+        if with_quantity:
+            work_type['total_quantity'] = row[3] or 0
+        current['work_types'].append(work_type)
+
+    if current is not None:
+        yield current
+
+
+def split_block(block, limit=MESSAGE_LIMIT):
+    """Блок длиннее limit -> части по строкам (строка длиннее limit режется)"""
+    if len(block) <= limit:
+        yield block
+        return
+
+    part = ''
+    for line in block.splitlines(keepends=True):
+        while len(line) > limit:
+            if part:
+                yield part
+                part = ''
+            yield line[:limit]
+            line = line[limit:]
+        if len(part) + len(line) > limit:
+            yield part
+            part = ''
+        part += line
+    if part:
+        yield part
+
+
+def paginate(blocks, limit=MESSAGE_LIMIT):
+    """Блоки текста -> страницы не длиннее limit; блок целиком на одной странице, если помещается"""
+    page = ''
+    for block in blocks:
+        for part in split_block(block, limit):
+            if page and len(page) + len(part) > limit:
+                yield page
+                page = ''
+            page += part
+    if page:
+        yield page
+
+
+def report_header(title, period):
+    header = f"📊 {title}\n\n"
+    if period:
+        header += f"📅 Период: {period}\n\n"
+    return header
+
+
+def doctor_report_blocks(stats, period=None):
+    """Отчет по врачам блоками: заголовок, врач за врачом, итог (stats - список или генератор)"""
+    yield report_header("ОТЧЕТ ПО ВРАЧАМ", period)
+
+    total_orders = 0
+    doctors = 0
+
+    for doc in stats:
+        doctors += 1
+        total_orders += sum(wt['order_count'] for wt in doc['work_types'])
+
+        block = f"👨‍⚕️ {doc['name']}\n"
+        if doc['work_types']:
+            block += "   Виды работ:\n"
+            for i, wt in enumerate(doc['work_types'], 1):
+                block += f"   {i}. {wt['work_type']} ({wt['order_count']} заказ)\n"
+        else:
+            block += "   ❌ Нет работ\n"
+        yield block + "\n"
+
+    if not doctors:
+        yield "❌ Нет данных за указанный период"
+        return
+
+    yield f"📋 Всего заказов: {total_orders}\n"
+
+
+def technician_report_blocks(stats, period=None):
+    """Отчет по техникам блоками: заголовок, техник за техником, итог"""
+    yield report_header("ОТЧЕТ ПО ТЕХНИКАМ", period)
+
+    total_orders = 0
+    total_quantity = 0
+    technicians = 0
+
+    for tech in stats:
+        technicians += 1
+        total_orders += sum(wt['order_count'] for wt in tech['work_types'])
+        total_quantity += sum(wt['total_quantity'] for wt in tech['work_types'])
+
+        block = f"👤 {tech['name']}\n"
+        if tech['work_types']:
+            block += "   Виды работ:\n"
+            for i, wt in enumerate(tech['work_types'], 1):
+                block += f"   {i}. {wt['work_type']} ({wt['order_count']} заказ, {wt['total_quantity']} шт)\n"
+        else:
+            block += "   ❌ Нет работ\n"
+        yield block + "\n"
+
+    if not technicians:
+        yield "❌ Нет данных за указанный период"
+        return
+
+    yield f"📋 Всего заказов: {total_orders}\n📊 Всего единиц: {total_quantity}\n"
+
+
+def work_type_report_blocks(stats, period=None):
+    """Отчет по видам работ блоками (итоги идут в начале, поэтому stats - список)"""
+    header = report_header("ОТЧЕТ ПО ВИДАМ РАБОТ", period)
+
+    if not stats:
+        yield header + "❌ Нет данных за указанный период"
+        return
+
+    total_orders = sum(s['order_count'] for s in stats)
+    total_quantity = sum(s['total_quantity'] for s in stats)
+    yield header + f"📋 Всего заказов: {total_orders}\n📊 Всего единиц: {total_quantity}\n\n"
+
+    for i, stat in enumerate(stats, 1):
+        yield (
+            f"{i}. {stat['work_type']}\n"
+            f"   📦 Заказов: {stat['order_count']}\n"
+            f"   📊 Единиц: {stat['total_quantity']}\n\n"
+        )
 
-        params = []
-        where_clause = base_query
 
-        if start_date:
-            start_date_sql = convert_date_format(start_date)
-            if start_date_sql:
-                where_clause += ' AND DATE(o.created_at) >= ?'
-                params.append(start_date_sql)
+def doctor_statistics_query(start_date=None, end_date=None):
+    """Запрос статистики по врачам: строки (имя, вид работ, заказов) по имени"""
+    date_clause, params = day_filter(start_date, end_date)
+    return f'''
+        SELECT u.name, s.work_type, SUM(s.order_count) as order_count
+        FROM order_daily_stats s
+        JOIN users u ON s.doctor_id = u.id
+        WHERE s.status = 'in_progress'
+        {date_clause}
+        GROUP BY u.id, s.work_type
+        ORDER BY u.name, s.work_type
+    ''', params
+
+
+def technician_statistics_query(start_date=None, end_date=None):
+    """Запрос статистики по техникам: строки (имя, вид работ, заказов, единиц) по имени"""
+    date_clause, params = day_filter(start_date, end_date)
+    return f'''
+        SELECT u.name, s.work_type, SUM(s.order_count) as order_count, SUM(s.total_quantity) as total_quantity
+        FROM order_daily_stats s
+        JOIN users u ON s.technician_id = u.id
+        WHERE s.status = 'in_progress'
+        {date_clause}
+        GROUP BY u.id, s.work_type
+        ORDER BY u.name, s.work_type
+    ''', params
 
-        if end_date:
-            end_date_sql = convert_date_format(end_date)
-            if end_date_sql:
-                where_clause += ' AND DATE(o.created_at) <= ?'
-                params.append(end_date_sql)
 
-        query = f'''
-            SELECT u.name, o.work_type, COUNT(o.id) as order_count
-            {where_clause}
-            GROUP BY u.id, o.work_type
-            ORDER BY u.name, o.work_type
-        '''
+class ReportService:
+    """Сервис для сбора статистики и формирования отчетов
 
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        conn.close()
+    Статистика читается из дневных итогов order_daily_stats (см. миграцию 7
+    в migrations.py), которые триггеры обновляют при каждой записи в orders.
+    Отчет за период проходит только по дням периода, а не по всей истории.
+    """
 
-        doc_data = {}
-        for row in rows:
-            name = row[0]
-            work_type = row[1]
-            order_count = row[2]
-
-            if name not in doc_data:
-                doc_data[name] = {
-                    'name': name,
-                    'work_types': []
-                }
-
-            doc_data[name]['work_types'].append({
-                'work_type': work_type,
-                'order_count': order_count
-            })
+    @staticmethod
+    def get_doctor_statistics(start_date=None, end_date=None):
+        """Получить статистику по врачам"""
+        query, params = doctor_statistics_query(start_date, end_date)
 
-        return list(doc_data.values())
+        with db_connection() as conn:
+            return list(group_by_name(conn.execute(query, params)))
 
     @staticmethod
     def get_technician_statistics(start_date=None, end_date=None):
         """Получить статистику по техникам"""
-        conn = get_connection()
-        cursor = conn.cursor()
-
-        base_query = '''
-            FROM orders o
-            JOIN users u ON o.technician_id = u.id
-            WHERE o.status = 'in_progress'
-        '''
-
-        params = []
-        where_clause = base_query
-
-        if start_date:
-            start_date_sql = convert_date_format(start_date)
-            if start_date_sql:
-                where_clause += ' AND DATE(o.created_at) >= ?'
-                params.append(start_date_sql)
-
-        if end_date:
-            end_date_sql = convert_date_format(end_date)
-            if end_date_sql:
-                where_clause += ' AND DATE(o.created_at) <= ?'
-                params.append(end_date_sql)
-
-        query = f'''
-            SELECT u.name, o.work_type, COUNT(o.id) as order_count, SUM(o.quantity) as total_quantity
-            {where_clause}
-            GROUP BY u.id, o.work_type
-            ORDER BY u.name, o.work_type
-        '''
-
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        conn.close()
+        query, params = technician_statistics_query(start_date, end_date)
 
-        tech_data = {}
-        for row in rows:
-            name = row[0]
-            work_type = row[1]
-            order_count = row[2]
-            total_quantity = row[3] or 0
-
-            if name not in tech_data:
-                tech_data[name] = {
-                    'name': name,
-                    'work_types': []
-                }
-
-            tech_data[name]['work_types'].append({
-                'work_type': work_type,
-                'order_count': order_count,
-                'total_quantity': total_quantity
-            })
-
-        return list(tech_data.values())
+        with db_connection() as conn:
+            return list(group_by_name(conn.execute(query, params), with_quantity=True))
 
     @staticmethod
     def get_work_type_statistics(start_date=None, end_date=None):
         """Получить статистику по видам работ"""
-        conn = get_connection()
-        cursor = conn.cursor()
+        date_clause, params = day_filter(start_date, end_date, 'day')
 
-        query = '''
-            SELECT work_type, COUNT(*) as order_count,
-                   SUM(quantity) as total_quantity
-            FROM orders
+        query = f'''
+            SELECT work_type, SUM(order_count) as order_count,
+                   SUM(total_quantity) as total_quantity
+            FROM order_daily_stats
             WHERE status = 'in_progress'
+            {date_clause}
+            GROUP BY work_type ORDER BY order_count DESC
         '''
 
-        params = []
-
-        if start_date:
-            start_date_sql = convert_date_format(start_date)
-            if start_date_sql:
-                query += ' AND DATE(created_at) >= ?'
-                params.append(start_date_sql)
-
-        if end_date:
-            end_date_sql = convert_date_format(end_date)
-            if end_date_sql:
-                query += ' AND DATE(created_at) <= ?'
-                params.append(end_date_sql)
-
-        query += ' GROUP BY work_type ORDER BY order_count DESC'
-
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        conn.close()
+        with db_connection() as conn:
+            rows = conn.execute(query, params).fetchall()
 
         stats = []
         for row in rows:
@@ -180,9 +265,6 @@ class ReportService:
     @staticmethod
     def get_period_statistics(start_date, end_date):
         """Получить общую статистику за период"""
-        conn = get_connection()
-        cursor = conn.cursor()
-
         start_date_sql = convert_date_format(start_date)
         end_date_sql = convert_date_format(end_date)
 
@@ -194,16 +276,16 @@ class ReportService:
                 'total_technicians': 0
             }
 
-        cursor.execute('''
-            SELECT COUNT(*), SUM(quantity), COUNT(DISTINCT doctor_id), COUNT(DISTINCT technician_id)
-            FROM orders
-            WHERE status = 'in_progress'
-            AND DATE(created_at) >= ?
-            AND DATE(created_at) <= ?
-        ''', (start_date_sql, end_date_sql))
-
-        row = cursor.fetchone()
-        conn.close()
+        # 0 - заказ без врача (техника), такие не считаются
+        with db_connection() as conn:
+            row = conn.execute('''
+                SELECT SUM(order_count), SUM(total_quantity),
+                       COUNT(DISTINCT NULLIF(doctor_id, 0)), COUNT(DISTINCT NULLIF(technician_id, 0))
+                FROM order_daily_stats
+                WHERE status = 'in_progress'
+                AND day >= ?
+                AND day <= ?
+            ''', (start_date_sql, end_date_sql)).fetchone()
 
         return {
             'total_orders': row[0] or 0,
@@ -213,101 +295,164 @@ class ReportService:
         }
 
     @staticmethod
-    def format_doctor_report(stats, period=None):
-        """Форматировать отчет по врачам"""
-        message = "📊 ОТЧЕТ ПО ВРАЧАМ\n\n"
+    def get_period_report(start_date, end_date):
+        """Все четыре раздела отчета за период за один проход
+
+        Один запрос по итогам периода, сгруппированным по врачу, технику и
+        виду работ; разделы (общий, по врачам, по техникам, по видам работ)
+        собираются из одного курсора. Результаты совпадают с
+        get_period_statistics, get_doctor_statistics, get_technician_statistics
+        и get_work_type_statistics за тот же период.
+        """
+        period_stats = {
+            'total_orders': 0,
+            'total_quantity': 0,
+            'total_doctors': 0,
+            'total_technicians': 0
+        }
+        report = {'period': period_stats, 'doctors': [], 'technicians': [], 'work_types': []}
 
-        if period:
-            message += f"📅 Период: {period}\n\n"
+        start_date_sql = convert_date_format(start_date)
+        end_date_sql = convert_date_format(end_date)
+        if not start_date_sql or not end_date_sql:
+            return report
+
+        doctors = {}
+        technicians = {}
+        work_types = {}
+        doctor_ids = set()
+        technician_ids = set()
+
+        with db_connection() as conn:
+            cursor = conn.execute('''
+                SELECT s.doctor_id, d.name, s.technician_id, t.name, s.work_type,
+                       SUM(s.order_count), SUM(s.total_quantity)
+                FROM order_daily_stats s
+                LEFT JOIN users d ON s.doctor_id = d.id
+                LEFT JOIN users t ON s.technician_id = t.id
+                WHERE s.status = 'in_progress' AND s.day >= ? AND s.day <= ?
+                GROUP BY s.doctor_id, s.technician_id, s.work_type
+            ''', (start_date_sql, end_date_sql))
+
+            for doctor_id, doctor_name, technician_id, technician_name, work_type, order_count, quantity in cursor:
+                quantity = quantity or 0
+                period_stats['total_orders'] += order_count
+                period_stats['total_quantity'] += quantity
+
+                # 0 - заказ без врача (техника)
+                if doctor_id:
+                    doctor_ids.add(doctor_id)
+                if technician_id:
+                    technician_ids.add(technician_id)
+
+                if doctor_name is not None:
+                    key = (doctor_name, work_type, doctor_id)
+                    doctors[key] = doctors.get(key, 0) + order_count
+
+                if technician_name is not None:
+                    counts = technicians.setdefault((technician_name, work_type, technician_id), [0, 0])
+                    counts[0] += order_count
+                    counts[1] += quantity
+
+                counts = work_types.setdefault(work_type, [0, 0])
+                counts[0] += order_count
+                counts[1] += quantity
+
+        period_stats['total_doctors'] = len(doctor_ids)
+        period_stats['total_technicians'] = len(technician_ids)
+
+        # порядок и группировка как в отдельных запросах (ORDER BY имя, вид работ):
+        # сотрудники с одинаковым именем попадают в одну запись
+        doctor_data = {}
+        for (name, work_type, _), order_count in sorted(doctors.items()):
+            doctor_data.setdefault(name, {'name': name, 'work_types': []})['work_types'].append(
+                {'work_type': work_type, 'order_count': order_count}
+            )
+        report['doctors'] = list(doctor_data.values())
 
-        if not stats:
-            message += "❌ Нет данных за указанный период"
-            return message
+        technician_data = {}
+        for (name, work_type, _), (order_count, quantity) in sorted(technicians.items()):
+            technician_data.setdefault(name, {'name': name, 'work_types': []})['work_types'].append(
+                {'work_type': work_type, 'order_count': order_count, 'total_quantity': quantity}
+            )
+        report['technicians'] = list(technician_data.values())
 
-        total_orders = 0
+        report['work_types'] = [
+            {'work_type': work_type, 'order_count': order_count, 'total_quantity': quantity}
+            for work_type, (order_count, quantity) in sorted(work_types.items(), key=lambda item: (-item[1][0], item[0]))
+        ]
 
-        for doc in stats:
-            doc_orders = sum(wt['order_count'] for wt in doc['work_types'])
-            total_orders += doc_orders
+        return report
 
-            message += f"👨‍⚕️ {doc['name']}\n"
+    @staticmethod
+    def iter_report_pages(kind, start_date=None, end_date=None):
+        """Страницы отчета вида kind (не длиннее MESSAGE_LIMIT) по мере готовности
+
+        kind: 'doctors', 'technicians', 'work_types' - один раздел (без дат -
+        за все время), 'period' - все четыре раздела за период, каждый с
+        новой страницы. Разделы по врачам и техникам читаются из курсора
+        потоком: первая страница готова до того, как прочитан весь результат.
+        """
+        period = f"{start_date} - {end_date}" if start_date and end_date else None
+
+        if kind == 'doctors':
+            query, params = doctor_statistics_query(start_date, end_date)
+            with db_connection() as conn:
+                yield from paginate(doctor_report_blocks(group_by_name(conn.execute(query, params)), period))
+        elif kind == 'technicians':
+            query, params = technician_statistics_query(start_date, end_date)
+            with db_connection() as conn:
+                rows = conn.execute(query, params)
+                yield from paginate(technician_report_blocks(group_by_name(rows, with_quantity=True), period))
+        elif kind == 'work_types':
+            stats = ReportService.get_work_type_statistics(start_date, end_date)
+            yield from paginate(work_type_report_blocks(stats, period))
+        elif kind == 'period':
+            report = ReportService.get_period_report(start_date, end_date)
+            yield from chain(
+                paginate([ReportService.format_period_report(report['period'], period)]),
+                paginate(doctor_report_blocks(report['doctors'], period)),
+                paginate(technician_report_blocks(report['technicians'], period)),
+                paginate(work_type_report_blocks(report['work_types'], period))
+            )
+        else:
+            raise ValueError(f"Unknown report kind: {kind}")
 
-            if doc['work_types']:
-                message += "   Виды работ:\n"
-                for i, wt in enumerate(doc['work_types'], 1):
-                    message += f"   {i}. {wt['work_type']} ({wt['order_count']} заказ)\n"
-            else:
-                message += "   ❌ Нет работ\n"
+    @staticmethod
+    def get_report(kind, start_date=None, end_date=None):
+        """Все страницы отчета вида kind через кэш отчетов (см. iter_report_pages)"""
+        start_date_sql = convert_date_format(start_date) if start_date else None
+        end_date_sql = convert_date_format(end_date) if end_date else None
 
-            message += "\n"
+        def build():
+            return list(ReportService.iter_report_pages(kind, start_date, end_date))
 
-        message += f"📋 Всего заказов: {total_orders}\n"
+        return list(get_report_cache().get(kind, start_date_sql, end_date_sql, build))
 
-        return message
+    @staticmethod
+    def rebuild_rollups():
+        """Пересчитать дневные итоги с нуля (если orders меняли в обход триггеров)"""
+        with db_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = rebuild_rollups(conn)
+        get_report_cache().invalidate()
+        print(f"[Reports] Rebuilt order_daily_stats: {rows} rows")
+        return rows
+
+    @staticmethod
+    def format_doctor_report(stats, period=None):
+        """Форматировать отчет по врачам"""
+        return ''.join(doctor_report_blocks(stats, period))
 
     @staticmethod
     def format_technician_report(stats, period=None):
         """Форматировать отчет по техникам"""
-        message = "📊 ОТЧЕТ ПО ТЕХНИКАМ\n\n"
-
-        if period:
-            message += f"📅 Период: {period}\n\n"
-
-        if not stats:
-            message += "❌ Нет данных за указанный период"
-            return message
-
-        total_orders = 0
-        total_quantity = 0
-
-        for tech in stats:
-            tech_orders = sum(wt['order_count'] for wt in tech['work_types'])
-            tech_quantity = sum(wt['total_quantity'] for wt in tech['work_types'])
-            total_orders += tech_orders
-            total_quantity += tech_quantity
-
-            message += f"👤 {tech['name']}\n"
-
-            if tech['work_types']:
-                message += "   Виды работ:\n"
-                for i, wt in enumerate(tech['work_types'], 1):
-                    message += f"   {i}. {wt['work_type']} ({wt['order_count']} заказ, {wt['total_quantity']} шт)\n"
-            else:
-                message += "   ❌ Нет работ\n"
-
-            message += "\n"
-
-        message += f"📋 Всего заказов: {total_orders}\n"
-        message += f"📊 Всего единиц: {total_quantity}\n"
-
-        return message
+        return ''.join(technician_report_blocks(stats, period))
 
     @staticmethod
     def format_work_type_report(stats, period=None):
         """Форматировать отчет по видам работ"""
-        message = "📊 ОТЧЕТ ПО ВИДАМ РАБОТ\n\n"
-
-        if period:
-            message += f"📅 Период: {period}\n\n"
-
-        if not stats:
-            message += "❌ Нет данных за указанный период"
-            return message
-
-        total_orders = sum(s['order_count'] for s in stats)
-        total_quantity = sum(s['total_quantity'] for s in stats)
-
-        message += f"📋 Всего заказов: {total_orders}\n"
-        message += f"📊 Всего единиц: {total_quantity}\n\n"
-
-        for i, stat in enumerate(stats, 1):
-            message += (
-                f"{i}. {stat['work_type']}\n"
-                f"   📦 Заказов: {stat['order_count']}\n"
-                f"   📊 Единиц: {stat['total_quantity']}\n\n"
-            )
-
-        return message
+        return ''.join(work_type_report_blocks(stats, period))
 
     @staticmethod
     def format_period_report(stats, period):
@@ -323,3 +468,11 @@ class ReportService:
         )
 
         return message
+
+
+AsyncReportService = AsyncService(
+    ReportService,
+    passthrough=('format_doctor_report', 'format_technician_report', 'format_work_type_report', 'format_period_report',
+                 'iter_report_pages'),
+    lane='reports'
+)
@@ -0,0 +1,205 @@
+import os
+import re
+import sys
+import time
+import threading
+from collections import OrderedDict
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import db_connection
+
+
+# Максимальное число фраз в кэше и срок жизни записи
+TERMINOLOGY_CACHE_SIZE = int(os.getenv('TERMINOLOGY_CACHE_SIZE', '2000'))
+TERMINOLOGY_CACHE_TTL = float(os.getenv('TERMINOLOGY_CACHE_TTL_DAYS', '90')) * 24 * 3600
+
+
+def normalize_cache_key(work_type: str) -> str:
+    """Ключ кэша: нижний регистр, ё→е, без количества и знаков препинания
+
+    "Циркон на винте7шт" и "циркон  на винте, 7 шт." дают один ключ.
+    """
+    key = work_type.lower().replace('ё', 'е')
+    key = re.sub(r'\d+\s*(шт|штук|ед)\.?', ' ', key)
+    key = re.sub(r'[^\w\s]', ' ', key)
+    return ' '.join(key.split())
+
+
+class TerminologyCache:
+    """Постоянный LRU-кэш нормализованных названий работ
+
+    Записи хранятся в таблице terminology_cache (data/orders.db) и
+    загружаются в память при старте (load). Поиск идет только по памяти;
+    при переполнении вытесняются давно не использованные записи, записи
+    старше TTL считаются устаревшими.
+    """
+
+    def __init__(self, max_size: int = TERMINOLOGY_CACHE_SIZE, ttl: float = TERMINOLOGY_CACHE_TTL, persistent: bool = True):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persistent = persistent
+        self._entries = OrderedDict()
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expired = 0
+        self._llm_calls = 0
+        self._llm_time = 0.0
+
+    def load(self) -> int:
+        """Загрузить записи из БД (прогрев при старте), вернуть их число"""
+        if not self.persistent:
+            return 0
+
+        expire_before = time.time() - self.ttl
+
+        with db_connection() as conn:
+            conn.execute('DELETE FROM terminology_cache WHERE created_at < ?', (expire_before,))
+            rows = conn.execute('''
+                SELECT key, raw, normalized, hits, created_at, last_used_at
+                FROM terminology_cache
+                ORDER BY last_used_at DESC
+                LIMIT ?
+            ''', (self.max_size,)).fetchall()
+
+        with self._lock:
+            self._entries.clear()
+            for key, raw, normalized, hits, created_at, last_used_at in reversed(rows):
+                self._entries[key] = {
+                    'raw': raw,
+                    'normalized': normalized,
+                    'hits': hits,
+                    'created_at': created_at,
+                    'last_used_at': last_used_at
+                }
+
+        print(f"[Terminology Cache] Loaded {len(rows)} entries")
+        return len(rows)
+
+    def get(self, work_type: str):
+        """Найти нормализованное название, None если нет в кэше"""
+        key = normalize_cache_key(work_type)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self._misses += 1
+                return None
+
+            if now - entry['created_at'] > self.ttl:
+                del self._entries[key]
+                self._dirty.discard(key)
+                self._expired += 1
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            entry['hits'] += 1
+            entry['last_used_at'] = now
+            self._dirty.add(key)
+            self._hits += 1
+            return entry['normalized']
+
+    def put(self, work_type: str, normalized: str, latency: float = None):
+        """Сохранить результат нормализации (latency - время запроса к LLM)"""
+        key = normalize_cache_key(work_type)
+        now = time.time()
+        evicted = []
+
+        with self._lock:
+            if latency is not None:
+                self._llm_calls += 1
+                self._llm_time += latency
+
+            self._entries[key] = {
+                'raw': work_type,
+                'normalized': normalized,
+                'hits': 0,
+                'created_at': now,
+                'last_used_at': now
+            }
+            self._entries.move_to_end(key)
+            self._dirty.add(key)
+
+            while len(self._entries) > self.max_size:
+                old_key, _ = self._entries.popitem(last=False)
+                self._dirty.discard(old_key)
+                evicted.append(old_key)
+                self._evictions += 1
+
+        if self.persistent:
+            self.flush(evicted)
+
+    def flush(self, evicted: list = ()):
+        """Записать измененные записи в БД и удалить вытесненные"""
+        if not self.persistent:
+            return
+
+        with self._lock:
+            rows = [
+                (key, e['raw'], e['normalized'], e['hits'], e['created_at'], e['last_used_at'])
+                for key, e in ((k, self._entries[k]) for k in self._dirty if k in self._entries)
+            ]
+            self._dirty.clear()
+
+        with db_connection() as conn:
+            conn.executemany('''
+                INSERT INTO terminology_cache (key, raw, normalized, hits, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    raw = excluded.raw,
+                    normalized = excluded.normalized,
+                    hits = excluded.hits,
+                    created_at = excluded.created_at,
+                    last_used_at = excluded.last_used_at
+            ''', rows)
+            conn.executemany('DELETE FROM terminology_cache WHERE key = ?', [(key,) for key in evicted])
+
+    def invalidate(self, work_type: str = None) -> int:
+        """Удалить одну фразу или (без аргумента) весь кэш, вернуть число удаленных"""
+        with self._lock:
+            if work_type is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                self._dirty.clear()
+            else:
+                key = normalize_cache_key(work_type)
+                removed = 1 if self._entries.pop(key, None) is not None else 0
+                self._dirty.discard(key)
+
+        if self.persistent:
+            with db_connection() as conn:
+                if work_type is None:
+                    conn.execute('DELETE FROM terminology_cache')
+                else:
+                    conn.execute('DELETE FROM terminology_cache WHERE key = ?', (normalize_cache_key(work_type),))
+
+        return removed
+
+    def get_top_entries(self, limit: int = 10) -> list:
+        """Самые востребованные записи"""
+        with self._lock:
+            entries = [dict(e, key=k) for k, e in self._entries.items()]
+        entries.sort(key=lambda e: e['hits'], reverse=True)
+        return entries[:limit]
+
+    def get_stats(self) -> dict:
+        """Метрики: попадания, промахи, сэкономленное время запросов к LLM"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            avg_llm_latency = self._llm_time / self._llm_calls if self._llm_calls else 0.0
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'evictions': self._evictions,
+                'expired': self._expired,
+                'llm_calls': self._llm_calls,
+                'avg_llm_latency': avg_llm_latency,
+                'latency_saved': self._hits * avg_llm_latency
+            }
@@ -0,0 +1,197 @@
+import sys
+import os
+import difflib
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+from database import db_connection
+
+
+USER_COLUMNS = 'id, telegram_id, name, role, is_admin, reference_id, is_active, created_at'
+
+
+def row_to_user(row) -> dict:
+    """Строка таблицы users (в порядке USER_COLUMNS) -> словарь пользователя"""
+    return {
+        'id': row[0],
+        'telegram_id': row[1],
+        'name': row[2],
+        'role': row[3],
+        'is_admin': bool(row[4]),
+        'reference_id': row[5],
+        'is_active': bool(row[6]),
+        'created_at': row[7]
+    }
+
+
+def name_initials(name_parts: list) -> str:
+    """Инициалы из полного имени: ['Мороков', 'Александр', 'Александрович'] -> 'а.а.'"""
+    initials = ''
+    if len(name_parts) >= 2:
+        initials = name_parts[1][0].lower() + '.'
+    if len(name_parts) >= 3:
+        initials += name_parts[2][0].lower() + '.'
+    return initials
+
+
+def trigrams(text: str) -> set:
+    """Триграммы слова с границами: 'иванов' -> {'  и', ' ив', 'ива', ...}"""
+    padded = f"  {text.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class RoleIndex:
+    """Индексы активных пользователей одной роли
+
+    Строится один раз из строк таблицы users (при совпадениях побеждает
+    первый в порядке выборки) и дальше отвечает на поиск без запросов к БД.
+    """
+
+    def __init__(self, rows: list):
+        self.users = [row_to_user(row) for row in rows]
+        self.by_id = {}
+        self.by_name = {}
+        self.surname_counts = {}
+        self.by_surname_initials = {}
+        self.by_surname = {}
+        self.surname_trigrams = {}
+
+        for user in self.users:
+            self.by_id[user['id']] = user
+            self.by_name.setdefault(user['name'].lower().strip(), user)
+
+            parts = user['name'].split()
+            surname = parts[0] if parts else user['name']
+            surname_lower = surname.lower()
+            self.surname_counts[surname_lower] = self.surname_counts.get(surname_lower, 0) + 1
+
+            if len(parts) >= 2:
+                self.by_surname_initials.setdefault((surname_lower, name_initials(parts)), user)
+
+            if surname not in self.by_surname:
+                self.by_surname[surname] = user
+                for trigram in trigrams(surname):
+                    self.surname_trigrams.setdefault(trigram, []).append(surname)
+
+    def fuzzy_surname(self, name: str):
+        """Ближайшая фамилия (difflib, cutoff=0.6) среди фамилий с общими триграммами
+
+        Если среди кандидатов совпадения нет, сравнение идет со всеми
+        фамилиями роли: короткая фамилия с опечаткой может не иметь общих
+        триграмм, но пройти порог difflib.
+        """
+        candidates = []
+        for trigram in trigrams(name):
+            candidates.extend(self.surname_trigrams.get(trigram, ()))
+
+        candidates = list(dict.fromkeys(candidates))
+        matches = difflib.get_close_matches(name, candidates, n=1, cutoff=0.6)
+        if not matches and len(candidates) < len(self.by_surname):
+            matches = difflib.get_close_matches(name, list(self.by_surname), n=1, cutoff=0.6)
+
+        return matches[0] if matches else None
+
+
+class UserDirectory:
+    """Кэш активных пользователей по ролям
+
+    Индекс роли строится при первом обращении и сбрасывается методом
+    invalidate() после любого изменения таблицы users (UserManager делает
+    это сам). Кэш привязан к database.DB_PATH: после database.configure()
+    индексы строятся заново.
+    """
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._version = 0
+
+    def invalidate(self):
+        """Сбросить все индексы"""
+        with self._lock:
+            self._indexes.clear()
+            self._version += 1
+
+    def get_index(self, role: str) -> RoleIndex:
+        """Индекс роли (из кэша или построенный по БД)"""
+        key = (database.DB_PATH, role)
+
+        with self._lock:
+            index = self._indexes.get(key)
+            version = self._version
+
+        if index is not None:
+            return index
+
+        with db_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {USER_COLUMNS}
+                FROM users WHERE role = ? AND is_active = 1
+            ''', (role,)).fetchall()
+
+        index = RoleIndex(rows)
+
+        with self._lock:
+            # за время запроса пользователи могли измениться - такой индекс не сохраняем
+            if version == self._version:
+                self._indexes[key] = index
+
+        return index
+
+    def get_users(self, role: str) -> list:
+        """Активные пользователи роли (копии записей)"""
+        return [dict(user) for user in self.get_index(role).users]
+
+    def find_by_name(self, name: str, role: str) -> dict:
+        """Найти пользователя по имени (логику см. UserManager.find_user_by_name)"""
+        index = self.get_index(role)
+        print(f"[DEBUG find_user_by_name] Searching for name='{name}', role='{role}' among {len(index.users)} users")
+
+        if not index.users:
+            print(f"[DEBUG find_user_by_name] No users found with role '{role}'")
+            return None
+
+        # Шаг 1: точное совпадение полного имени
+        user = index.by_name.get(name.lower().strip())
+        if user:
+            print(f"[DEBUG find_user_by_name] EXACT MATCH FOUND! user_name='{user['name']}'")
+            return dict(user)
+
+        # Шаг 2: есть ли дубликаты искомой фамилии
+        name_parts = name.split()
+        input_surname = name_parts[0].lower() if name_parts else name.lower()
+        surname_count = index.surname_counts.get(input_surname, 0)
+        print(f"[DEBUG find_user_by_name] Surname '{input_surname}' count: {surname_count}")
+
+        # Шаг 3а: фамилия повторяется - только полное или сокращенное имя (Мороков А.А.)
+        if surname_count > 1:
+            is_abbreviated = len(name_parts) == 2 and len(name_parts[1]) >= 2 and name_parts[1][-1] == '.'
+
+            if is_abbreviated:
+                user = index.by_surname_initials.get((input_surname, name_parts[1].lower()))
+                if user:
+                    print(f"[DEBUG find_user_by_name] ABBREVIATED MATCH FOUND! user_name='{user['name']}'")
+                    return dict(user)
+
+            print(f"[DEBUG find_user_by_name] NO MATCH FOUND for '{name}'")
+            print("[DEBUG find_user_by_name] Recommendation: Use full name (e.g., 'Мороков Александр Александрович' or 'Мороков А.А.')")
+            return None
+
+        # Шаг 3б: фамилия уникальна - нечеткое сравнение с фамилиями
+        matched_surname = index.fuzzy_surname(name)
+        if matched_surname:
+            user = index.by_surname[matched_surname]
+            print(f"[DEBUG find_user_by_name] FUZZY MATCH FOUND! surname='{matched_surname}', user_name='{user['name']}'")
+            return dict(user)
+
+        print(f"[DEBUG find_user_by_name] NO MATCH FOUND for '{name}'")
+        print("[DEBUG find_user_by_name] Recommendation: Check the name spelling or use full name")
+        return None
+
+
+_directory = UserDirectory()
+
+
+def get_user_directory() -> UserDirectory:
+    """Общий на приложение кэш пользователей"""
+    return _directory
@@ -1,147 +1,207 @@
 import asyncio
 import os
 import sys
-from datetime import datetime, time
-from zoneinfo import ZoneInfo
-from telegram import Bot
+from datetime import datetime, timedelta
+from telegram.error import Forbidden, BadRequest
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from services.reminder_service import ReminderService
-from services.notification_service import NotificationService
-from services.user_manager import UserManager
-
-
-class ReminderBackgroundTask:
-    """Фоновая задача для проверки сроков и отправки напоминаний"""
-
-    def __init__(self, bot_token: str):
-        self.bot = Bot(token=bot_token)
-        self.reminder_service = ReminderService()
-        self.notification_service = NotificationService(bot_token)
-        self.user_manager = UserManager()
+from services.reminder_service import AsyncReminderService, MOSCOW, REMINDER_OFFSETS, reminder_window
+from services.user_manager import AsyncUserManager
+
+
+# Пауза перед повторной отправкой неудавшихся напоминаний (в пределах окна)
+REMINDER_RETRY_INTERVAL = float(os.getenv('REMINDER_RETRY_INTERVAL', '300'))
+
+# Самый долгий сон без пересчета: заказы меняются не только через
+# /neworder (смена статуса, правка срока), а wake() бывает не везде
+REMINDER_MAX_SLEEP = float(os.getenv('REMINDER_MAX_SLEEP', '3600'))
+
+
+class ReminderScheduler:
+    """Планировщик напоминаний о сроках
+
+    Вместо опроса каждые 5 минут после каждой проверки вычисляется
+    следующий момент, когда есть что делать:
+    - сегодня есть неотправленные напоминания - начало окна
+      (или сразу, если окно уже идет);
+    - часть отправок не удалась из-за временной ошибки - повтор через
+      REMINDER_RETRY_INTERVAL, пока не закончилось окно (не больше
+      REMINDER_MAX_ATTEMPTS попыток на получателя);
+    - иначе - начало окна ближайшего дня, когда наступает срок
+      напоминания у какого-либо заказа (по всем REMINDER_OFFSETS).
+    До этого момента задача спит; wake() (новый заказ) будит ее раньше.
+    """
+
+    def __init__(self, notification_service=None, offsets: tuple = REMINDER_OFFSETS,
+                 retry_interval: float = REMINDER_RETRY_INTERVAL, max_sleep: float = REMINDER_MAX_SLEEP, clock=None):
+        self.notification_service = notification_service
+        self.reminder_service = AsyncReminderService
+        self.user_manager = AsyncUserManager
+        self.offsets = offsets
+        self.retry_interval = retry_interval
+        self.max_sleep = max_sleep
+        self.clock = clock or (lambda: datetime.now(MOSCOW))
         self.running = False
-        self.last_check_date = None
-        self.timezone = ZoneInfo('Europe/Moscow')
-
-    async def check_and_send_reminders(self):
-        """Проверка заказов и отправка напоминаний с retry-логикой"""
-        now = datetime.now(self.timezone)
-        current_time = now.time()
-        current_date = now.date()
-
-        reminder_start_time = time(10, 0, 0)   # 10:00
-        reminder_end_time = time(10, 30, 0)    # 10:30
-
-        print(f"[DEBUG] Current Moscow time: {now.strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"[DEBUG] Last check date: {self.last_check_date}")
-
-        if current_time < reminder_start_time:
-            print(f"[DEBUG] Not yet reminder time (need {reminder_start_time.strftime('%H:%M')}), skipping")
-            return
-
-        if current_time > time(12, 0, 0):
-            print("[DEBUG] Too late for reminders, skipping")
-            if self.last_check_date != current_date:
-                self.last_check_date = current_date
-            return
-
-        retry_mode = self.last_check_date == current_date
-        if retry_mode:
-            print(f"[DEBUG] RETRY MODE - Failed reminders will be resent")
-        else:
-            print(f"[DEBUG] FIRST CHECK - Processing all orders due tomorrow")
-
-        print(f"[DEBUG] Checking for orders due tomorrow...")
-
-        orders_due_tomorrow = self.reminder_service.get_orders_due_tomorrow()
-
-        if not orders_due_tomorrow:
-            print("[DEBUG] No orders due tomorrow")
-            if not retry_mode:
-                self.last_check_date = current_date
-            return
-
-        print(f"[DEBUG] Found {len(orders_due_tomorrow)} orders due tomorrow")
-
-        admins = self.user_manager.get_all_admins()
-        print(f"[DEBUG] Found {len(admins)} admins to notify")
-
-        sent_count = 0
-        fully_sent_orders = 0
-
-        for order in orders_due_tomorrow:
-            print(f"[DEBUG] Processing order {order['id']} for {order.get('patient_name', 'Unknown')}")
-
-            technician_message = f"⏰ НАПОМИНАНИЕ О СРОКЕ ВЫПОЛНЕНИЯ!\n\n{self.reminder_service.format_reminder_message(order)}"
-
-            sent_tech = await self.notification_service.send_reminder_to_technician(order, technician_message)
-
-            admin_success = True
-            technician_name = order.get('technician_name', 'Не указан')
-
+        self.next_run_at = None
+        self._wake_event = None
+        self.checks = 0
+        self.wakeups = 0
+        self.sent = 0
+        self.failed = 0
+
+    def wake(self):
+        """Сообщить, что заказы изменились и расписание нужно пересчитать"""
+        self.wakeups += 1
+        if self._wake_event is not None:
+            self._wake_event.set()
+
+    async def send_reminders(self, orders: list) -> int:
+        """Разослать напоминания, вернуть число заказов, которые не дошли до всех
+
+        Каждый получатель получает одно сообщение: техник - список своих
+        заказов, администратор - сводку по всем. Получатели обслуживаются
+        параллельно через NotificationFanout (семафор и лимиты Telegram).
+        Доставка ведется по журналу reminder_deliveries на каждого
+        получателя: в сообщение попадают только заказы, которые этому
+        получателю еще не доставлены, поэтому повтор после сбоя уходит
+        только тем, кому не дошло. Как в OutboxWorker, повторяются только
+        временные ошибки (сеть, 5xx); Forbidden/BadRequest (бот заблокирован,
+        некорректное сообщение) записываются в журнал как окончательные.
+        """
+        admins = [admin for admin in await self.user_manager.get_all_admins() if admin.get('telegram_id')]
+        # Техники всех заказов одним запросом, без поиска по имени
+        technicians = await self.user_manager.get_users_by_ids([order['technician_id'] for order in orders])
+
+        # (order_id, reminder_type, chat_id) -> роль получателя
+        recipients = {}
+        for order in orders:
+            technician = technicians.get(order['technician_id'])
+            if technician and technician.get('is_active', True) and technician.get('telegram_id'):
+                recipients[(order['id'], order['reminder_type'], technician['telegram_id'])] = 'technician'
             for admin in admins:
-                admin_message = (
-                    f"⏰ НАПОМИНАНИЕ О СРОКЕ ВЫПОЛНЕНИЯ!\n\n"
-                    f"📋 Заказ №{order['id']}\n"
-                    f"👤 Пациент: {order.get('patient_name', 'Не указан')}\n"
-                    f"👨‍⚕️ Врач: {order.get('doctor_name', 'Не указан')}\n"
-                    f"🔧 Техник: {technician_name}\n"
-                    f"🔨 Вид работы: {order.get('work_type', 'Не указано')}\n"
-                    f"📊 Количество: {order.get('quantity', 0)} шт\n"
-                    f"📅 Срок выполнения: {order.get('deadline', 'Не указан')}\n"
-                )
-                try:
-                    await self.bot.send_message(chat_id=admin['telegram_id'], text=admin_message)
-                except Exception as e:
-                    print(f"[DEBUG] Failed to send to admin {admin['name']}: {e}")
-                    admin_success = False
-
-            order_fully_sent = sent_tech and admin_success
-
-            if order_fully_sent:
-                print(f"[DEBUG] Order {order['id']} - ALL REMINDERS SENT SUCCESSFULLY")
-                fully_sent_orders += 1
-                if sent_tech:
-                    sent_count += 1
-
-                self.reminder_service.mark_reminder_sent(order['id'], 'today')
-            else:
-                print(f"[DEBUG] Order {order['id']} - SOME REMINDERS FAILED, will retry")
-                if sent_tech:
-                    sent_count += 1
-
-        print(f"[DEBUG] Total technician reminders sent: {sent_count}")
-        print(f"[DEBUG] Orders fully sent: {fully_sent_orders}/{len(orders_due_tomorrow)}")
-
-        if fully_sent_orders == len(orders_due_tomorrow):
-            print(f"[DEBUG] All orders fully processed, marking day as checked")
-            self.last_check_date = current_date
-        elif retry_mode and current_time >= reminder_end_time:
-            print(f"[DEBUG] Retry window ended, marking day as checked")
-            self.last_check_date = current_date
-        elif not retry_mode and current_time >= reminder_end_time:
-            print(f"[DEBUG] First check window ended, marking day as checked")
-            self.last_check_date = current_date
-
-    async def start_background_task(self):
-        """Запуск фонового процесса"""
+                recipients.setdefault((order['id'], order['reminder_type'], admin['telegram_id']), 'admin')
+
+        deliveries = [(*key, role) for key, role in recipients.items()]
+        claimed = await self.reminder_service.claim_deliveries(deliveries)
+
+        # Заказы, которые некому доставить (нет ни техника с Telegram, ни
+        # администраторов), считаются обработанными - иначе они выбирались бы
+        # заново до конца окна
+        reachable = {(order_id, kind) for order_id, kind, _ in recipients}
+        unreachable = [(order['id'], order['reminder_type']) for order in orders
+                       if (order['id'], order['reminder_type']) not in reachable]
+        if unreachable:
+            await self.reminder_service.mark_reminders_sent(unreachable)
+            print(f"[Reminders] {len(unreachable)} orders have no recipients, marked as handled")
+
+        # chat_id -> заказы, которые нужно доставить в этот чат
+        by_order = {(order['id'], order['reminder_type']): order for order in orders}
+        chat_orders = {}
+        for order_id, kind, chat_id in claimed:
+            chat_orders.setdefault(chat_id, []).append(by_order[(order_id, kind)])
+
+        jobs = []
+        job_orders = []
+        service = self.notification_service
+        for chat_id, chat_list in chat_orders.items():
+            for_admin = any(recipients[(order['id'], order['reminder_type'], chat_id)] == 'admin' for order in chat_list)
+            label = 'reminder_digest' if for_admin else 'reminder'
+            for page, keys in self.reminder_service.reminder_digest(chat_list, for_admin=for_admin):
+                jobs.append((chat_id, service.delivery(chat_id, page), label))
+                job_orders.append(keys)
+
+        # результат страницы относится только к заказам на ней: повтор после
+        # сбоя одной страницы не пересылает заказы с доставленных страниц
+        results = {(order_id, kind, chat_id): None for order_id, kind, chat_id in claimed}
+        permanent = set()
+        failed_pages = 0
+        for result, keys in zip(await service.fanout.send_all(jobs), job_orders):
+            if not result['ok']:
+                failed_pages += 1
+                for order_id, kind in keys:
+                    if results.get((order_id, kind, result['chat_id'])) is None:
+                        results[(order_id, kind, result['chat_id'])] = result['error']
+                    if isinstance(result['exception'], (Forbidden, BadRequest)):
+                        permanent.add((order_id, kind, result['chat_id']))
+
+        completed = await self.reminder_service.record_deliveries(deliveries, results, permanent)
+        completed += unreachable
+
+        failed_orders = len(orders) - len(completed)
+        self.sent += len(completed)
+        self.failed += failed_orders
+        print(f"[Reminders] {len(jobs)} messages to {len(chat_orders)} chats ({failed_pages} failed), "
+              f"{len(completed)}/{len(orders)} orders delivered to everyone")
+        return failed_orders
+
+    async def check(self, now: datetime = None):
+        """Отправить созревшие напоминания, вернуть время следующей проверки (или None)"""
+        now = now or self.clock()
+        today = now.date()
+        window_start, window_end = reminder_window(today)
+        self.checks += 1
+
+        if now < window_end:
+            due = await self.reminder_service.get_due_reminders(today, self.offsets)
+            if due and now < window_start:
+                return window_start
+            if due:
+                print(f"[Reminders] Sending {len(due)} reminders")
+                failed = await self.send_reminders(due)
+                retry_at = now + timedelta(seconds=self.retry_interval)
+                if failed and retry_at < window_end:
+                    return retry_at
+                if failed:
+                    print(f"[Reminders] Window ended, {failed} reminders not delivered today")
+
+        day = await self.reminder_service.next_reminder_day(today, self.offsets)
+        return reminder_window(day)[0] if day else None
+
+    async def run(self):
+        """Основной цикл: проверка - сон до следующего срока или wake()"""
         self.running = True
-        print("Reminder background task started (checking every 5 minutes)")
+        self._wake_event = asyncio.Event()
+        print(f"[Reminders] Scheduler started (offsets: {', '.join(map(str, self.offsets))} days)")
 
         while self.running:
+            self._wake_event.clear()
             try:
-                await self.check_and_send_reminders()
+                self.next_run_at = await self.check()
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                print(f"Error in background task: {e}")
+                print(f"[Reminders] Scheduler error: {e}")
+                self.next_run_at = self.clock() + timedelta(seconds=self.retry_interval)
+
+            timeout = self.max_sleep
+            if self.next_run_at is not None:
+                timeout = min(timeout, max(0.0, (self.next_run_at - self.clock()).total_seconds()))
+                print(f"[Reminders] Next check at {self.next_run_at.strftime('%Y-%m-%d %H:%M:%S')}")
 
-            await asyncio.sleep(300)
+            try:
+                await asyncio.wait_for(self._wake_event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
 
     def stop(self):
-        """Остановка фонового процесса"""
+        """Остановка планировщика"""
         self.running = False
-        print("Reminder background task stopped")
+        self.wake()
+        print("[Reminders] Scheduler stopped")
+
+    def get_stats(self) -> dict:
+        """Счетчики планировщика с начала работы"""
+        return {
+            'checks': self.checks,
+            'wakeups': self.wakeups,
+            'sent': self.sent,
+            'failed': self.failed,
+            'next_run_at': self.next_run_at
+        }
+
+
+_scheduler = ReminderScheduler()
 
 
-async def run_background_task(bot_token: str):
-    """Запуск фоновой задачи"""
-    task = ReminderBackgroundTask(bot_token)
-    await task.start_background_task()
+def get_reminder_scheduler() -> ReminderScheduler:
+    """Общий на бота планировщик (notification_service задается при старте)"""
+    return _scheduler
@@ -0,0 +1,156 @@
+import os
+import time
+import asyncio
+import inspect
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+# Сколько обновлений обрабатывается одновременно (разные чаты)
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '8'))
+
+# Сколько обновлений может ждать очереди своего чата или свободного места;
+# сверх этого PTB придерживает новые задачи обработки
+UPDATE_MAX_PENDING = int(os.getenv('UPDATE_MAX_PENDING', '1024'))
+
+
+def chat_key(update: object):
+    """Ключ очереди: чат обновления, если его нет - пользователь (None - без очереди)"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений разных чатов, строго по порядку внутри чата
+
+    Application создает задачу на каждое обновление в порядке получения.
+    Обновление ждет, пока закончится предыдущее обновление того же чата
+    (цепочка future по чату), и только потом занимает одно из
+    max_concurrent места. Поэтому медленный /report_period или разбор
+    заказа нейросетью не задерживает другие чаты, а ConversationHandler
+    (/neworder, /register) видит сообщения одного чата по очереди, как при
+    последовательной обработке.
+
+    Семафор самого BaseUpdateProcessor (max_pending) ограничивает число
+    ожидающих обновлений; место обработки берется уже после очереди чата,
+    чтобы сообщения одного чата не занимали места, ожидая друг друга.
+    """
+
+    def __init__(self, max_concurrent: int = UPDATE_CONCURRENCY, max_pending: int = UPDATE_MAX_PENDING):
+        super().__init__(max(max_pending, max_concurrent, 2))
+        self.max_concurrent = max_concurrent
+        self._slots = None
+        self._slots_loop = None
+        self._tails = {}
+        self._chat_waiting = {}
+        self.running = 0
+        self.waiting_for_chat = 0
+        self.waiting_for_slot = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_running = 0
+        self.max_chat_backlog = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        """Семафор текущего event loop (в тестах loop создается заново)"""
+        loop = asyncio.get_running_loop()
+        if self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+            self._slots_loop = loop
+        return self._slots
+
+    async def do_process_update(self, update: object, coroutine):
+        key = chat_key(update)
+        started = time.monotonic()
+
+        previous = None
+        done = None
+        if key is not None:
+            previous = self._tails.get(key)
+            done = asyncio.get_running_loop().create_future()
+            self._tails[key] = done
+
+        try:
+            if previous is not None:
+                backlog = self._chat_waiting.get(key, 0) + 1
+                self._chat_waiting[key] = backlog
+                self.max_chat_backlog = max(self.max_chat_backlog, backlog)
+                self.waiting_for_chat += 1
+                try:
+                    await previous
+                finally:
+                    self.waiting_for_chat -= 1
+                    self._chat_waiting[key] -= 1
+                    if not self._chat_waiting[key]:
+                        del self._chat_waiting[key]
+
+            self.waiting_for_slot += 1
+            try:
+                await self._get_slots().acquire()
+            finally:
+                self.waiting_for_slot -= 1
+
+            wait = time.monotonic() - started
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            try:
+                await coroutine
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                self.running -= 1
+                self._get_slots().release()
+        finally:
+            if inspect.iscoroutine(coroutine) and inspect.getcoroutinestate(coroutine) == inspect.CORO_CREATED:
+                # отменено до начала обработки - закрыть, чтобы не было "never awaited"
+                coroutine.close()
+            if done is not None:
+                done.set_result(None)
+                if self._tails.get(key) is done:
+                    del self._tails[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def get_stats(self) -> dict:
+        """Текущая очередь и счетчики с запуска"""
+        finished = self.processed + self.failed
+        return {
+            'max_concurrent': self.max_concurrent,
+            'running': self.running,
+            'waiting_for_chat': self.waiting_for_chat,
+            'waiting_for_slot': self.waiting_for_slot,
+            'busy_chats': len(self._tails),
+            'processed': self.processed,
+            'failed': self.failed,
+            'max_running': self.max_running,
+            'max_chat_backlog': self.max_chat_backlog,
+            'avg_wait': self.total_wait / finished if finished else 0.0,
+            'max_wait': self.max_wait
+        }
+
+
+_processor = None
+
+
+def get_update_processor() -> ChatOrderedUpdateProcessor:
+    """Общий на бота обработчик обновлений (создается при первом обращении)"""
+    global _processor
+    if _processor is None:
+        _processor = ChatOrderedUpdateProcessor()
+    return _processor
@@ -0,0 +1,152 @@
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+
+# Символы, недопустимые в XML 1.0 (встречаются в описаниях, скопированных из других программ)
+ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# Сколько строк собирается перед записью в архив
+FLUSH_ROWS = 1000
+
+CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+{sheets}
+</Types>'''
+
+SHEET_CONTENT_TYPE = ('<Override PartName="/xl/worksheets/sheet{index}.xml" '
+                      'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>')
+
+ROOT_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+
+WORKBOOK = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets>{sheets}</sheets>
+</workbook>'''
+
+WORKBOOK_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+{sheets}
+<Relationship Id="rIdStyles" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>'''
+
+# Минимальные стили: шрифт, заливка, рамка и формат ячейки по умолчанию, жирный заголовок
+STYLES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/><xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>
+</styleSheet>'''
+
+SHEET_START = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+               '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+SHEET_END = '</sheetData></worksheet>'
+
+
+def sheet_title(title: str) -> str:
+    """Название листа Excel: не длиннее 31 символа, без []:*?/\\"""
+    return re.sub(r'[\[\]:*?/\\]', ' ', title)[:31] or 'Лист'
+
+
+def cell(value, style: int = 0) -> str:
+    style_attr = f' s="{style}"' if style else ''
+    if value is None or value == '':
+        return f'<c{style_attr}/>'
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, (int, float)):
+        return f'<c{style_attr}><v>{value}</v></c>'
+    # инлайн-строка всегда остается текстом: "=..." не становится формулой (формулы - только <f>)
+    text = escape(ILLEGAL_XML_CHARS.sub('', str(value)))
+    return f'<c t="inlineStr"{style_attr}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+class XlsxWriter:
+    """Потоковая запись XLSX без сторонних библиотек
+
+    Лист пишется в zip-архив построчно (строки собираются пачками по
+    FLUSH_ROWS), поэтому память не зависит от числа строк. Листы пишутся
+    по очереди: add_sheet() закрывает предыдущий. Строки - инлайн-строки
+    и числа, без общей таблицы строк (sharedStrings), которую пришлось бы
+    держать в памяти целиком.
+
+    Пример:
+        with XlsxWriter(path) as writer:
+            writer.add_sheet('Заказы', ['№', 'Вид работ'])
+            writer.write_row([1, 'мост'])
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._zip = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=6)
+        self._sheets = []
+        self._stream = None
+        self._buffer = []
+        self.rows = 0
+
+    def add_sheet(self, title: str, header: list = None):
+        """Начать новый лист (с жирной строкой заголовка)"""
+        self._close_sheet()
+        self._sheets.append(sheet_title(title))
+        name = f'xl/worksheets/sheet{len(self._sheets)}.xml'
+        self._stream = self._zip.open(name, 'w', force_zip64=True)
+        self._stream.write(SHEET_START.encode('utf-8'))
+        if header:
+            self._buffer.append('<row>' + ''.join(cell(value, style=1) for value in header) + '</row>')
+
+    def write_row(self, values):
+        if self._stream is None:
+            self.add_sheet('Лист1')
+        self._buffer.append('<row>' + ''.join(cell(value) for value in values) + '</row>')
+        self.rows += 1
+        if len(self._buffer) >= FLUSH_ROWS:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            self._stream.write(''.join(self._buffer).encode('utf-8'))
+            self._buffer.clear()
+
+    def _close_sheet(self):
+        if self._stream is not None:
+            self._flush()
+            self._stream.write(SHEET_END.encode('utf-8'))
+            self._stream.close()
+            self._stream = None
+
+    def close(self):
+        """Дописать лист и служебные части книги, закрыть файл"""
+        if self._zip is None:
+            return
+        if not self._sheets:
+            self.add_sheet('Лист1')
+        self._close_sheet()
+
+        indexes = range(1, len(self._sheets) + 1)
+        self._zip.writestr('[Content_Types].xml', CONTENT_TYPES.format(
+            sheets='\n'.join(SHEET_CONTENT_TYPE.format(index=i) for i in indexes)))
+        self._zip.writestr('_rels/.rels', ROOT_RELS)
+        self._zip.writestr('xl/workbook.xml', WORKBOOK.format(sheets=''.join(
+            f'<sheet name="{escape(title, {chr(34): "&quot;"})}" sheetId="{i}" r:id="rId{i}"/>'
+            for i, title in zip(indexes, self._sheets))))
+        self._zip.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS.format(sheets='\n'.join(
+            f'<Relationship Id="rId{i}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+            f'Target="worksheets/sheet{i}.xml"/>' for i in indexes)))
+        self._zip.writestr('xl/styles.xml', STYLES)
+        self._zip.close()
+        self._zip = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""Тест асинхронного разбора заказов (MessageProcessor.normalize_message_async)
+
+Запросы к OpenRouter подменяются фейковым клиентом, сеть не используется.
+"""
+import sys
+import os
+import time
+import json
+import asyncio
+import tempfile
+from types import SimpleNamespace
+
+import httpx
+from openai import BadRequestError
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import database
+from services.message_processor import MessageProcessor
+from services import processor_registry
+
+
+class FakeAsyncClient:
+    """Имитация AsyncOpenAI: отвечает через delay секунд
+
+    bad_request - текст ошибки 400 на запросы с response_format.
+    """
+
+    def __init__(self, content: str, delay: float, bad_request: str = None):
+        self.content = content
+        self.delay = delay
+        self.bad_request = bad_request
+        self.calls = 0
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        self.requests.append(kwargs)
+        await asyncio.sleep(self.delay)
+        if self.bad_request and 'response_format' in kwargs:
+            request = httpx.Request('POST', 'https://openrouter.ai/api/v1/chat/completions')
+            raise BadRequestError(self.bad_request, response=httpx.Response(400, request=request), body=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.content))])
+
+
+ORDER_JSON = json.dumps({
+    "technician_name": "Мороков",
+    "work_type": "циркон на винте",
+    "quantity": 7,
+    "deadline": None,
+    "patient_name": "Иванов"
+}, ensure_ascii=False)
+
+
+STRUCTURED_JSON = json.dumps({
+    "technician_name": "Мороков",
+    "doctor_name": None,
+    "patient_name": "Иванов",
+    "work_type_raw": "емакс коронка",
+    "work_type": "безметалловая керамическая коронка из дисиликата лития",
+    "quantity": "7",
+    "deadline": "завтра",
+    "notes": ""
+}, ensure_ascii=False)
+
+
+def make_processor(order_delay: float, dental_delay: float) -> MessageProcessor:
+    processor = MessageProcessor(single_call=False)
+    processor.async_client = FakeAsyncClient(ORDER_JSON, order_delay)
+    processor.dental_service.async_client = FakeAsyncClient("коронка из диоксида циркония на винте", dental_delay)
+    return processor
+
+
+def test_async_parse():
+    """Оба запроса выполняются асинхронно, результат нормализуется"""
+    processor = make_processor(0.01, 0.01)
+
+    result = asyncio.run(processor.normalize_message_async("Мороков циркон на винте 7шт пациент Иванов"))
+
+    assert result['technician_name'] == "Мороков"
+    assert result['quantity'] == 7
+    assert result['work_type'] == "коронка из диоксида циркония на винте"
+
+
+def test_parses_do_not_block_each_other():
+    """Разбор для разных чатов идет параллельно, а не последовательно"""
+    processor = make_processor(0.2, 0.2)
+
+    async def scenario():
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            processor.normalize_message_async(f"Мороков циркон на винте {i}шт") for i in range(10)
+        ))
+        return time.perf_counter() - started
+
+    elapsed = asyncio.run(scenario())
+    print(f"10 parallel parses: {elapsed:.2f}s")
+    assert elapsed < 1.0
+
+
+def test_deadline_falls_back_to_simple_parser():
+    """При превышении крайнего срока запрос отменяется, работает простой парсер"""
+    processor = make_processor(5.0, 0.0)
+
+    started = time.perf_counter()
+    result = asyncio.run(processor.normalize_message_async("Мороков циркон на винте 7шт", timeout=0.1))
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 1.0
+    assert result['technician_name'] == "Мороков"
+    assert result['quantity'] == 7
+    assert processor.dental_service.async_client.calls == 0
+
+
+def test_cancellation_propagates():
+    """Отмена задачи не превращается в ответ простого парсера"""
+    processor = make_processor(5.0, 0.0)
+
+    async def scenario():
+        task = asyncio.create_task(processor.normalize_message_async("Мороков циркон 1шт"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    assert asyncio.run(scenario())
+
+
+def test_single_call_mode():
+    """Один запрос возвращает заказ и каноническое название работы"""
+    processor = MessageProcessor(single_call=True)
+    processor.async_client = FakeAsyncClient(STRUCTURED_JSON, 0.01)
+    processor.dental_service.async_client = FakeAsyncClient("не должен вызываться", 0.0)
+
+    result = asyncio.run(processor.normalize_message_async("Мороков емакс коронка 7шт пациент Иванов"))
+
+    assert processor.async_client.calls == 1
+    assert processor.dental_service.async_client.calls == 0
+    assert processor.async_client.requests[0]['response_format'] == {'type': 'json_object'}
+    assert result['work_type'] == "безметалловая керамическая коронка из дисиликата лития"
+    assert result['quantity'] == 7
+    assert result['deadline'] is None
+    assert result['notes'] is None
+    assert 'work_type_raw' not in result
+    assert processor.terminology_cache.get("емакс коронка") == result['work_type']
+
+
+def test_single_call_rules_override_model():
+    """Для известных правилам фраз каноническое название берется из правил"""
+    processor = MessageProcessor(single_call=True)
+    answer = json.loads(STRUCTURED_JSON)
+    answer.update(work_type_raw="циркон на винте", work_type="цельнометаллическая коронка на винте")
+    processor.async_client = FakeAsyncClient(json.dumps(answer, ensure_ascii=False), 0.0)
+
+    result = asyncio.run(processor.normalize_message_async("Мороков циркон на винте 7шт"))
+
+    assert result['work_type'] == "коронка из диоксида циркония на винте"
+
+
+def test_single_call_invalid_response_falls_back():
+    """Ответ не по схеме отбрасывается, работает простой парсер"""
+    processor = MessageProcessor(single_call=True)
+    processor.async_client = FakeAsyncClient('{"technician_name": "Плюхин"}', 0.0)
+    processor.dental_service.async_client = FakeAsyncClient("не должен вызываться", 0.0)
+
+    result = asyncio.run(processor.normalize_message_async("Плюхин металлокерамика 2 шт"))
+
+    assert result['technician_name'] == "Плюхин"
+    assert result['work_type'] == "металлокерамическая коронка"
+    assert processor.dental_service.async_client.calls == 0
+
+
+def test_json_schema_only_when_enabled():
+    """Строгая схема отправляется только с json_schema=True (LLM_JSON_SCHEMA)"""
+    processor = MessageProcessor(single_call=True, json_schema=True)
+    processor.async_client = FakeAsyncClient(STRUCTURED_JSON, 0.0)
+
+    asyncio.run(processor.normalize_message_async("Мороков емакс коронка 7шт пациент Иванов"))
+
+    assert processor.async_client.requests[0]['response_format']['type'] == 'json_schema'
+
+
+def test_rejected_response_format_not_sent_again():
+    """После отказа модели response_format больше не отправляется, заказ все равно разбирается"""
+    processor = MessageProcessor(single_call=True, json_schema=True)
+    processor.async_client = FakeAsyncClient(STRUCTURED_JSON, 0.0, 'response_format json_schema is not supported')
+    processor.dental_service.async_client = FakeAsyncClient("не должен вызываться", 0.0)
+
+    async def scenario():
+        first = await processor.normalize_message_async("Мороков емакс коронка 7шт пациент Иванов")
+        second = await processor.normalize_message_async("Мороков емакс коронка 7шт пациент Иванов")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    # отказ, повтор без формата, следующий заказ - сразу без формата
+    assert ['response_format' in request for request in processor.async_client.requests] == [True, False, False]
+    assert processor.response_format is None
+    assert first == second
+    assert first['work_type'] == "безметалловая керамическая коронка из дисиликата лития"
+    assert processor.dental_service.async_client.calls == 0
+
+
+def test_other_bad_request_keeps_response_format():
+    """Ошибка 400 не про формат (длина контекста) не отключает response_format"""
+    processor = MessageProcessor(single_call=True)
+    processor.async_client = FakeAsyncClient(STRUCTURED_JSON, 0.0, "This model's maximum context length is 8192 tokens")
+    processor.dental_service.async_client = FakeAsyncClient("металлокерамическая коронка", 0.0)
+
+    result = asyncio.run(processor.normalize_message_async("Плюхин металлокерамика 2 шт"))
+
+    assert processor.async_client.calls == 1
+    assert processor.response_format == {'type': 'json_object'}
+    assert result['technician_name'] == "Плюхин"
+
+
+def test_retry_without_format_keeps_deadline():
+    """Повтор без response_format укладывается в оставшееся время, а не получает новый срок"""
+    processor = MessageProcessor(single_call=True)
+    processor.async_client = FakeAsyncClient(STRUCTURED_JSON, 0.15, 'response_format json_object is not supported')
+
+    started = time.perf_counter()
+    result = asyncio.run(processor.normalize_message_async("Мороков циркон на винте 7шт", timeout=0.2))
+    elapsed = time.perf_counter() - started
+
+    assert processor.async_client.calls == 2
+    assert processor.async_client.requests[1]['timeout'] < 0.1
+    assert elapsed < 0.3
+    assert result['technician_name'] == "Мороков" and result['quantity'] == 7
+
+
+def test_registry_shares_processor_and_pool():
+    """Реестр отдает один MessageProcessor с общим пулом и кэшем"""
+    database.configure(os.path.join(tempfile.mkdtemp(), 'orders.db'))
+    database.init_db()
+
+    first = processor_registry.get_message_processor()
+    second = processor_registry.get_message_processor()
+    registry = processor_registry.init_processor_registry()
+
+    assert first is second
+    if first.async_client:
+        assert first.dental_service.async_client is first.async_client
+        assert first.dental_service.client is first.client
+        assert first.async_client._client is registry.async_http_client
+
+    assert first.terminology_cache is processor_registry.get_terminology_cache()
+    first.terminology_cache.put('циркон', 'из диоксида циркония')
+    assert processor_registry.get_message_processor().terminology_cache.get('Циркон') == 'из диоксида циркония'
+
+    asyncio.run(processor_registry.close_processor_registry())
+    assert processor_registry.get_message_processor() is not first
+
+
+if __name__ == '__main__':
+    test_async_parse()
+    test_parses_do_not_block_each_other()
+    test_deadline_falls_back_to_simple_parser()
+    test_cancellation_propagates()
+    test_single_call_mode()
+    test_single_call_rules_override_model()
+    test_single_call_invalid_response_falls_back()
+    test_json_schema_only_when_enabled()
+    test_rejected_response_format_not_sent_again()
+    test_other_bad_request_keeps_response_format()
+    test_retry_without_format_keeps_deadline()
+    test_registry_shares_processor_and_pool()
+    print("All async LLM tests passed")
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""Тест сохранения диалогов и user_data между перезапусками (SQLitePersistence)
+
+Бот - настоящее Application PTB; вместо Telegram - OfflineRequest, который
+отвечает на getMe и sendMessage без сети.
+"""
+import sys
+import os
+import json
+import time
+import asyncio
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import database
+from database import db_connection
+from telegram import Update
+from telegram.request import BaseRequest
+from telegram.ext import Application, CommandHandler, ConversationHandler, MessageHandler, filters
+from services.conversation_store import SQLitePersistence
+
+WAITING_TEXT = 1
+
+
+class OfflineRequest(BaseRequest):
+    """Ответы Bot API без сети: getMe и эхо для send*"""
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        if url.endswith('/getMe'):
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Test', 'username': 'test_bot'}
+        else:
+            params = request_data.parameters if request_data else {}
+            result = {'message_id': 1, 'date': 0, 'text': params.get('text', ''),
+                      'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'}}
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+def setup_db():
+    database.configure(os.path.join(tempfile.mkdtemp(), 'orders.db'))
+    database.init_db()
+
+
+def message(update_id: int, user_id: int, text: str, bot) -> Update:
+    data = {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Test'}, 'text': text}}
+    if text.startswith('/'):
+        data['message']['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return Update.de_json(data, bot)
+
+
+def make_application(persistence, finished: list) -> Application:
+    """Диалог как /neworder: команда -> сохранить "фото" в user_data -> ждать текст"""
+    async def start(update, context):
+        context.user_data['photo_id'] = f'photo-{update.effective_user.id}'
+        return WAITING_TEXT
+
+    async def text(update, context):
+        finished.append((update.effective_user.id, context.user_data.get('photo_id'), update.message.text))
+        return ConversationHandler.END
+
+    application = Application.builder().token('123:TEST').request(OfflineRequest()).persistence(persistence).build()
+    application.add_handler(ConversationHandler(
+        entry_points=[CommandHandler('neworder', start)],
+        states={WAITING_TEXT: [MessageHandler(filters.TEXT & ~filters.COMMAND, text)]},
+        fallbacks=[],
+        name='new_order',
+        persistent=True
+    ))
+    return application
+
+
+def test_conversation_survives_restart():
+    setup_db()
+    finished = []
+
+    async def first_run():
+        persistence = SQLitePersistence(update_interval=3600)
+        application = make_application(persistence, finished)
+        await application.initialize()
+        for user_id in (501, 502):
+            await application.process_update(message(user_id, user_id, '/neworder', application.bot))
+        await application.shutdown()
+        return persistence
+
+    async def second_run():
+        persistence = SQLitePersistence(update_interval=3600)
+        application = make_application(persistence, finished)
+        await application.initialize()
+        await application.process_update(message(10, 501, 'Мороков циркон 7шт', application.bot))
+        await application.shutdown()
+        return persistence
+
+    first = asyncio.run(first_run())
+    # два диалога и два user_data - одна транзакция при остановке
+    assert first.get_stats()['batches'] == 1 and first.get_stats()['rows_written'] == 4
+
+    second = asyncio.run(second_run())
+    assert sorted(key for _, key, _ in second.recovered) == [(501, 501), (502, 502)]
+    assert finished == [(501, 'photo-501', 'Мороков циркон 7шт')]
+
+    with db_connection() as conn:
+        states = conn.execute('SELECT name, key, state FROM conversation_states').fetchall()
+    # завершенный диалог удален, второй пользователь все еще ждет текст
+    assert states == [('new_order', '[502, 502]', '1')]
+
+
+def test_changes_batched_into_one_transaction():
+    setup_db()
+
+    async def scenario():
+        persistence = SQLitePersistence()
+        await persistence.get_conversations('new_order')
+        # как Application.update_persistence: все изменения одним gather
+        await asyncio.gather(*(
+            [persistence.update_user_data(user_id, {'photo_id': f'p{user_id}'}) for user_id in range(50)] +
+            [persistence.update_conversation('new_order', (user_id, user_id), WAITING_TEXT) for user_id in range(50)]
+        ))
+        await persistence.flush()
+        return persistence
+
+    stats = asyncio.run(scenario()).get_stats()
+    assert stats['changes'] == 100 and stats['batches'] == 1 and stats['pending'] == 0
+    with db_connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM conversation_user_data').fetchone() == (50,)
+        assert conn.execute('SELECT COUNT(*) FROM conversation_states').fetchone() == (50,)
+
+
+def test_end_and_drop_delete_rows():
+    setup_db()
+
+    async def scenario():
+        persistence = SQLitePersistence()
+        await persistence.get_user_data()
+        await persistence.update_user_data(7, {'role': 'doctor'})
+        await persistence.update_conversation('registration', (7, 7), 1)
+        await persistence.flush()
+        await persistence.drop_user_data(7)
+        await persistence.update_conversation('registration', (7, 7), None)
+        await persistence.flush()
+
+    asyncio.run(scenario())
+    with db_connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM conversation_user_data').fetchone() == (0,)
+        assert conn.execute('SELECT COUNT(*) FROM conversation_states').fetchone() == (0,)
+
+
+def test_stale_entries_pruned_on_load():
+    setup_db()
+    old = time.time() - 3 * 24 * 3600
+    with db_connection() as conn:
+        conn.execute("INSERT INTO conversation_states VALUES ('new_order', '[1, 1]', '1', ?)", (old,))
+        conn.execute("INSERT INTO conversation_states VALUES ('new_order', '[2, 2]', '1', ?)", (time.time(),))
+        conn.execute("INSERT INTO conversation_user_data VALUES (1, x'00', ?)", (old,))
+
+    persistence = SQLitePersistence(max_age=24 * 3600)
+    conversations = asyncio.run(persistence.get_conversations('new_order'))
+    assert conversations == {(2, 2): 1}
+    assert persistence.pruned == 2
+
+
+if __name__ == '__main__':
+    test_conversation_survives_restart()
+    test_changes_batched_into_one_transaction()
+    test_end_and_drop_delete_rows()
+    test_stale_entries_pruned_on_load()
+    print("All conversation store tests passed")
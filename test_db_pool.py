@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""Тест пула соединений SQLite (database.ConnectionPool) и асинхронного слоя"""
+import sys
+import os
+import asyncio
+import tempfile
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import database
+from services.user_manager import UserManager, AsyncUserManager
+from services.order_service import AsyncOrderService
+
+
+def setup_temp_db():
+    """Создать временную БД и переключить на нее пул"""
+    tmp_dir = tempfile.mkdtemp()
+    database.configure(os.path.join(tmp_dir, 'orders.db'))
+    database.init_db()
+    return tmp_dir
+
+
+def test_pragmas_applied():
+    """PRAGMA применяются при создании соединения"""
+    setup_temp_db()
+
+    with database.db_connection() as conn:
+        journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        synchronous = conn.execute('PRAGMA synchronous').fetchone()[0]
+        busy_timeout = conn.execute('PRAGMA busy_timeout').fetchone()[0]
+
+    print(f"journal_mode={journal_mode}, synchronous={synchronous}, busy_timeout={busy_timeout}")
+    assert journal_mode == 'wal'
+    assert synchronous == 1  # NORMAL
+    assert busy_timeout == 5000
+
+
+def test_connections_reused():
+    """Повторные вызовы сервисов используют соединения из пула"""
+    setup_temp_db()
+
+    UserManager.register_user(5001, "Мороков Александр Александрович", "technician")
+    for _ in range(20):
+        UserManager.get_user_by_telegram_id(5001)
+
+    stats = database.get_pool_stats()
+    print(f"Pool stats: {stats}")
+    assert stats['size'] == 1
+    assert stats['misses'] == 1
+    assert stats['hits'] >= 21
+
+
+def test_rollback_on_error():
+    """При исключении транзакция откатывается, соединение возвращается в пул"""
+    setup_temp_db()
+
+    try:
+        with database.db_connection() as conn:
+            conn.execute("INSERT INTO users (telegram_id, name, role) VALUES (1, 'Тест', 'doctor')")
+            raise RuntimeError('boom')
+    except RuntimeError:
+        pass
+
+    assert UserManager.get_user_by_telegram_id(1) is None
+    assert database.get_pool_stats()['idle'] == 1
+
+
+def test_pool_bounded_under_concurrency():
+    """Пул не создает больше max_size соединений, лишние потоки ждут"""
+    setup_temp_db()
+    UserManager.register_user(5002, "Сидоров Иван Петрович", "doctor")
+
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(50):
+                assert UserManager.get_user_by_telegram_id(5002)['name'] == "Сидоров Иван Петрович"
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    stats = database.get_pool_stats()
+    print(f"Pool stats after concurrency: {stats}")
+    assert not errors
+    assert stats['size'] <= stats['max_size']
+
+
+def test_async_services_run_off_event_loop():
+    """Async-обертки выполняют запросы в потоках БД, а не в event loop"""
+    setup_temp_db()
+    UserManager.register_user(5003, "Плюхин Олег Игоревич", "technician")
+
+    async def scenario():
+        loop_thread = threading.current_thread()
+        calls = []
+
+        def probe():
+            calls.append(threading.current_thread())
+            return UserManager.get_user_by_telegram_id(5003)
+
+        user = await database.run_db(probe)
+        order_id = await AsyncOrderService.create_order(
+            doctor_id=None, technician_id=user['id'], patient_name='Анохин',
+            work_type='металлокерамическая коронка', quantity=None,
+            deadline='02.04.2026', description='', photo_id=None
+        )
+        found = await AsyncUserManager.find_user_by_name("Плюхин", "technician")
+        return loop_thread, calls, order_id, found, AsyncUserManager.is_user_admin(user)
+
+    loop_thread, calls, order_id, found, is_admin = asyncio.run(scenario())
+    database.shutdown_db_executor()
+
+    assert calls[0] is not loop_thread
+    assert order_id == 1
+    assert found['telegram_id'] == 5003
+    assert is_admin is False
+
+
+if __name__ == '__main__':
+    test_pragmas_applied()
+    test_connections_reused()
+    test_rollback_on_error()
+    test_pool_bounded_under_concurrency()
+    test_async_services_run_off_event_loop()
+    print("All pool tests passed")
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Тест нормализации названий работ по правилам (services.dental_rules)
+
+Корпус собран из примеров WORK_TYPE_SYSTEM_PROMPT, test_dental_terminology.py
+и названий работ из реальных заказов. None - фраза должна уйти в OpenRouter.
+"""
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from services.dental_rules import DentalRuleNormalizer, classify_token
+from services.message_processor import MessageProcessor
+
+
+CORPUS = [
+    # Коронки
+    ("циркон", "коронка из диоксида циркония"),
+    ("циркон на винте7шт", "коронка из диоксида циркония на винте"),
+    ("Циркон на винт", "коронка из диоксида циркония на винте"),
+    ("циркон на винтах 4 шт", "коронка из диоксида циркония на винте"),
+    ("цирконий", "коронка из диоксида циркония"),
+    ("циркониевая коронка", "коронка из диоксида циркония"),
+    ("цельноцирконевая коронка на винте", "коронка из диоксида циркония на винте"),
+    ("коронка из диоксида циркония на винте", "коронка из диоксида циркония на винте"),
+    ("циркон на абатменте", "коронка из диоксида циркония на абатменте"),
+    ("мк", "металлокерамическая коронка"),
+    ("МК 2шт", "металлокерамическая коронка"),
+    ("м/к на винте", "металлокерамическая коронка на винте"),
+    ("металлокерамика", "металлокерамическая коронка"),
+    ("металлокерамика 2 шт", "металлокерамическая коронка"),
+    ('"металлокерамическая коронка"', "металлокерамическая коронка"),
+    ("металлокерамические коронки", "металлокерамическая коронка"),
+    ("керамика", "безметалловая керамическая коронка"),
+    ("керамическая коронка", "безметалловая керамическая коронка"),
+    ("безметалловая коронка", "безметалловая керамическая коронка"),
+    ("пластмасса", "пластмассовая коронка"),
+    ("пластмассовые коронки на винте", "пластмассовая коронка на винте"),
+    ("цельнометаллическая коронка на абатменте", "цельнометаллическая коронка на абатменте"),
+    ("цм коронка", "цельнометаллическая коронка"),
+    ("коронка на импланте", "коронка на имплантах"),
+    ("коронок на импланте", "коронка на имплантах"),
+    ("временная коронка", "временная коронка"),
+    # Виниры
+    ("виниры", "виниры"),
+    ("виниры циркон", "керамические виниры из диоксида циркония"),
+    ("виниры из диоксида", "керамические виниры из диоксида циркония"),
+    ("безметалловые виниры циркон", "безметалловые виниры из диоксида циркония"),
+    ("металлокерамические виниры", "металлокерамические виниры"),
+    # Мосты
+    ("мост циркон 4 зуба", "мост из диоксида циркония"),
+    ("мост из диоксида циркония", "мост из диоксида циркония"),
+    ("цельноцирконевый мост", "мост из диоксида циркония"),
+    ("мост на имплантах циркон", "мост из диоксида циркония на имплантах"),
+    ("пластмассовый мост", "пластмассовый мост"),
+    ("металлокерамический мост", "металлокерамический мост"),
+    # Протезы, шины, вкладки, прочее
+    ("бюгельный протез", "бюгельный протез"),
+    ("бюгельный", "бюгельный протез"),
+    ("полный съемный", "полный съемный протез"),
+    ("частичный съёмный протез", "частичный съемный протез"),
+    ("нейлоновый протез", "нейлоновый протез"),
+    ("временная шина", "временная шина"),
+    ("ортодонтическая шина", "ортодонтическая шина"),
+    ("иммобилизующая шина", "иммобилизующая шина"),
+    ("индиректная вкладка", "индиректная вкладка"),
+    ("корневая вкладка", "корневая вкладка"),
+    ("вкладка керамика", "вкладка из керамики"),
+    ("вкладка из диоксида циркония", "вкладка из диоксида циркония"),
+    ("керамические брекеты", "керамические брекеты"),
+    ("металлические брекеты", "металлические брекеты"),
+    ("абатмент", "абатмент"),
+    ("кламмеры", "кламмеры"),
+    ("элайнеры", "элайнеры"),
+    ("елайнеры", "элайнеры"),
+    # Неизвестные или неоднозначные фразы - в OpenRouter
+    ("зелайнеры", None),
+    ("отбеливание", None),
+    ("шинирование", None),
+    ("мостовидный протез", None),
+    ("на винте", None),
+    ("на абатменте", None),
+    ("мост коронка", None),
+    ("бюгельная коронка", None),
+    ("металлокерамика циркон", None),
+    ("металлокерамика 8 шт на 31.03.2026 врач Гаспарянидзе пациент Широкова", None),
+    ("", None),
+]
+
+
+def test_corpus():
+    """Каждая фраза корпуса дает ожидаемый результат"""
+    normalizer = DentalRuleNormalizer()
+    failures = []
+
+    for text, expected in CORPUS:
+        result = normalizer.normalize(text)
+        if result != expected:
+            failures.append((text, expected, result))
+
+    for text, expected, result in failures:
+        print(f"'{text}': expected {expected!r}, got {result!r}")
+    assert not failures
+
+
+def test_canonical_forms_are_stable():
+    """Повторная нормализация канонического названия его не меняет"""
+    normalizer = DentalRuleNormalizer()
+
+    for _, expected in CORPUS:
+        if expected:
+            assert normalizer.normalize(expected) == expected
+
+
+def test_suffix_matching():
+    """Основа распознается только с допустимым окончанием"""
+    assert classify_token('коронками') == ('product', 'коронк')
+    assert classify_token('винирах') == ('product', 'винир')
+    assert classify_token('винтах') == ('construction', 'винт')
+    assert classify_token('мостовидный') is None
+    assert classify_token('шинирование') is None
+
+
+def test_processor_skips_llm_for_known_phrases():
+    """Известная правилам фраза не попадает ни в ИИ, ни в кэш"""
+    processor = MessageProcessor()
+    processor.dental_service.client = None
+
+    assert processor.normalize_dental_terminology("циркон на винте") == "коронка из диоксида циркония на винте"
+    assert processor.terminology_cache.get_stats()['size'] == 0
+
+
+def test_simple_parser_uses_rules_without_network():
+    """Простой парсер (normalize=False) нормализует вид работы правилами"""
+    processor = MessageProcessor()
+
+    result = processor.parse_message_simple("Плюхин металлокерамика 2 шт", normalize=False)
+
+    assert result['work_type'] == "металлокерамическая коронка"
+
+
+if __name__ == '__main__':
+    test_corpus()
+    test_canonical_forms_are_stable()
+    test_suffix_matching()
+    test_processor_skips_llm_for_known_phrases()
+    test_simple_parser_uses_rules_without_network()
+    print("All dental rules tests passed")
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""Тест выгрузки заказов и отчетов в XLSX/CSV (/export)
+
+Telegram подменяется фейковым сообщением, файлы никуда не отправляются.
+"""
+import sys
+import os
+import csv
+import asyncio
+import zipfile
+import tempfile
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import database
+from database import db_connection
+from services.user_manager import UserManager
+from services.export_service import ExportService
+from handlers.reports import export_command, parse_export_args
+
+NS = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+
+
+def setup():
+    """Временная БД: 3 заказа в марте, 1 в апреле, один с управляющими символами в описании"""
+    database.configure(os.path.join(tempfile.mkdtemp(), 'orders.db'))
+    database.init_db()
+    UserManager.register_user(401, "Мороков Александр", "technician")
+    UserManager.register_user(501, "Гаспарянидзе Нино", "doctor", is_admin=True)
+    technician = UserManager.get_user_by_telegram_id(401)['id']
+    doctor = UserManager.get_user_by_telegram_id(501)['id']
+    with db_connection() as conn:
+        conn.executemany('''
+            INSERT INTO orders (doctor_id, technician_id, patient_name, work_type, quantity, deadline, description, created_at)
+            VALUES (?, ?, ?, ?, ?, '20.03.2026', ?, ?)
+        ''', [
+            (doctor, technician, 'Иванов', 'мост', 2, 'обычный', '2026-03-01 09:00:00'),
+            (doctor, technician, 'Петров <А&Б>', 'коронка', 1, 'символ\x01внутри', '2026-03-15 12:00:00'),
+            (None, technician, 'Сидоров', 'мост', 3, '', '2026-03-31 23:59:00'),
+            (doctor, None, 'Кузнецов', 'винир', 1, '', '2026-04-01 00:00:00'),
+        ])
+
+
+def read_xlsx(path: str) -> dict:
+    """{название листа: [[значения ячеек]]}"""
+    with zipfile.ZipFile(path) as archive:
+        workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+        names = [sheet.get('name') for sheet in workbook.find('x:sheets', NS)]
+        sheets = {}
+        for index, name in enumerate(names, 1):
+            root = ET.fromstring(archive.read(f'xl/worksheets/sheet{index}.xml'))
+            rows = []
+            for row in root.find('x:sheetData', NS):
+                values = []
+                for cell in row:
+                    text = cell.find('x:is/x:t', NS)
+                    value = cell.find('x:v', NS)
+                    values.append(text.text if text is not None else (int(value.text) if value is not None else None))
+                rows.append(values)
+            sheets[name] = rows
+    return sheets
+
+
+def test_orders_xlsx():
+    setup()
+    result = ExportService.export_orders('01.03.2026', '31.03.2026', 'xlsx')
+    try:
+        sheets = read_xlsx(result['path'])
+        rows = sheets['Заказы']
+        assert rows[0][:3] == ['№', 'Создан', 'Врач']
+        assert [row[0] for row in rows[1:]] == [1, 2, 3] and result['rows'] == 3
+        assert rows[2][4] == 'Петров <А&Б>' and rows[2][9] == 'символвнутри'
+        assert rows[3][2] is None and rows[3][8] == 'в работе'
+        assert result['filename'] == 'orders_2026-03-01_2026-03-31.xlsx'
+    finally:
+        os.remove(result['path'])
+
+
+def test_orders_csv_all_time():
+    setup()
+    result = ExportService.export_orders(file_format='csv')
+    try:
+        with open(result['path'], encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.reader(f, delimiter=';'))
+        assert rows[0] == ['Заказы'] and rows[1][0] == '№'
+        assert len(rows) == 2 + 4 and rows[-1][4] == 'Кузнецов'
+        assert result['filename'] == 'orders_all.csv'
+    finally:
+        os.remove(result['path'])
+
+
+def test_formula_like_text_stays_text():
+    """Текст вида "=..." не становится формулой ни в CSV, ни в XLSX"""
+    setup()
+    with db_connection() as conn:
+        conn.execute('''
+            INSERT INTO orders (patient_name, work_type, quantity, deadline, description, created_at)
+            VALUES ('=HYPERLINK("http://example.com","Иванов")', '@SUM(A1)', 1, '-2', '+7 900', '2026-03-20 10:00:00')
+        ''')
+
+    csv_result = ExportService.export_orders(file_format='csv')
+    xlsx_result = ExportService.export_orders(file_format='xlsx')
+    try:
+        with open(csv_result['path'], encoding='utf-8-sig', newline='') as f:
+            row = list(csv.reader(f, delimiter=';'))[-1]
+        assert row[4:8] == ['\'=HYPERLINK("http://example.com","Иванов")', "'@SUM(A1)", '1', "'-2"]
+        assert row[9] == "'+7 900"
+
+        with zipfile.ZipFile(xlsx_result['path']) as archive:
+            sheet = archive.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        assert '<f>' not in sheet
+        row = read_xlsx(xlsx_result['path'])['Заказы'][-1]
+        assert row[4:8] == ['=HYPERLINK("http://example.com","Иванов")', '@SUM(A1)', 1, '-2']
+    finally:
+        os.remove(csv_result['path'])
+        os.remove(xlsx_result['path'])
+
+
+def test_report_xlsx_sheets():
+    setup()
+    result = ExportService.export_report('01.03.2026', '31.03.2026', 'xlsx')
+    try:
+        sheets = read_xlsx(result['path'])
+        assert list(sheets) == ['Итого', 'Врачи', 'Техники', 'Виды работ']
+        assert ['Всего заказов', 3] in sheets['Итого'] and ['Всего единиц', 6] in sheets['Итого']
+        assert sheets['Техники'][1:] == [['Мороков Александр', 'коронка', 1, 1], ['Мороков Александр', 'мост', 2, 5]]
+        assert sheets['Виды работ'][1] == ['мост', 2, 5]
+    finally:
+        os.remove(result['path'])
+
+
+def test_parse_export_args():
+    assert parse_export_args(['orders', '01.03.2026', '31.03.2026', 'csv']) == ('orders', '01.03.2026', '31.03.2026', 'csv')
+    assert parse_export_args(['report', '01.03.2026', '31.03.2026']) == ('report', '01.03.2026', '31.03.2026', 'xlsx')
+    kind, start, end, file_format = parse_export_args(['orders'])
+    assert start.startswith('01.') and file_format == 'xlsx'
+    assert parse_export_args([]) is None
+    assert parse_export_args(['orders', '31.03.2026', '01.03.2026']) is None
+    assert parse_export_args(['orders', 'завтра']) is None
+
+
+def test_export_command_sends_document():
+    setup()
+    sent = []
+
+    class FakeMessage:
+        async def reply_text(self, text, **kwargs):
+            sent.append(('text', text))
+
+        async def reply_document(self, document, filename, caption=None, **kwargs):
+            sent.append(('document', filename, document.name, len(document.read())))
+
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=501), message=FakeMessage())
+    context = SimpleNamespace(args=['report', '01.03.2026', '31.03.2026', 'csv'])
+    asyncio.run(export_command(update, context))
+
+    kind, filename, path, size = sent[-1]
+    assert kind == 'document' and filename == 'report_2026-03-01_2026-03-31.csv' and size > 0
+    # временный файл удален после отправки
+    assert not os.path.exists(path)
+
+
+if __name__ == '__main__':
+    test_orders_xlsx()
+    test_orders_csv_all_time()
+    test_formula_like_text_stays_text()
+    test_report_xlsx_sheets()
+    test_parse_export_args()
+    test_export_command_sends_document()
+    print("All export tests passed")
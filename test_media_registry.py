@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""Тест повторного использования фото по file_id (MediaRegistry)
+
+Telegram подменяется фейковым ботом, сообщения никуда не отправляются.
+"""
+import sys
+import os
+import asyncio
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from telegram.error import BadRequest
+
+import database
+from database import db_connection
+from services.user_manager import UserManager
+from services.notification_service import NotificationService
+from services.notification_fanout import NotificationFanout, TelegramRateLimiter
+from services.media_registry import MediaRegistry, CAPTION_LIMIT
+from services.outbox import OutboxWorker
+from services.order_service import OrderService
+
+
+class RecordingBot:
+    """Имитация telegram.Bot: записывает вызовы, file_id из invalid отвергает"""
+
+    def __init__(self, invalid: tuple = ()):
+        self.invalid = invalid
+        self.calls = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls.append(('message', chat_id, text))
+
+    async def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        if photo in self.invalid:
+            self.calls.append(('photo_failed', chat_id, caption))
+            raise BadRequest("Wrong file identifier/http url specified")
+        self.calls.append(('photo', chat_id, caption))
+
+
+def setup(bot: RecordingBot):
+    """Временная БД с техником, врачом и администратором, свежий реестр фото"""
+    database.configure(os.path.join(tempfile.mkdtemp(), 'orders.db'))
+    database.init_db()
+    UserManager.register_user(401, "Мороков Александр Александрович", "technician")
+    UserManager.register_user(402, "Гаспарянидзе Нино Георгиевна", "doctor")
+    UserManager.register_user(501, "Админ Главный", "dispatcher", is_admin=True)
+
+    service = NotificationService('123456:TEST')
+    service.bot = bot
+    service.fanout = NotificationFanout(8, TelegramRateLimiter(rate=1000.0, chat_interval=0.0))
+    service.media = MediaRegistry()
+
+    technician = UserManager.get_user_by_telegram_id(401)
+    doctor = UserManager.get_user_by_telegram_id(402)
+    order = {'technician_id': technician['id'], 'doctor_id': doctor['id'],
+             'technician_name': technician['name'], 'doctor_name': doctor['name'],
+             'patient_name': 'Иванов', 'work_type': 'мост', 'quantity': 1, 'deadline': None}
+    return service, OutboxWorker(service), order
+
+
+def create_order(service: NotificationService, order: dict, photo_id: str) -> int:
+    """Как /neworder: заказ с фото и уведомления о нем - одной транзакцией"""
+    notifications = asyncio.run(service.new_order_notifications(order, 900, photo_id))
+    return OrderService.create_order(order['doctor_id'], order['technician_id'], order['patient_name'],
+                                     order['work_type'], order['quantity'], '20.03.2026', '', photo_id,
+                                     notifications=notifications)
+
+
+def test_file_id_reused_by_all_recipients():
+    """Одно фото уходит всем получателям по file_id, отправки считаются по заказу"""
+    bot = RecordingBot()
+    service, worker, order = setup(bot)
+    service.media.register('photo-ok', 'uniq-1', 200000)
+
+    order_id = create_order(service, order, 'photo-ok')
+    asyncio.run(worker.process_batch())
+
+    photo_calls = [call for call in bot.calls if call[0] == 'photo']
+    # техник, врач, администратор; диспетчеру - только текст
+    assert {chat_id for _, chat_id, _ in photo_calls} == {401, 402, 501}
+    assert ('message', 900) in [(kind, chat_id) for kind, chat_id, _ in bot.calls]
+
+    # первая волна: текст диспетчеру и одно пробное фото, вторая - остальные фото
+    assert sorted(kind for kind, _, _ in bot.calls[:2]) == ['message', 'photo']
+    assert [kind for kind, _, _ in bot.calls[2:]] == ['photo', 'photo']
+
+    stats = service.media.get_order_stats(order_id)
+    assert stats == {'photo_sends': 3, 'photos_skipped': 0}
+    assert service.media.is_confirmed('photo-ok')
+
+
+def test_invalid_file_id_falls_back_to_text():
+    """Недействительный file_id проверяется одним запросом, остальные получают текст"""
+    bot = RecordingBot(invalid=('photo-bad',))
+    service, worker, order = setup(bot)
+
+    order_id = create_order(service, order, 'photo-bad')
+    asyncio.run(worker.process_batch())
+
+    assert len([call for call in bot.calls if call[0] == 'photo_failed']) == 1
+    assert {chat_id for kind, chat_id, _ in bot.calls if kind == 'message'} == {900, 401, 402, 501}
+    assert service.media.get_order_stats(order_id)['photos_skipped'] == 2
+    assert not service.media.is_valid('photo-bad')
+
+    # признак сохраняется в БД и переживает перезапуск
+    with db_connection() as conn:
+        assert conn.execute("SELECT valid FROM media WHERE file_id = 'photo-bad'").fetchone() == (0,)
+    restarted = MediaRegistry()
+    restarted.load()
+    assert not restarted.is_valid('photo-bad')
+
+
+def test_long_caption_sent_separately():
+    """Текст длиннее лимита подписи уходит отдельным сообщением после фото"""
+    bot = RecordingBot()
+    service, worker, order = setup(bot)
+    order['description'] = 'очень длинные заметки ' * 80
+
+    asyncio.run(service.delivery(401, service.technician_message(order), 'photo-ok')())
+
+    assert [kind for kind, _, _ in bot.calls] == ['photo', 'message']
+    assert bot.calls[0][2] is None
+    assert len(bot.calls[1][2]) > CAPTION_LIMIT
+
+
+if __name__ == '__main__':
+    test_file_id_reused_by_all_recipients()
+    test_invalid_file_id_falls_back_to_text()
+    test_long_caption_sent_separately()
+    print("All media registry tests passed")
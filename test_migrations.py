@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""Тест версионных миграций схемы (schema_version, заполнение пачками, dry run)"""
+import sys
+import os
+import threading
+import io
+import sqlite3
+import tempfile
+from contextlib import redirect_stdout
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import database
+from database import db_connection
+from migrations import MIGRATIONS, run_migrations, run_backfills, get_schema_version, dry_run, print_dry_run
+
+LEGACY_SCHEMA = '''
+    CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        telegram_id INTEGER UNIQUE,
+        name TEXT NOT NULL,
+        role TEXT NOT NULL,
+        is_admin INTEGER DEFAULT 0,
+        reference_id INTEGER,
+        is_active INTEGER DEFAULT 1,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        doctor_id INTEGER,
+        technician_id INTEGER,
+        patient_name TEXT,
+        work_type TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        deadline TEXT NOT NULL,
+        description TEXT,
+        photo_id TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        status TEXT DEFAULT 'in_progress'
+    );
+    CREATE TABLE reminders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL,
+        reminder_type TEXT NOT NULL,
+        sent_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+'''
+
+LATEST = MIGRATIONS[-1].version
+
+
+def legacy_db(orders_count: int = 25) -> str:
+    """БД до появления миграций: базовые таблицы, deadline только текстом"""
+    db_path = os.path.join(tempfile.mkdtemp(), 'orders.db')
+    conn = sqlite3.connect(db_path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.executemany(
+        'INSERT INTO orders (work_type, quantity, deadline) VALUES (?, ?, ?)',
+        [('мост', 1, f'{i % 28 + 1:02d}.03.2026' if i % 5 else 'не указан') for i in range(orders_count)]
+    )
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def tables() -> set:
+    with db_connection() as conn:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index')")}
+
+
+def test_fresh_database_reaches_latest_version():
+    database.configure(os.path.join(tempfile.mkdtemp(), 'orders.db'))
+    database.init_db()
+
+    assert get_schema_version() == LATEST
+    assert {'users', 'orders', 'reminders', 'terminology_cache', 'outbox', 'media',
+            'idx_orders_status_deadline', 'idx_outbox_due'} <= tables()
+
+    with db_connection() as conn:
+        versions = [row[0] for row in conn.execute('SELECT version FROM schema_version ORDER BY version')]
+    assert versions == [m.version for m in MIGRATIONS]
+
+
+def test_rerun_is_noop():
+    """Повторный запуск ничего не применяет"""
+    database.configure(os.path.join(tempfile.mkdtemp(), 'orders.db'))
+    assert run_migrations() == [m.version for m in MIGRATIONS]
+    assert run_migrations() == []
+    database.init_db()
+    assert get_schema_version() == LATEST
+
+
+def test_backfill_stops_between_batches_and_resumes():
+    """Остановка бота прерывает заполнение; следующий запуск его заканчивает"""
+    database.configure(legacy_db(25))
+    run_migrations(backfill=False, batch_size=4)
+
+    stop = threading.Event()
+    stop.set()
+    assert run_backfills(batch_size=4, stop=stop) == 0
+    with db_connection() as conn:
+        assert conn.execute('SELECT backfilled FROM schema_version WHERE version = 5').fetchone() == (0,)
+
+    assert run_backfills(batch_size=4) == 25
+    with db_connection() as conn:
+        assert conn.execute('SELECT backfilled FROM schema_version WHERE version = 5').fetchone() == (1,)
+
+
+def test_legacy_database_backfilled_in_batches():
+    """Старая БД без schema_version обновляется, deadline_date заполняется пачками"""
+    database.configure(legacy_db(25))
+
+    run_migrations(backfill=False, batch_size=4)
+    with db_connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM orders WHERE deadline_date IS NOT NULL').fetchone()[0] == 0
+        assert conn.execute('SELECT backfilled FROM schema_version WHERE version = 5').fetchone() == (0,)
+
+    assert run_backfills(batch_size=4) == 25
+    with db_connection() as conn:
+        rows = conn.execute('SELECT deadline, deadline_date FROM orders ORDER BY id').fetchall()
+        assert conn.execute('SELECT backfilled FROM schema_version WHERE version = 5').fetchone() == (1,)
+
+    for deadline, deadline_date in rows:
+        if deadline == 'не указан':
+            assert deadline_date is None
+        else:
+            assert deadline_date == f'2026-03-{deadline[:2]}'
+
+    # все заполнено, повторно ничего не делается
+    assert run_backfills(batch_size=4) == 0
+
+
+def test_duplicate_reminders_removed_before_unique_index():
+    """Дубли отметок напоминаний (повторы, перезапуски) удаляются, ключ становится уникальным"""
+    db_path = legacy_db(3)
+    conn = sqlite3.connect(db_path)
+    conn.executemany('INSERT INTO reminders (order_id, reminder_type) VALUES (?, ?)',
+                     [(1, 'today'), (1, 'today'), (2, 'today'), (1, 'today')])
+    conn.commit()
+    conn.close()
+
+    database.configure(db_path)
+    run_migrations()
+    with db_connection() as conn:
+        assert conn.execute('SELECT id, order_id FROM reminders ORDER BY id').fetchall() == [(1, 1), (3, 2)]
+        try:
+            conn.execute("INSERT INTO reminders (order_id, reminder_type) VALUES (2, 'today')")
+            assert False, 'duplicate reminder accepted'
+        except sqlite3.IntegrityError:
+            pass
+
+
+def test_dry_run_changes_nothing():
+    """Dry run показывает шаги и планы запросов, схема не меняется"""
+    database.configure(legacy_db(10))
+    before = tables()
+
+    report = dry_run()
+    assert [item['version'] for item in report] == [m.version for m in MIGRATIONS]
+    assert tables() == before
+    assert get_schema_version() == 0
+
+    deadline_item = next(item for item in report if item['version'] == 5)
+    assert deadline_item['pending_rows'] == 10
+
+    index_item = next(item for item in report if item['version'] == 6)
+    before_plan, after_plan = index_item['plans']['reminders due tomorrow']
+    assert not any('idx_orders_status_deadline' in line for line in before_plan)
+    assert any('idx_orders_status_deadline' in line for line in after_plan)
+
+    output = io.StringIO()
+    with redirect_stdout(output):
+        print_dry_run(report)
+    assert 'plan [reminders due tomorrow]' in output.getvalue()
+
+    run_migrations()
+    assert dry_run() == []
+
+
+if __name__ == '__main__':
+    test_fresh_database_reaches_latest_version()
+    test_rerun_is_noop()
+    test_legacy_database_backfilled_in_batches()
+    test_backfill_stops_between_batches_and_resumes()
+    test_duplicate_reminders_removed_before_unique_index()
+    test_dry_run_changes_nothing()
+    print("All migration tests passed")
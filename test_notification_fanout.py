@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""Тест параллельной рассылки уведомлений (NotificationFanout)
+
+Telegram подменяется фейковым ботом с задержкой, сообщения никуда не отправляются.
+"""
+import sys
+import os
+import time
+import asyncio
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import database
+from services.user_manager import UserManager
+from services.notification_service import NotificationService
+from services.notification_fanout import NotificationFanout, TelegramRateLimiter
+
+
+class SlowBot:
+    """Имитация telegram.Bot: отвечает через delay секунд (для slow_chats - slow_delay)"""
+
+    def __init__(self, delay: float = 0.05, slow_chats: tuple = (), slow_delay: float = 1.0, failing_chats: tuple = ()):
+        self.delay = delay
+        self.slow_chats = slow_chats
+        self.slow_delay = slow_delay
+        self.failing_chats = failing_chats
+        self.sent = []
+
+    async def _send(self, chat_id, text):
+        await asyncio.sleep(self.slow_delay if chat_id in self.slow_chats else self.delay)
+        if chat_id in self.failing_chats:
+            raise RuntimeError("Forbidden: bot was blocked by the user")
+        self.sent.append((chat_id, time.monotonic(), text))
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self._send(chat_id, text)
+
+    async def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        await self._send(chat_id, caption)
+
+
+def setup_service(bot: SlowBot, max_concurrency: int = 8, rate: float = 1000.0) -> NotificationService:
+    """Временная БД с техником, врачом и тремя администраторами"""
+    database.configure(os.path.join(tempfile.mkdtemp(), 'orders.db'))
+    database.init_db()
+    UserManager.register_user(401, "Мороков Александр Александрович", "technician")
+    UserManager.register_user(402, "Гаспарянидзе Нино Георгиевна", "doctor")
+    for telegram_id in (501, 502, 503):
+        UserManager.register_user(telegram_id, f"Админ {telegram_id}", "dispatcher", is_admin=True)
+
+    service = NotificationService('123456:TEST')
+    service.bot = bot
+    service.fanout = NotificationFanout(max_concurrency, TelegramRateLimiter(rate=rate, chat_interval=1.0))
+    return service
+
+
+def make_order() -> dict:
+    technician = UserManager.get_user_by_telegram_id(401)
+    doctor = UserManager.get_user_by_telegram_id(402)
+    return {
+        'id': 1, 'technician_id': technician['id'], 'doctor_id': doctor['id'],
+        'technician_name': technician['name'], 'doctor_name': doctor['name'],
+        'patient_name': 'Иванов', 'work_type': 'мост', 'quantity': 3, 'deadline': None
+    }
+
+
+async def send_order(service: NotificationService, order: dict) -> list:
+    """Разослать сообщения о заказе напрямую через fanout (как это делает OutboxWorker)"""
+    build = await service.new_order_notifications(order, 900)
+    messages = build(order['id'])
+    return await service.fanout.send_all([
+        (m['chat_id'], service.delivery(m['chat_id'], m['text'], m.get('photo_id')), m['kind'])
+        for m in messages
+    ])
+
+
+def test_recipients_sent_concurrently():
+    """Все получатели обслуживаются параллельно, а не друг за другом"""
+    bot = SlowBot(delay=0.2)
+    service = setup_service(bot)
+    order = make_order()
+
+    started = time.monotonic()
+    results = asyncio.run(send_order(service, order))
+    elapsed = time.monotonic() - started
+
+    # диспетчер, техник, врач и три администратора
+    assert len(results) == 6
+    assert all(result['ok'] for result in results)
+    assert {chat_id for chat_id, _, _ in bot.sent} == {900, 401, 402, 501, 502, 503}
+    assert elapsed < 0.6, elapsed
+    assert service.fanout.get_stats()['max_in_flight'] == 6
+
+
+def test_concurrency_is_bounded():
+    """Одновременно выполняется не больше max_concurrency отправок"""
+    bot = SlowBot(delay=0.1)
+    service = setup_service(bot, max_concurrency=2)
+
+    results = asyncio.run(send_order(service, make_order()))
+
+    assert all(result['ok'] for result in results)
+    assert service.fanout.get_stats()['max_in_flight'] == 2
+
+
+def test_rate_limits():
+    """Сообщения в один чат идут не чаще chat_interval, общий поток - не чаще rate"""
+    limiter = TelegramRateLimiter(rate=20.0, chat_interval=0.3)
+    fanout = NotificationFanout(8, limiter)
+    stamps = []
+
+    def job(chat_id):
+        async def send():
+            stamps.append((chat_id, time.monotonic()))
+        return (chat_id, send, str(chat_id))
+
+    asyncio.run(fanout.send_all([job(1), job(1), job(2), job(3), job(4)]))
+
+    same_chat = [stamp for chat_id, stamp in stamps if chat_id == 1]
+    assert same_chat[1] - same_chat[0] >= 0.29
+
+    # k-е сообщение уходит не раньше k * (1 / rate) после первого
+    # (отправка может опоздать из-за планировщика, но не поторопиться)
+    ordered = sorted(stamp for _, stamp in stamps)
+    offsets = [stamp - ordered[0] for stamp in ordered]
+    assert all(offset >= k * 0.05 - 0.01 for k, offset in enumerate(offsets)), offsets
+    assert limiter.waits > 0
+
+
+def test_failure_does_not_block_others():
+    """Ошибка одного получателя не мешает остальным"""
+    bot = SlowBot(delay=0.0, failing_chats=(401,))
+    service = setup_service(bot)
+
+    results = asyncio.run(send_order(service, make_order()))
+
+    failed = [result for result in results if not result['ok']]
+    assert [result['label'] for result in failed] == ['technician']
+    assert 'blocked' in failed[0]['error']
+    assert isinstance(failed[0]['exception'], RuntimeError)
+    assert len(bot.sent) == 5
+
+
+if __name__ == '__main__':
+    test_recipients_sent_concurrently()
+    test_concurrency_is_bounded()
+    test_rate_limits()
+    test_failure_does_not_block_others()
+    print("All notification fan-out tests passed")
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Тест адресации уведомлений по записям и ID (NotificationService)
+
+Проверяются получатели сообщений о новом заказе (new_order_notifications),
+которые /neworder ставит в outbox.
+"""
+import sys
+import os
+import asyncio
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import database
+from services.user_manager import UserManager
+from services.notification_service import NotificationService
+
+
+def setup_service():
+    """Временная БД с техником и врачом"""
+    database.configure(os.path.join(tempfile.mkdtemp(), 'orders.db'))
+    database.init_db()
+    UserManager.register_user(301, "Мороков Александр Александрович", "technician")
+    UserManager.register_user(302, "Гаспарянидзе Нино Георгиевна", "doctor")
+
+    return NotificationService('123456:TEST')
+
+
+def count_queries() -> int:
+    stats = database.get_pool_stats()
+    return stats['hits'] + stats['misses']
+
+
+def test_records_need_no_queries():
+    """Переданные записи получателей не требуют поиска в БД (читаются только администраторы)"""
+    service = setup_service()
+    technician = UserManager.get_user_by_telegram_id(301)
+    doctor = UserManager.get_user_by_telegram_id(302)
+    # имя в заказе намеренно не совпадает: адресация идет только по записи
+    order = {'id': 1, 'technician_name': 'Неизвестный', 'doctor_name': None, 'work_type': 'мост'}
+
+    async def scenario():
+        before = count_queries()
+        build = await service.new_order_notifications(order, 900, 'photo-id', technician=technician, doctor=doctor)
+        return build(1), count_queries() - before
+
+    messages, queries = asyncio.run(scenario())
+    database.shutdown_db_executor()
+
+    assert queries == 1
+    assert [(m['kind'], m['chat_id']) for m in messages] == [('dispatcher', 900), ('technician', 301), ('doctor', 302)]
+
+
+def test_ids_resolved_in_one_query():
+    """По ID оба получателя загружаются одним запросом"""
+    service = setup_service()
+    technician = UserManager.get_user_by_telegram_id(301)
+    doctor = UserManager.get_user_by_telegram_id(302)
+    order = {'id': 1, 'technician_id': technician['id'], 'doctor_id': doctor['id']}
+
+    async def scenario():
+        before = count_queries()
+        recipients = await service.get_recipients(order)
+        return recipients, count_queries() - before
+
+    recipients, queries = asyncio.run(scenario())
+    database.shutdown_db_executor()
+
+    assert queries == 1
+    assert recipients['technician']['telegram_id'] == 301
+    assert recipients['doctor']['telegram_id'] == 302
+
+
+def test_inactive_or_missing_recipient_skipped():
+    """Неактивный или не указанный получатель не получает уведомление"""
+    service = setup_service()
+    technician = UserManager.get_user_by_telegram_id(301)
+    UserManager.update_user(technician['id'], is_active=0)
+
+    async def scenario():
+        build = await service.new_order_notifications({'technician_id': technician['id'], 'doctor_id': None}, 900)
+        return build(1)
+
+    messages = asyncio.run(scenario())
+    database.shutdown_db_executor()
+    # сообщение получает только диспетчер
+    assert [m['kind'] for m in messages] == ['dispatcher']
+
+
+if __name__ == '__main__':
+    test_records_need_no_queries()
+    test_ids_resolved_in_one_query()
+    test_inactive_or_missing_recipient_skipped()
+    print("All notification recipient tests passed")
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""Тест очереди исходящих уведомлений (OutboxService, OutboxWorker)
+
+Telegram подменяется фейковым ботом, сообщения никуда не отправляются.
+"""
+import sys
+import os
+import time
+import asyncio
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from telegram.error import RetryAfter, Forbidden, NetworkError
+
+import database
+from database import db_connection
+from services.user_manager import UserManager
+from services.notification_service import NotificationService
+from services.notification_fanout import NotificationFanout, TelegramRateLimiter
+from services.outbox import OutboxService, OutboxWorker, backoff_delay, get_outbox_worker
+from services.order_service import OrderService, AsyncOrderService
+
+
+class FlakyBot:
+    """Имитация telegram.Bot: для чатов из errors сначала выбрасывает ошибки по очереди"""
+
+    def __init__(self, errors: dict = None):
+        self.errors = {chat_id: list(queue) for chat_id, queue in (errors or {}).items()}
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        queue = self.errors.get(chat_id)
+        if queue:
+            raise queue.pop(0)
+        self.sent.append((chat_id, text))
+
+    async def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        await self.send_message(chat_id, caption)
+
+
+def setup(bot: FlakyBot):
+    """Временная БД с техником и администратором, worker с фейковым ботом"""
+    database.configure(os.path.join(tempfile.mkdtemp(), 'orders.db'))
+    database.init_db()
+    UserManager.register_user(401, "Мороков Александр Александрович", "technician")
+    UserManager.register_user(501, "Админ Главный", "dispatcher", is_admin=True)
+
+    service = NotificationService('123456:TEST')
+    service.bot = bot
+    service.fanout = NotificationFanout(8, TelegramRateLimiter(rate=1000.0, chat_interval=0.0))
+
+    technician = UserManager.get_user_by_telegram_id(401)
+    order = {'technician_id': technician['id'], 'technician_name': technician['name'],
+             'patient_name': 'Иванов', 'work_type': 'мост', 'quantity': 1, 'deadline': None}
+    return service, OutboxWorker(service), order
+
+
+async def create_order(service: NotificationService, order: dict, photo_id: str = None) -> int:
+    """Как /neworder: заказ и уведомления о нем - одной транзакцией, worker будится"""
+    notifications = await service.new_order_notifications(order, 900, photo_id)
+    order_id = await AsyncOrderService.create_order(None, order['technician_id'], order['patient_name'],
+                                                    order['work_type'], order['quantity'], '20.03.2026', '',
+                                                    photo_id, notifications=notifications)
+    get_outbox_worker().wake()
+    return order_id
+
+
+def make_due():
+    """Сделать все отложенные сообщения готовыми к отправке"""
+    with db_connection() as conn:
+        conn.execute("UPDATE outbox SET next_attempt_at = 0 WHERE status = 'pending'")
+
+
+def statuses() -> dict:
+    with db_connection() as conn:
+        return {(kind, chat_id): (status, attempts) for kind, chat_id, status, attempts in
+                conn.execute('SELECT kind, chat_id, status, attempts FROM outbox')}
+
+
+def test_enqueue_deduplicates():
+    """Одно и то же уведомление о заказе ставится в очередь один раз"""
+    service, worker, order = setup(FlakyBot())
+
+    order_id = asyncio.run(create_order(service, order))
+    build = asyncio.run(service.new_order_notifications(order, 900))
+    queued = OutboxService.enqueue(build(order_id))
+
+    # диспетчер, техник, администратор - уже в очереди с заказом
+    assert queued == 0
+    assert OutboxService.get_stats()['pending'] == 3
+
+
+def test_order_and_notifications_in_one_transaction():
+    """Заказ и его уведомления записываются вместе; при ошибке - ни того, ни другого"""
+    service, worker, order = setup(FlakyBot())
+
+    notifications = asyncio.run(service.new_order_notifications(order, 900))
+    order_id = OrderService.create_order(None, order['technician_id'], 'Иванов', 'мост', 1, '20.03.2026', '', None,
+                                         notifications=notifications)
+    with db_connection() as conn:
+        rows = conn.execute('SELECT order_id, kind, text FROM outbox').fetchall()
+    assert len(rows) == 3 and all(row[0] == order_id for row in rows)
+    # номер заказа в тексте - тот, что получил заказ в транзакции
+    assert any(kind == 'admin' and f"№{order_id}" in text for _, kind, text in rows)
+
+    def broken(order_id):
+        raise RuntimeError('notifications failed')
+
+    try:
+        OrderService.create_order(None, None, 'Петров', 'мост', 1, '20.03.2026', '', None, notifications=broken)
+        assert False, 'create_order should fail'
+    except RuntimeError:
+        pass
+    with db_connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM orders').fetchone() == (1,)
+        assert conn.execute('SELECT COUNT(*) FROM outbox').fetchone() == (3,)
+
+
+def test_enqueue_does_not_send():
+    """Создание заказа только ставит сообщения в очередь"""
+    bot = FlakyBot()
+    service, worker, order = setup(bot)
+
+    asyncio.run(create_order(service, order, photo_id='photo-1'))
+    assert bot.sent == []
+
+    assert asyncio.run(worker.process_batch()) == 3
+    assert {chat_id for chat_id, _ in bot.sent} == {900, 401, 501}
+
+    stats = OutboxService.get_stats()
+    assert stats['pending'] == 0 and stats['sent'] == 3
+    assert stats['sent_last_day'] == 3
+    assert asyncio.run(worker.process_batch()) == 0
+
+
+def test_transient_error_is_retried_with_backoff():
+    """Сетевая ошибка - повтор с экспоненциальной паузой"""
+    bot = FlakyBot({401: [NetworkError("timeout"), NetworkError("timeout")]})
+    service, worker, order = setup(bot)
+    asyncio.run(create_order(service, order))
+
+    asyncio.run(worker.process_batch())
+    assert statuses()[('technician', 401)] == ('pending', 1)
+    # до истечения паузы сообщение не берется
+    assert asyncio.run(worker.process_batch()) == 0
+
+    make_due()
+    asyncio.run(worker.process_batch())
+    assert statuses()[('technician', 401)] == ('pending', 2)
+
+    make_due()
+    asyncio.run(worker.process_batch())
+    assert statuses()[('technician', 401)] == ('sent', 3)
+    assert worker.get_stats()['retried'] == 2
+    assert backoff_delay(1) < backoff_delay(2) < backoff_delay(3)
+
+
+def test_retry_after_pauses_queue():
+    """RetryAfter приостанавливает очередь и не расходует попытку"""
+    bot = FlakyBot({401: [RetryAfter(30)]})
+    service, worker, order = setup(bot)
+    asyncio.run(create_order(service, order))
+
+    asyncio.run(worker.process_batch())
+
+    assert statuses()[('technician', 401)] == ('pending', 0)
+    assert worker.get_stats()['paused_for'] > 25
+
+    make_due()
+    assert asyncio.run(worker.process_batch()) == 0
+
+    worker._paused_until = 0
+    asyncio.run(worker.process_batch())
+    assert statuses()[('technician', 401)] == ('sent', 1)
+
+
+def test_permanent_error_notifies_dispatcher():
+    """Forbidden - без повторов, диспетчер получает предупреждение"""
+    bot = FlakyBot({401: [Forbidden("bot was blocked by the user")]})
+    service, worker, order = setup(bot)
+    order_id = asyncio.run(create_order(service, order))
+
+    asyncio.run(worker.process_batch())
+    assert statuses()[('technician', 401)] == ('failed', 1)
+
+    asyncio.run(worker.process_batch())
+    warnings = [text for chat_id, text in bot.sent if chat_id == 900 and text.startswith("⚠️")]
+    assert warnings == [f"⚠️ Заказ №{order_id}: уведомление НЕ доставлено (technician)"]
+    assert OutboxService.get_stats()['failed'] == 1
+
+
+def test_gives_up_after_max_attempts():
+    """После max_attempts сообщение помечается failed"""
+    bot = FlakyBot({401: [NetworkError("down")] * 10})
+    service, worker, order = setup(bot)
+    worker.max_attempts = 3
+    asyncio.run(create_order(service, order))
+
+    for _ in range(3):
+        make_due()
+        asyncio.run(worker.process_batch())
+
+    assert statuses()[('technician', 401)] == ('failed', 3)
+
+
+def test_worker_loop_wakes_on_enqueue():
+    """Worker отправляет сразу после постановки, не дожидаясь опроса"""
+    bot = FlakyBot()
+    service, _, order = setup(bot)
+    worker = get_outbox_worker()
+    worker.notification_service = service
+    worker.poll_interval = 60
+
+    async def scenario():
+        task = asyncio.create_task(worker.run())
+        await asyncio.sleep(0.05)
+
+        started = time.monotonic()
+        await create_order(service, order)
+        while len(bot.sent) < 3 and time.monotonic() - started < 2:
+            await asyncio.sleep(0.01)
+        elapsed = time.monotonic() - started
+
+        worker.stop()
+        await asyncio.wait_for(task, timeout=1)
+        return elapsed
+
+    elapsed = asyncio.run(scenario())
+    assert len(bot.sent) == 3
+    assert elapsed < 1.0, elapsed
+
+
+if __name__ == '__main__':
+    test_enqueue_deduplicates()
+    test_order_and_notifications_in_one_transaction()
+    test_enqueue_does_not_send()
+    test_transient_error_is_retried_with_backoff()
+    test_retry_after_pauses_queue()
+    test_permanent_error_notifies_dispatcher()
+    test_gives_up_after_max_attempts()
+    test_worker_loop_wakes_on_enqueue()
+    print("All outbox tests passed")
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""Тест планировщика напоминаний: несколько сроков, расчет следующей проверки, wake(),
+рассылка одним сообщением на получателя, журнал доставки по получателям
+
+Telegram подменяется фейковым сервисом уведомлений, время задается явно.
+"""
+import sys
+import os
+import time
+import asyncio
+import tempfile
+from datetime import datetime, date, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import database
+from database import db_connection
+from services.user_manager import UserManager
+from services.order_service import OrderService
+from services.reminder_service import ReminderService, MOSCOW, reminder_window
+from services.notification_fanout import NotificationFanout, TelegramRateLimiter
+from utils.reminder_background import ReminderScheduler
+from telegram.error import Forbidden
+
+TODAY = date(2026, 3, 10)
+OFFSETS = (3, 1, 0)
+
+
+class FakeNotificationService:
+    """Записывает отправленные сообщения; чаты из fail_chats и страница fail_page (чат, фрагмент) не доставляются,
+    чаты из blocked_chats отвечают Forbidden (бот заблокирован)"""
+
+    def __init__(self, fail_chats=(), fail_page=None, blocked_chats=()):
+        self.fanout = NotificationFanout(rate_limiter=TelegramRateLimiter(rate=1000, chat_interval=0))
+        self.fail_chats = set(fail_chats)
+        self.blocked_chats = set(blocked_chats)
+        self.fail_page = fail_page
+        self.sent = []
+
+    def delivery(self, chat_id, text, photo_id=None, order_id=None):
+        async def deliver():
+            await asyncio.sleep(0.01)
+            if chat_id in self.blocked_chats:
+                raise Forbidden('Forbidden: bot was blocked by the user')
+            if chat_id in self.fail_chats or (self.fail_page and self.fail_page[0] == chat_id and self.fail_page[1] in text):
+                raise RuntimeError('network')
+            self.sent.append((chat_id, text))
+        return deliver
+
+
+def setup(deadlines: list) -> list:
+    """Временная БД: администратор, техник и заказы со сроками today + n дней"""
+    database.configure(os.path.join(tempfile.mkdtemp(), 'orders.db'))
+    database.init_db()
+    UserManager.register_user(401, "Мороков Александр", "technician")
+    UserManager.register_user(501, "Гаспарянидзе Нино", "doctor", is_admin=True)
+    technician = UserManager.get_user_by_telegram_id(401)['id']
+    return [create_order(technician, days) for days in deadlines]
+
+
+def reminders_sent() -> list:
+    with db_connection() as conn:
+        return conn.execute('SELECT order_id, reminder_type FROM reminders ORDER BY order_id').fetchall()
+
+
+def create_order(technician: int, days: int) -> int:
+    deadline = (TODAY + timedelta(days=days)).strftime('%d.%m.%Y')
+    return OrderService.create_order(None, technician, f"Пациент {days}", 'коронка', 1, deadline, '', None)
+
+
+def at(day: date, hour: int, minute: int = 0) -> datetime:
+    return datetime(day.year, day.month, day.day, hour, minute, tzinfo=MOSCOW)
+
+
+def test_due_reminders_for_all_offsets():
+    ids = setup([0, 1, 2, 3, 7])
+    due = ReminderService.get_due_reminders(TODAY, OFFSETS)
+    assert [(order['id'], order['reminder_type'], order['days_left']) for order in due] == [
+        (ids[0], '0d', 0), (ids[1], 'today', 1), (ids[3], '3d', 3)
+    ]
+
+    ReminderService.mark_reminder_sent(ids[3], '3d')
+    assert [order['id'] for order in ReminderService.get_due_reminders(TODAY, OFFSETS)] == [ids[0], ids[1]]
+    # напоминание "за 1 день" по-прежнему видно старому методу
+    assert [order['id'] for order in ReminderService.get_due_reminders(TODAY, (1,))] == [ids[1]]
+
+
+def test_due_query_uses_deadline_index():
+    setup([1])
+    with db_connection() as conn:
+        plan = ' '.join(row[3] for row in conn.execute('''
+            EXPLAIN QUERY PLAN
+            WITH due (deadline_date, reminder_type, days_left) AS (VALUES (?, ?, ?), (?, ?, ?))
+            SELECT o.id FROM due
+            JOIN orders o ON o.status = 'in_progress' AND o.deadline_date = due.deadline_date
+            WHERE NOT EXISTS (SELECT 1 FROM reminders r WHERE r.order_id = o.id AND r.reminder_type = due.reminder_type)
+        ''', ('2026-03-11', 'today', 1, '2026-03-13', '3d', 3)))
+    assert 'idx_orders_status_deadline' in plan and 'SCAN o' not in plan
+
+
+def test_next_reminder_day():
+    setup([9, 5])
+    # срок через 5 дней: напоминание за 3 дня - через 2 дня
+    assert ReminderService.next_reminder_day(TODAY, OFFSETS) == TODAY + timedelta(days=2)
+    assert ReminderService.next_reminder_day(TODAY, (1,)) == TODAY + timedelta(days=4)
+    setup([])
+    assert ReminderService.next_reminder_day(TODAY, OFFSETS) is None
+
+
+def test_check_schedules_next_instant():
+    ids = setup([1, 4])
+    service = FakeNotificationService()
+    scheduler = ReminderScheduler(service, offsets=OFFSETS)
+    window_start, window_end = reminder_window(TODAY)
+
+    # до окна ничего не отправляется, следующая проверка - начало окна
+    assert asyncio.run(scheduler.check(at(TODAY, 7))) == window_start
+    assert service.sent == []
+
+    # в окне: напоминание за 1 день отправлено, следующее - за 3 дня до срока через 4 дня
+    next_run = asyncio.run(scheduler.check(at(TODAY, 10, 5)))
+    assert next_run == reminder_window(TODAY + timedelta(days=1))[0]
+    assert sorted(chat for chat, _ in service.sent) == [401, 501]
+    assert all("Срок сдачи завтра" in text and f"Заказ №{ids[0]}" in text for _, text in service.sent)
+
+    # повторная проверка ничего не отправляет
+    service.sent.clear()
+    asyncio.run(scheduler.check(at(TODAY, 10, 6)))
+    assert service.sent == []
+
+
+def test_failed_reminders_retried_within_window():
+    setup([0])
+    service = FakeNotificationService(fail_chats=[501])
+    scheduler = ReminderScheduler(service, offsets=OFFSETS, retry_interval=300)
+
+    now = at(TODAY, 10)
+    assert asyncio.run(scheduler.check(now)) == now + timedelta(seconds=300)
+    assert scheduler.failed == 1
+
+    # под конец окна повторов нет - следующая проверка по расписанию (других сроков нет)
+    assert asyncio.run(scheduler.check(at(TODAY, 11, 58))) is None
+
+    service.fail_chats.clear()
+    asyncio.run(scheduler.check(at(TODAY, 10, 10)))
+    assert ReminderService.get_due_reminders(TODAY, OFFSETS) == []
+
+
+def test_wake_on_new_order():
+    """Без заказов планировщик спит; новый заказ будит его, и напоминание уходит сразу"""
+    ids = setup([])
+    service = FakeNotificationService()
+    scheduler = ReminderScheduler(service, offsets=OFFSETS, max_sleep=60, clock=lambda: at(TODAY, 10, 30))
+
+    async def scenario():
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0.2)
+        assert scheduler.checks == 1 and scheduler.next_run_at is None
+
+        technician = UserManager.get_user_by_telegram_id(401)['id']
+        ids.append(create_order(technician, 0))
+        scheduler.wake()
+        for _ in range(50):
+            await asyncio.sleep(0.05)
+            if scheduler.sent:
+                break
+
+        scheduler.stop()
+        await asyncio.wait_for(task, timeout=5)
+
+    asyncio.run(scenario())
+    assert scheduler.checks >= 2 and scheduler.sent == 1
+    assert "Срок сдачи СЕГОДНЯ" in service.sent[0][1]
+
+
+def test_one_message_per_recipient():
+    """N заказов x M администраторов - одно сообщение каждому, параллельно"""
+    ids = setup([0, 1, 3, 1])
+    UserManager.register_user(402, "Плюхин Сергей", "technician")
+    UserManager.register_user(502, "Иванова Анна", "doctor", is_admin=True)
+    second = UserManager.get_user_by_telegram_id(402)['id']
+    ids.append(create_order(second, 1))
+    # заказ без техника: напоминание только администраторам
+    ids.append(OrderService.create_order(None, None, "Без техника", 'мост', 1,
+                                         (TODAY + timedelta(days=1)).strftime('%d.%m.%Y'), '', None))
+
+    service = FakeNotificationService()
+    scheduler = ReminderScheduler(service, offsets=OFFSETS)
+    asyncio.run(scheduler.check(at(TODAY, 10)))
+
+    chats = sorted(chat for chat, _ in service.sent)
+    assert chats == [401, 402, 501, 502]
+    assert service.fanout.max_in_flight > 1
+    technician_text = dict(service.sent)[401]
+    assert technician_text.count("📋 Заказ №") == 4 and "🔧 Техник" not in technician_text
+    # ближайший срок первым
+    assert technician_text.index(f"Заказ №{ids[0]}") < technician_text.index(f"Заказ №{ids[2]}")
+    assert dict(service.sent)[501].count("📋 Заказ №") == 6
+    assert len(reminders_sent()) == 6
+
+
+def test_failed_technician_retries_only_own_orders():
+    ids = setup([1])
+    UserManager.register_user(402, "Плюхин Сергей", "technician")
+    other = create_order(UserManager.get_user_by_telegram_id(402)['id'], 1)
+
+    service = FakeNotificationService(fail_chats=[402])
+    scheduler = ReminderScheduler(service, offsets=OFFSETS)
+    asyncio.run(scheduler.check(at(TODAY, 10)))
+    assert reminders_sent() == [(ids[0], 'today')]
+    assert [order['id'] for order in ReminderService.get_due_reminders(TODAY, OFFSETS)] == [other]
+
+
+def test_digest_split_into_pages():
+    orders = [{'id': i, 'patient_name': 'П' * 200, 'days_left': 1} for i in range(1, 60)]
+    pages = ReminderService.reminder_digest_pages(orders, for_admin=True, limit=1000)
+    assert len(pages) > 1 and all(len(page) <= 1000 for page in pages)
+    assert sum(page.count("📋 Заказ №") for page in pages) == 59
+
+
+def test_failed_page_retries_only_its_orders():
+    """Сбой одной страницы сводки не пересылает заказы с доставленных страниц"""
+    setup([])
+    technician = UserManager.get_user_by_telegram_id(401)['id']
+    deadline = (TODAY + timedelta(days=1)).strftime('%d.%m.%Y')
+    ids = [OrderService.create_order(None, technician, f"Пациент {i} " + 'П' * 1000, 'мост', 1, deadline, '', None)
+           for i in range(8)]
+
+    # страница с последним заказом не доходит администратору
+    service = FakeNotificationService(fail_page=(501, f"Заказ №{ids[-1]}\n"))
+    scheduler = ReminderScheduler(service, offsets=OFFSETS)
+    asyncio.run(scheduler.check(at(TODAY, 10)))
+
+    pages = [text for chat, text in service.sent if chat == 501]
+    assert pages and f"Заказ №{ids[0]}\n" in pages[0]
+    failed = {order_id for order_id in ids if not any(f"Заказ №{order_id}\n" in page for page in pages)}
+    assert ids[-1] in failed and len(failed) < len(ids)
+    assert sorted(order_id for order_id, _ in reminders_sent()) == sorted(set(ids) - failed)
+
+    service.sent.clear()
+    service.fail_page = None
+    asyncio.run(scheduler.check(at(TODAY, 10, 5)))
+    resent = {order_id for order_id in ids for _, text in service.sent if f"Заказ №{order_id}\n" in text}
+    assert resent == failed and {chat for chat, _ in service.sent} == {501}
+    assert len(reminders_sent()) == len(ids)
+
+
+def test_order_without_recipients_is_not_reselected():
+    database.configure(os.path.join(tempfile.mkdtemp(), 'orders.db'))
+    database.init_db()
+    order_id = OrderService.create_order(None, None, "Без техника", 'мост', 1,
+                                         (TODAY + timedelta(days=1)).strftime('%d.%m.%Y'), '', None)
+
+    service = FakeNotificationService()
+    scheduler = ReminderScheduler(service, offsets=OFFSETS)
+    # некому отправлять - повтор в окне не нужен
+    assert asyncio.run(scheduler.check(at(TODAY, 10))) != at(TODAY, 10, 5)
+    assert service.sent == [] and reminders_sent() == [(order_id, 'today')]
+    assert ReminderService.get_due_reminders(TODAY, OFFSETS) == []
+
+
+def ledger() -> dict:
+    with db_connection() as conn:
+        return {(order_id, recipient): (status, attempts) for order_id, recipient, status, attempts in conn.execute(
+            'SELECT order_id, recipient, status, attempts FROM reminder_deliveries')}
+
+
+def test_retry_resends_only_to_failed_recipient():
+    ids = setup([1, 1])
+    UserManager.register_user(502, "Иванова Анна", "doctor", is_admin=True)
+    service = FakeNotificationService(fail_chats=[502])
+    scheduler = ReminderScheduler(service, offsets=OFFSETS)
+
+    assert asyncio.run(scheduler.check(at(TODAY, 10))) == at(TODAY, 10, 5)
+    assert sorted(chat for chat, _ in service.sent) == [401, 501]
+    assert ledger()[(ids[0], 502)] == ('failed', 1) and ledger()[(ids[0], 401)] == ('sent', 1)
+    assert reminders_sent() == []
+
+    service.sent.clear()
+    service.fail_chats.clear()
+    asyncio.run(scheduler.check(at(TODAY, 10, 5)))
+    # повтор - только администратору, которому не дошло, оба заказа одним сообщением
+    assert [chat for chat, _ in service.sent] == [502]
+    assert service.sent[0][1].count("📋 Заказ №") == 2
+    assert ledger()[(ids[1], 502)] == ('sent', 2) and ledger()[(ids[1], 401)] == ('sent', 1)
+    assert reminders_sent() == [(ids[0], 'today'), (ids[1], 'today')]
+
+
+def test_blocked_recipient_is_not_retried():
+    ids = setup([1])
+    service = FakeNotificationService(blocked_chats=[501])
+    scheduler = ReminderScheduler(service, offsets=OFFSETS)
+
+    # Forbidden - окончательная ошибка: повтора в окне нет, заказ обработан
+    assert asyncio.run(scheduler.check(at(TODAY, 10))) != at(TODAY, 10, 5)
+    assert ledger()[(ids[0], 501)] == ('rejected', 1) and ledger()[(ids[0], 401)] == ('sent', 1)
+    assert reminders_sent() == [(ids[0], 'today')]
+
+    service.sent.clear()
+    asyncio.run(scheduler.check(at(TODAY, 10, 5)))
+    assert service.sent == [] and ledger()[(ids[0], 501)] == ('rejected', 1)
+
+
+def test_transient_failures_capped():
+    ids = setup([1])
+    deliveries = [(ids[0], 'today', 501, 'admin')]
+    for attempt in range(1, 4):
+        assert ReminderService.claim_deliveries(deliveries) == [(ids[0], 'today', 501)]
+        completed = ReminderService.record_deliveries(deliveries, {(ids[0], 'today', 501): 'network'}, max_attempts=3)
+        assert completed == ([] if attempt < 3 else [(ids[0], 'today')])
+
+    assert ledger()[(ids[0], 501)] == ('rejected', 3)
+    assert ReminderService.claim_deliveries(deliveries) == []
+
+
+def test_claim_is_exclusive_until_lease_expires():
+    ids = setup([1])
+    deliveries = [(ids[0], 'today', 401, 'technician'), (ids[0], 'today', 501, 'admin')]
+
+    assert len(ReminderService.claim_deliveries(deliveries, lease=0.2)) == 2
+    # второй процесс не получит те же ключи, пока действует аренда
+    assert ReminderService.claim_deliveries(deliveries) == []
+    assert ReminderService.record_deliveries(deliveries, {(ids[0], 'today', 401): None}) == []
+
+    # процесс упал, не записав результат для 501: после аренды ключ снова доступен
+    time.sleep(0.3)
+    assert ReminderService.claim_deliveries(deliveries) == [(ids[0], 'today', 501)]
+
+    assert ReminderService.record_deliveries(deliveries, {(ids[0], 'today', 501): None}) == [(ids[0], 'today')]
+    assert ReminderService.claim_deliveries(deliveries) == []
+    assert ReminderService.get_delivery_stats() == {'sent': 2}
+
+
+def test_mark_reminder_sent_is_idempotent():
+    ids = setup([1])
+    assert ReminderService.mark_reminder_sent(ids[0], 'today')
+    assert ReminderService.mark_reminder_sent(ids[0], 'today')
+    ReminderService.mark_reminders_sent([(ids[0], 'today'), (ids[0], '3d')])
+    assert sorted(reminders_sent()) == [(ids[0], '3d'), (ids[0], 'today')]
+
+
+if __name__ == '__main__':
+    test_due_reminders_for_all_offsets()
+    test_due_query_uses_deadline_index()
+    test_next_reminder_day()
+    test_check_schedules_next_instant()
+    test_failed_reminders_retried_within_window()
+    test_wake_on_new_order()
+    test_one_message_per_recipient()
+    test_failed_technician_retries_only_own_orders()
+    test_digest_split_into_pages()
+    test_failed_page_retries_only_its_orders()
+    test_order_without_recipients_is_not_reselected()
+    test_retry_resends_only_to_failed_recipient()
+    test_blocked_recipient_is_not_retried()
+    test_transient_failures_capped()
+    test_claim_is_exclusive_until_lease_expires()
+    test_mark_reminder_sent_is_idempotent()
+    print("All reminder scheduler tests passed")
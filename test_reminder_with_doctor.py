@@ -85,7 +85,10 @@ async def test_reminder_with_doctor_info():
         print(f"Message preview: ... (see Telegram for full message)")
 
         real_technician_message = f"⏰ TEST - Напоминание о сроке выполнения!\n\n{reminder_service.format_reminder_message(order)}"
-        sent_tech = await notification_service.send_reminder_to_technician(order, real_technician_message)
+        technician = (await notification_service.get_recipients(order, ('technician',)))['technician']
+        sent_tech = bool(technician) and (await notification_service.fanout.send(
+            technician['telegram_id'], notification_service.delivery(technician['telegram_id'], real_technician_message), 'reminder'
+        ))['ok']
 
         admin_success = True
         technician_name = order.get('technician_name', 'Не указан')
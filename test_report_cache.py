@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Тест кэша отчетов: попадания, сброс при записи заказов и пользователей, TTL"""
+import sys
+import os
+import time
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import database
+from database import db_connection
+from services.user_manager import UserManager
+from services.order_service import OrderService
+from services.report_service import ReportService
+from services.report_cache import ReportCache, get_report_cache
+
+
+def setup():
+    """Временная БД с врачом и техником"""
+    database.configure(os.path.join(tempfile.mkdtemp(), 'orders.db'))
+    database.init_db()
+    UserManager.register_user(401, "Мороков Александр", "technician")
+    UserManager.register_user(501, "Гаспарянидзе Нино", "doctor")
+    technician = UserManager.get_user_by_telegram_id(401)
+    doctor = UserManager.get_user_by_telegram_id(501)
+    return doctor['id'], technician['id']
+
+
+def test_hits_and_invalidation_on_new_order():
+    doctor_id, technician_id = setup()
+    OrderService.create_order(doctor_id, technician_id, 'Иванов', 'мост', 2, '20.03.2026', '', None)
+    cache = get_report_cache()
+    before = cache.get_stats()
+
+    first = ReportService.get_report('technicians')
+    second = ReportService.get_report('technicians')
+    assert first == second and "мост (1 заказ, 2 шт)" in first[0]
+
+    stats = cache.get_stats()
+    assert stats['misses'] == before['misses'] + 1
+    assert stats['hits'] == before['hits'] + 1
+    assert stats['time_saved'] > before['time_saved']
+
+    # новый заказ сбрасывает отчет за все время, следующий запрос видит его
+    OrderService.create_order(doctor_id, technician_id, 'Петров', 'мост', 3, '21.03.2026', '', None)
+    assert "мост (2 заказ, 5 шт)" in ReportService.get_report('technicians')[0]
+
+
+def test_past_period_survives_new_order():
+    """Заказ сегодняшнего дня не сбрасывает отчет за прошлый период"""
+    doctor_id, technician_id = setup()
+    with db_connection() as conn:
+        conn.execute('''
+            INSERT INTO orders (doctor_id, technician_id, work_type, quantity, deadline, created_at)
+            VALUES (?, ?, 'коронка', 1, '', '2020-01-15 10:00:00')
+        ''', (doctor_id, technician_id))
+
+    cache = get_report_cache()
+    past = ReportService.get_report('period', '01.01.2020', '31.01.2020')
+    assert len(past) == 4 and "Всего заказов: 1" in past[0]
+    ReportService.get_report('work_types')
+
+    size = cache.get_stats()['size']
+    OrderService.create_order(doctor_id, technician_id, 'Иванов', 'мост', 1, '20.03.2026', '', None)
+
+    hits = cache.get_stats()['hits']
+    assert ReportService.get_report('period', '01.01.2020', '31.01.2020') == past
+    assert cache.get_stats()['hits'] == hits + 1
+    assert cache.get_stats()['size'] == size - 1
+
+
+def test_user_change_invalidates_everything():
+    """Имена сотрудников входят в отчеты - изменение пользователей сбрасывает кэш"""
+    doctor_id, technician_id = setup()
+    OrderService.create_order(doctor_id, technician_id, 'Иванов', 'мост', 1, '20.03.2026', '', None)
+    ReportService.get_report('doctors')
+
+    UserManager.register_user(402, "Петров Иван", "technician")
+    assert get_report_cache().get_stats()['size'] == 0
+
+
+def test_ttl_and_version_guard():
+    cache = ReportCache(ttl=0.05, max_size=2)
+    builds = []
+
+    def build():
+        builds.append(1)
+        return ['отчет']
+
+    cache.get('doctors', None, None, build)
+    cache.get('doctors', None, None, build)
+    time.sleep(0.06)
+    cache.get('doctors', None, None, build)
+    assert len(builds) == 2 and cache.get_stats()['expired'] == 1
+
+    # отчет, во время построения которого пришла запись, не сохраняется
+    def racing_build():
+        cache.invalidate()
+        return ['устаревший отчет']
+
+    cache.get('work_types', None, None, racing_build)
+    assert 'work_types' not in {key[1] for key in cache._entries}
+
+    # старые отчеты вытесняются при переполнении
+    for kind in ('a', 'b', 'c'):
+        cache.get(kind, None, None, build)
+    assert cache.get_stats()['size'] == 2
+
+
+if __name__ == '__main__':
+    test_hits_and_invalidation_on_new_order()
+    test_past_period_survives_new_order()
+    test_user_change_invalidates_everything()
+    test_ttl_and_version_guard()
+    print("All report cache tests passed")
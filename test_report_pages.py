@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""Тест постраничной отправки отчетов (лимит 4096 символов, листание кнопками)
+
+Telegram подменяется фейковыми сообщениями, ничего никуда не отправляется.
+"""
+import sys
+import os
+import asyncio
+import tempfile
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import database
+from database import db_connection
+from services.report_service import ReportService, MESSAGE_LIMIT, paginate, split_block
+from services.report_cache import ReportSnapshots, get_report_snapshots
+from handlers.reports import send_report, report_page
+
+
+class FakeMessage:
+    """Имитация telegram.Message: записывает отправленные сообщения с клавиатурой"""
+
+    def __init__(self, chat_id: int = 900, log: list = None):
+        self.chat_id = chat_id
+        self.log = log if log is not None else []
+        self.text = None
+        self.reply_markup = None
+
+    async def reply_text(self, text, reply_markup=None, **kwargs):
+        sent = FakeMessage(self.chat_id, self.log)
+        sent.text = text
+        sent.reply_markup = reply_markup
+        self.log.append(('reply', text, reply_markup))
+        return sent
+
+
+class FakeQuery:
+    """Имитация telegram.CallbackQuery"""
+
+    def __init__(self, data: str, message: FakeMessage):
+        self.data = data
+        self.message = message
+        self.answers = []
+
+    async def answer(self, text=None, show_alert=False):
+        self.answers.append(text)
+
+    async def edit_message_text(self, text, reply_markup=None, **kwargs):
+        self.message.text = text
+        self.message.reply_markup = reply_markup
+
+
+def setup(technicians: int, work_types: int):
+    """Временная БД: у каждого техника заказы всех видов работ"""
+    database.configure(os.path.join(tempfile.mkdtemp(), 'orders.db'))
+    database.init_db()
+    with db_connection() as conn:
+        conn.executemany('INSERT INTO users (telegram_id, name, role) VALUES (?, ?, ?)',
+                         [(1000 + i, f"Техник номер {i:03d} Длиннофамильный", 'technician') for i in range(technicians)])
+        conn.executemany('''
+            INSERT INTO orders (technician_id, work_type, quantity, deadline, created_at)
+            VALUES (?, ?, 2, '', '2026-03-10 12:00:00')
+        ''', [(t + 1, f"металлокерамическая коронка вариант {w}") for t in range(technicians) for w in range(work_types)])
+
+
+def test_paginate_respects_limit():
+    blocks = [f"блок {i}\n" * 30 for i in range(40)] + ["x" * 10000 + "\n"]
+    pages = list(paginate(blocks, limit=500))
+    assert all(len(page) <= 500 for page in pages)
+    assert ''.join(pages) == ''.join(blocks)
+    # блок, который помещается, не разрывается между страницами
+    assert pages[0] == blocks[0] + blocks[1]
+    assert list(split_block("короткий")) == ["короткий"]
+
+
+def test_large_report_split_into_pages():
+    setup(technicians=60, work_types=8)
+    pages = list(ReportService.iter_report_pages('technicians'))
+
+    assert len(pages) > 1
+    assert all(len(page) <= MESSAGE_LIMIT for page in pages)
+    # страницы вместе - тот же текст, что и единый отчет
+    assert ''.join(pages) == ReportService.format_technician_report(ReportService.get_technician_statistics())
+    assert pages[0].startswith("📊 ОТЧЕТ ПО ТЕХНИКАМ") and "📊 Всего единиц: 960" in pages[-1]
+
+
+def test_pages_stream_from_cursor():
+    """Первая страница готова раньше, чем прочитан весь результат"""
+    setup(technicians=60, work_types=8)
+    pages = ReportService.iter_report_pages('technicians')
+    first = next(pages)
+    assert "Техник номер 000" in first and "Техник номер 059" not in first
+    pages.close()
+
+    # соединение вернулось в пул
+    assert database.get_pool_stats()['idle'] == database.get_pool_stats()['size']
+
+
+def test_send_and_page_through_report():
+    setup(technicians=60, work_types=8)
+    log = []
+    message = FakeMessage(log=log)
+
+    asyncio.run(send_report(message, 'technicians'))
+
+    # одна отправка: первая страница сразу с кнопками
+    assert len(log) == 1
+    _, first_page, markup = log[0]
+    buttons = markup.inline_keyboard[0]
+    total = int(buttons[0].text.split('/')[1])
+    assert buttons[0].text == f"1/{total}" and buttons[-1].text == "▶️"
+
+    sent = FakeMessage()
+    sent.text = first_page
+    query = FakeQuery(buttons[-1].callback_data, sent)
+    asyncio.run(report_page(SimpleNamespace(callback_query=query), None))
+    assert sent.text != first_page
+    assert [button.text for button in sent.reply_markup.inline_keyboard[0]] == ["◀️", f"2/{total}", "▶️"]
+
+    # снимок недоступен из другого чата
+    foreign = FakeQuery(buttons[-1].callback_data, FakeMessage(chat_id=901))
+    asyncio.run(report_page(SimpleNamespace(callback_query=foreign), None))
+    assert foreign.answers == ['Отчет устарел, запросите его заново.']
+
+    # повторный запрос - из кэша отчетов, тот же текст
+    log.clear()
+    asyncio.run(send_report(message, 'technicians'))
+    assert log[0][1] == first_page
+
+
+def test_failed_send_keeps_pool_free():
+    """Ошибка отправки в Telegram не оставляет соединение занятым"""
+    setup(technicians=60, work_types=8)
+
+    class FailingMessage(FakeMessage):
+        async def reply_text(self, text, **kwargs):
+            raise ConnectionError('telegram is down')
+
+    try:
+        asyncio.run(send_report(FailingMessage(), 'doctors'))
+    except ConnectionError:
+        pass
+    try:
+        asyncio.run(send_report(FailingMessage(), 'technicians'))
+    except ConnectionError:
+        pass
+
+    assert database.get_pool_stats()['idle'] == database.get_pool_stats()['size']
+
+
+def test_short_report_has_no_keyboard():
+    setup(technicians=2, work_types=2)
+    log = []
+    asyncio.run(send_report(FakeMessage(log=log), 'work_types'))
+    assert [(kind, markup) for kind, _, markup in log] == [('reply', None)]
+
+
+def test_snapshot_expires():
+    snapshots = ReportSnapshots(ttl=0.0)
+    token = snapshots.save(900, ['страница'])
+    assert snapshots.get(token, 900) is None
+    assert get_report_snapshots().get('нет-такого', 900) is None
+
+
+if __name__ == '__main__':
+    test_paginate_respects_limit()
+    test_large_report_split_into_pages()
+    test_pages_stream_from_cursor()
+    test_send_and_page_through_report()
+    test_failed_send_keeps_pool_free()
+    test_short_report_has_no_keyboard()
+    test_snapshot_expires()
+    print("All report page tests passed")
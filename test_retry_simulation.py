@@ -73,7 +73,10 @@ async def test_retry_simulation():
 
         technician_message = f"⏰ TEST RETRY - Напоминание о сроке выполнения!\n\n{reminder_service.format_reminder_message(order)}"
 
-        sent_tech = await notification_service.send_reminder_to_technician(order, technician_message)
+        technician = (await notification_service.get_recipients(order, ('technician',)))['technician']
+        sent_tech = bool(technician) and (await notification_service.fanout.send(
+            technician['telegram_id'], notification_service.delivery(technician['telegram_id'], technician_message), 'reminder'
+        ))['ok']
 
         admin_success = True
         failed_admins = []
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""Тест колонки deadline_date, индексов и их использования запросами"""
+import sys
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import database
+from database import db_connection, iso_date
+from services.order_service import OrderService
+from services.reminder_service import ReminderService
+from services.report_service import ReportService
+
+LEGACY_ORDERS = '''
+    CREATE TABLE orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        doctor_id INTEGER,
+        technician_id INTEGER,
+        patient_name TEXT,
+        work_type TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        deadline TEXT NOT NULL,
+        description TEXT,
+        photo_id TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        status TEXT DEFAULT 'in_progress'
+    )
+'''
+
+
+def query_plan(sql: str, params: tuple = ()) -> str:
+    with db_connection() as conn:
+        return ' | '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+
+
+def test_iso_date():
+    assert iso_date('14.03.2026') == '2026-03-14'
+    assert iso_date('4.3.2026') == '2026-03-04'
+    assert iso_date('14.03.26') == '2026-03-14'
+    assert iso_date('завтра') is None
+    assert iso_date(None) is None
+
+
+def test_legacy_database_is_migrated():
+    """Старая БД без deadline_date получает колонку, заполнение и индексы"""
+    db_path = os.path.join(tempfile.mkdtemp(), 'orders.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute(LEGACY_ORDERS)
+    conn.executemany(
+        'INSERT INTO orders (work_type, quantity, deadline) VALUES (?, ?, ?)',
+        [('мост', 1, '14.03.2026'), ('мост', 1, '14.03.26'), ('мост', 1, 'не указан')]
+    )
+    conn.commit()
+    conn.close()
+
+    database.configure(db_path)
+    database.init_db()
+    database.init_db()
+
+    with db_connection() as conn:
+        rows = conn.execute('SELECT deadline, deadline_date FROM orders ORDER BY id').fetchall()
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+    assert rows == [('14.03.2026', '2026-03-14'), ('14.03.26', '2026-03-14'), ('не указан', None)]
+    assert {'idx_orders_status_deadline', 'idx_orders_status_created', 'idx_orders_technician',
+            'idx_orders_doctor', 'idx_reminders_order_type', 'idx_users_role_active'} <= indexes
+
+
+def test_queries_use_indexes():
+    """Запросы напоминаний и отчетов идут по индексам, а не полным сканом"""
+    database.configure(os.path.join(tempfile.mkdtemp(), 'orders.db'))
+    database.init_db()
+
+    reminder_plan = query_plan('''
+        SELECT o.id FROM orders o
+        WHERE o.status = 'in_progress' AND o.deadline_date = ?
+        AND NOT EXISTS (SELECT 1 FROM reminders r WHERE r.order_id = o.id AND r.reminder_type = 'today')
+    ''', ('2026-03-14',))
+    assert 'idx_orders_status_deadline' in reminder_plan, reminder_plan
+    assert 'idx_reminders_order_type' in reminder_plan, reminder_plan
+
+    report_plan = query_plan('''
+        SELECT COUNT(*) FROM orders
+        WHERE status = 'in_progress' AND created_at >= ? AND created_at < ?
+    ''', ('2026-03-01', '2026-04-01'))
+    assert 'idx_orders_status_created' in report_plan, report_plan
+
+    users_plan = query_plan("SELECT id FROM users WHERE role = ? AND is_active = 1", ('technician',))
+    assert 'idx_users_role_active' in users_plan, users_plan
+
+
+def test_due_tomorrow_uses_deadline_date():
+    """Заказ с дедлайном на завтра находится через deadline_date"""
+    database.configure(os.path.join(tempfile.mkdtemp(), 'orders.db'))
+    database.init_db()
+
+    tomorrow = (datetime.now(ZoneInfo('Europe/Moscow')) + timedelta(days=1)).strftime('%d.%m.%Y')
+    order_id = OrderService.create_order(None, None, 'Иванов', 'мост', 2, tomorrow, '', None)
+    OrderService.create_order(None, None, 'Петров', 'мост', 1, '01.01.2020', '', None)
+
+    orders = ReminderService.get_orders_due_tomorrow()
+    assert [order['id'] for order in orders] == [order_id]
+    assert orders[0]['deadline'] == tomorrow
+
+
+def test_report_period_boundaries():
+    """Границы периода совпадают с прежним DATE(created_at) BETWEEN"""
+    database.configure(os.path.join(tempfile.mkdtemp(), 'orders.db'))
+    database.init_db()
+
+    with db_connection() as conn:
+        conn.executemany(
+            "INSERT INTO orders (work_type, quantity, deadline, created_at) VALUES ('мост', 1, '', ?)",
+            [('2026-02-28 23:59:59',), ('2026-03-01 00:00:00',), ('2026-03-31 23:59:59',), ('2026-04-01 00:00:00',)]
+        )
+
+    stats = ReportService.get_period_statistics('01.03.2026', '31.03.2026')
+    assert stats['total_orders'] == 2
+
+    work_types = ReportService.get_work_type_statistics('01.03.2026', '31.03.2026')
+    assert work_types == [{'work_type': 'мост', 'order_count': 2, 'total_quantity': 2}]
+
+
+if __name__ == '__main__':
+    test_iso_date()
+    test_legacy_database_is_migrated()
+    test_queries_use_indexes()
+    test_due_tomorrow_uses_deadline_date()
+    test_report_period_boundaries()
+    print("All schema index tests passed")
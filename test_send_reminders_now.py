@@ -45,7 +45,10 @@ async def test_send_reminders_now():
             f"{reminder_service.format_reminder_message(order)}"
         )
 
-        sent_tech = await notification_service.send_reminder_to_technician(order, technician_message)
+        technician = (await notification_service.get_recipients(order, ('technician',)))['technician']
+        sent_tech = bool(technician) and (await notification_service.fanout.send(
+            technician['telegram_id'], notification_service.delivery(technician['telegram_id'], technician_message), 'reminder'
+        ))['ok']
         if sent_tech:
             sent_count += 1
             print(f"  -> Sent to technician {order.get('technician_name', 'N/A')}")
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Тест постоянного кэша терминологии (services.terminology_cache)"""
+import sys
+import os
+import time
+import asyncio
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import database
+from services.terminology_cache import TerminologyCache, normalize_cache_key
+from services.message_processor import MessageProcessor
+from test_async_llm import FakeAsyncClient
+
+
+def setup_temp_db():
+    """Создать временную БД и переключить на нее пул"""
+    database.configure(os.path.join(tempfile.mkdtemp(), 'orders.db'))
+    database.init_db()
+
+
+def test_key_normalization():
+    """Регистр, ё, количество и пунктуация не влияют на ключ"""
+    assert normalize_cache_key("Циркон на винте7шт") == "циркон на винте"
+    assert normalize_cache_key("  циркон, на  винте 7 шт. ") == "циркон на винте"
+    assert normalize_cache_key("Съёмный протез") == normalize_cache_key("съемный протез")
+
+
+def test_persisted_and_warm_loaded():
+    """Записи переживают перезапуск и загружаются при старте"""
+    setup_temp_db()
+
+    cache = TerminologyCache()
+    cache.put("циркон на винте", "коронка из диоксида циркония на винте", latency=1.5)
+    assert cache.get("Циркон на винте 2шт") == "коронка из диоксида циркония на винте"
+    cache.flush()
+
+    restarted = TerminologyCache()
+    assert restarted.load() == 1
+    assert restarted.get("циркон на винте") == "коронка из диоксида циркония на винте"
+    assert restarted.get_top_entries(1)[0]['hits'] == 2
+
+
+def test_lru_eviction():
+    """При переполнении вытесняется давно не использованная запись"""
+    setup_temp_db()
+
+    cache = TerminologyCache(max_size=2)
+    cache.put("мк", "металлокерамическая коронка")
+    cache.put("циркон", "коронка из диоксида циркония")
+    cache.get("мк")
+    cache.put("винир", "керамический винир")
+
+    assert cache.get("циркон") is None
+    assert cache.get("мк") == "металлокерамическая коронка"
+    assert cache.get_stats()['evictions'] == 1
+
+    with database.db_connection() as conn:
+        keys = {row[0] for row in conn.execute('SELECT key FROM terminology_cache')}
+    assert keys == {"мк", "винир"}
+
+
+def test_ttl_expiry():
+    """Устаревшие записи не отдаются и удаляются при загрузке"""
+    setup_temp_db()
+
+    cache = TerminologyCache(ttl=0.05)
+    cache.put("мк", "металлокерамическая коронка")
+    time.sleep(0.1)
+
+    assert cache.get("мк") is None
+    assert cache.get_stats()['expired'] == 1
+    assert TerminologyCache(ttl=0.05).load() == 0
+
+
+def test_invalidate():
+    """Удаление одной фразы и полная очистка"""
+    setup_temp_db()
+
+    cache = TerminologyCache()
+    cache.put("мк", "металлокерамическая коронка")
+    cache.put("циркон", "коронка из диоксида циркония")
+
+    assert cache.invalidate("МК") == 1
+    assert cache.invalidate("мк") == 0
+    assert cache.invalidate() == 1
+
+    assert TerminologyCache().load() == 0
+
+
+def test_processor_uses_cache_and_reports_saved_latency():
+    """Повторная фраза не уходит в ИИ, экономия времени учитывается"""
+    setup_temp_db()
+
+    processor = MessageProcessor(terminology_cache=TerminologyCache())
+    processor.dental_service.async_client = FakeAsyncClient("коронка из дисиликата лития", 0.05)
+
+    async def scenario():
+        # фраза неизвестна правилам (services.dental_rules) и уходит в ИИ
+        for text in ("емакс коронка", "Емакс коронка", "емакс коронка 3шт"):
+            await processor.normalize_dental_terminology_async(text)
+
+    asyncio.run(scenario())
+    database.shutdown_db_executor()
+
+    stats = processor.terminology_cache.get_stats()
+    print(f"Cache stats: {stats}")
+    assert processor.dental_service.async_client.calls == 1
+    assert stats['hits'] == 2
+    assert stats['latency_saved'] >= 0.09
+
+
+if __name__ == '__main__':
+    test_key_normalization()
+    test_persisted_and_warm_loaded()
+    test_lru_eviction()
+    test_ttl_expiry()
+    test_invalidate()
+    test_processor_uses_cache_and_reports_saved_latency()
+    print("All terminology cache tests passed")
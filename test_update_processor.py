@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""Тест параллельной обработки обновлений с порядком внутри чата
+
+Обработчики - корутины с задержкой, которые записывают начало и конец;
+обновления - настоящие Update из словарей, как их присылает Telegram.
+"""
+import sys
+import os
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from telegram import Update
+from utils.update_processor import ChatOrderedUpdateProcessor, chat_key
+
+
+def make_update(update_id: int, chat_id: int) -> Update:
+    return Update.de_json({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Test'}, 'text': f'msg {update_id}'}}, None)
+
+
+async def feed(processor, updates, handler):
+    """Как Application: задача на каждое обновление в порядке получения"""
+    tasks = [asyncio.create_task(processor.process_update(u, handler(u))) for u in updates]
+    await asyncio.gather(*tasks)
+
+
+def test_same_chat_strictly_ordered():
+    log = []
+
+    def handler(update):
+        async def work():
+            log.append(('start', update.update_id))
+            # первое сообщение чата - самое медленное
+            await asyncio.sleep(0.05 if update.update_id == 1 else 0.001)
+            log.append(('end', update.update_id))
+        return work()
+
+    processor = ChatOrderedUpdateProcessor(max_concurrent=8)
+    asyncio.run(feed(processor, [make_update(i, 500) for i in range(1, 6)], handler))
+
+    expected = []
+    for update_id in range(1, 6):
+        expected += [('start', update_id), ('end', update_id)]
+    assert log == expected
+    stats = processor.get_stats()
+    assert stats['processed'] == 5 and stats['max_running'] == 1
+    assert stats['max_chat_backlog'] == 4 and stats['busy_chats'] == 0
+
+
+def test_different_chats_in_parallel():
+    def handler(update):
+        return asyncio.sleep(0.1)
+
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(max_concurrent=8)
+        started = asyncio.get_running_loop().time()
+        await feed(processor, [make_update(i, 1000 + i) for i in range(8)], handler)
+        return processor, asyncio.get_running_loop().time() - started
+
+    processor, elapsed = asyncio.run(scenario())
+    # 8 чатов по 100 мс обрабатываются одновременно, а не по очереди (0.8 с)
+    assert elapsed < 0.3
+    assert processor.get_stats()['max_running'] == 8
+
+
+def test_slow_chat_does_not_block_others():
+    finished = []
+
+    def handler(update):
+        async def work():
+            await asyncio.sleep(0.3 if update.effective_chat.id == 1 else 0.01)
+            finished.append(update.update_id)
+        return work()
+
+    # два сообщения медленного чата подряд, затем другие чаты
+    updates = [make_update(1, 1), make_update(2, 1)] + [make_update(i, 100 + i) for i in range(3, 8)]
+    asyncio.run(feed(ChatOrderedUpdateProcessor(max_concurrent=2), updates, handler))
+
+    # второе сообщение медленного чата ждет свою очередь, не занимая место
+    assert finished[:5] == [3, 4, 5, 6, 7]
+    assert finished[5:] == [1, 2]
+
+
+def test_concurrency_cap_and_wait_metrics():
+    running = 0
+    peak = 0
+
+    def handler(update):
+        async def work():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+        return work()
+
+    processor = ChatOrderedUpdateProcessor(max_concurrent=3)
+    asyncio.run(feed(processor, [make_update(i, 2000 + i) for i in range(12)], handler))
+
+    stats = processor.get_stats()
+    assert peak == 3 and stats['max_running'] == 3
+    assert stats['processed'] == 12 and stats['running'] == 0 and stats['waiting_for_slot'] == 0
+    # последние обновления ждали три "волны" по 20 мс
+    assert stats['max_wait'] >= 0.05 and 0 < stats['avg_wait'] < stats['max_wait']
+
+
+def test_failure_releases_chat_and_slot():
+    def handler(update):
+        async def work():
+            if update.update_id == 1:
+                raise RuntimeError('handler failed')
+        return work()
+
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(max_concurrent=1)
+        tasks = [asyncio.create_task(processor.process_update(u, handler(u)))
+                 for u in (make_update(1, 7), make_update(2, 7))]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return processor, results
+
+    processor, results = asyncio.run(scenario())
+    assert isinstance(results[0], RuntimeError) and results[1] is None
+    stats = processor.get_stats()
+    assert stats['failed'] == 1 and stats['processed'] == 1 and stats['busy_chats'] == 0
+
+
+def test_cancelled_waiting_update_is_closed():
+    """Обновление, отмененное в очереди чата, не запускается и не задерживает следующие"""
+    started = []
+
+    def handler(update):
+        async def work():
+            started.append(update.update_id)
+            await asyncio.sleep(0.05)
+        return work()
+
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(max_concurrent=4)
+        updates = [make_update(i, 9) for i in (1, 2, 3)]
+        tasks = [asyncio.create_task(processor.process_update(u, handler(u))) for u in updates]
+        await asyncio.sleep(0.01)
+        tasks[1].cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return processor
+
+    processor = asyncio.run(scenario())
+    assert started == [1, 3]
+    stats = processor.get_stats()
+    assert stats['waiting_for_chat'] == 0 and stats['busy_chats'] == 0
+
+
+def test_chat_key():
+    assert chat_key(make_update(1, 42)) == 42
+    callback = Update.de_json({'update_id': 2, 'callback_query': {
+        'id': 'q', 'chat_instance': 'c', 'from': {'id': 43, 'is_bot': False, 'first_name': 'T'}}}, None)
+    # у callback_query без сообщения чата нет - очередь по пользователю
+    assert chat_key(callback) == 43
+    assert chat_key('not an update') is None
+
+
+if __name__ == '__main__':
+    test_same_chat_strictly_ordered()
+    test_different_chats_in_parallel()
+    test_slow_chat_does_not_block_others()
+    test_concurrency_cap_and_wait_metrics()
+    test_failure_releases_chat_and_slot()
+    test_cancelled_waiting_update_is_closed()
+    test_chat_key()
+    print("All update processor tests passed")
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""Тест кэша пользователей (services.user_directory) и поиска по имени"""
+import sys
+import os
+import random
+import difflib
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import database
+from services.user_manager import UserManager
+from services.user_directory import get_user_directory
+
+
+def setup_temp_db():
+    """Создать временную БД и переключить на нее пул"""
+    database.configure(os.path.join(tempfile.mkdtemp(), 'orders.db'))
+    database.init_db()
+
+
+def register_staff():
+    UserManager.register_user(101, "Мороков Александр Александрович", "technician")
+    UserManager.register_user(102, "Мороков Алексей Иванович", "technician")
+    UserManager.register_user(103, "Плюхин Олег Игоревич", "technician")
+    UserManager.register_user(104, "Козлов Петр Сергеевич", "technician")
+    UserManager.register_user(201, "Гаспарянидзе Нино Георгиевна", "doctor")
+
+
+def reference_find(name: str, role: str) -> dict:
+    """Поиск полным перебором (алгоритм find_user_by_name до индексов)"""
+    users = [u for u in UserManager.get_all_users() if u['role'] == role and u['is_active']]
+    users.sort(key=lambda u: u['id'])
+
+    for user in users:
+        if user['name'].lower().strip() == name.lower().strip():
+            return user
+
+    input_surname = name.split()[0].lower() if name.split() else name.lower()
+    surnames = [u['name'].split()[0].lower() for u in users]
+    if surnames.count(input_surname) > 1:
+        parts = name.split()
+        if len(parts) == 2 and len(parts[1]) >= 2 and parts[1][-1] == '.':
+            for user in users:
+                user_parts = user['name'].split()
+                initials = user_parts[1][0].lower() + '.' + (user_parts[2][0].lower() + '.' if len(user_parts) >= 3 else '')
+                if user_parts[0].lower() == input_surname and initials == parts[1].lower():
+                    return user
+        return None
+
+    surname_to_user = {}
+    for user in users:
+        surname_to_user.setdefault(user['name'].split()[0], user)
+    matches = difflib.get_close_matches(name, list(surname_to_user), n=1, cutoff=0.6)
+    return surname_to_user[matches[0]] if matches else None
+
+
+def test_lookup_rules():
+    """Точное имя, уникальная фамилия, дубликаты фамилий, инициалы"""
+    setup_temp_db()
+    register_staff()
+
+    assert UserManager.find_user_by_name("Плюхин", "technician")['telegram_id'] == 103
+    assert UserManager.find_user_by_name("Плюхн", "technician")['telegram_id'] == 103
+    assert UserManager.find_user_by_name("мороков алексей иванович", "technician")['telegram_id'] == 102
+    assert UserManager.find_user_by_name("Мороков А.А.", "technician")['telegram_id'] == 101
+    assert UserManager.find_user_by_name("Мороков", "technician") is None
+    assert UserManager.find_user_by_name("Гаспарянидзе", "technician") is None
+    assert UserManager.find_user_by_name("Гаспарянидзе", "doctor")['telegram_id'] == 201
+
+
+def test_matches_full_scan():
+    """Результаты совпадают с поиском полным перебором"""
+    setup_temp_db()
+    register_staff()
+
+    random.seed(7)
+    queries = ["Плюхин", "Козлов", "Козлв", "Коз", "Мороков А.И.", "Мороков Алексей", "Иванов", "Пл", "козлов"]
+    for _ in range(50):
+        surname = random.choice(["Плюхин", "Козлов", "Мороков"])
+        position = random.randrange(len(surname))
+        queries.append(surname[:position] + surname[position + 1:])
+
+    for query in queries:
+        expected = reference_find(query, "technician")
+        found = UserManager.find_user_by_name(query, "technician")
+        assert (found and found['id']) == (expected and expected['id']), query
+
+
+def test_no_queries_after_warm_up():
+    """Повторный поиск не обращается к БД"""
+    setup_temp_db()
+    register_staff()
+
+    UserManager.find_user_by_name("Плюхин", "technician")
+    before = database.get_pool_stats()
+    for _ in range(100):
+        UserManager.find_user_by_name("Козлов", "technician")
+        UserManager.get_users_by_role("technician")
+    after = database.get_pool_stats()
+
+    assert after['hits'] + after['misses'] == before['hits'] + before['misses']
+
+
+def test_invalidated_on_writes():
+    """register_user / update_user / delete_user сбрасывают кэш"""
+    setup_temp_db()
+    register_staff()
+
+    assert UserManager.find_user_by_name("Сидоров", "technician") is None
+
+    UserManager.register_user(105, "Сидоров Иван Петрович", "technician")
+    sidorov = UserManager.find_user_by_name("Сидоров", "technician")
+    assert sidorov['telegram_id'] == 105
+
+    UserManager.update_user(sidorov['id'], role='doctor')
+    assert UserManager.find_user_by_name("Сидоров", "technician") is None
+    assert UserManager.find_user_by_name("Сидоров", "doctor")['telegram_id'] == 105
+
+    UserManager.update_user(sidorov['id'], is_active=0)
+    assert UserManager.find_user_by_name("Сидоров", "doctor") is None
+
+    morokov = UserManager.find_user_by_name("Мороков Алексей Иванович", "technician")
+    UserManager.delete_user(morokov['id'])
+    # фамилия стала уникальной - снова ищется по фамилии
+    assert UserManager.find_user_by_name("Мороков", "technician")['telegram_id'] == 101
+
+    UserManager.set_admin(103)
+    assert UserManager.get_users_by_role("technician")[1]['is_admin'] is True
+
+
+def test_follows_configured_database():
+    """После database.configure() кэш не отдает пользователей старой БД"""
+    setup_temp_db()
+    register_staff()
+    assert UserManager.find_user_by_name("Плюхин", "technician")
+
+    setup_temp_db()
+    assert UserManager.find_user_by_name("Плюхин", "technician") is None
+    assert get_user_directory().get_users("technician") == []
+
+
+if __name__ == '__main__':
+    test_lookup_rules()
+    test_matches_full_scan()
+    test_no_queries_after_warm_up()
+    test_invalidated_on_writes()
+    test_follows_configured_database()
+    print("All user directory tests passed")
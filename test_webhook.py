@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Тест приема обновлений по webhook (bot.start_webhook, веб-сервер PTB)
+
+Вместо Telegram - OfflineRequest, который отвечает на getMe и setWebhook
+без сети; обновления присылаются POST-запросами на локальный порт.
+"""
+import sys
+import os
+import json
+import socket
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import httpx
+from telegram.request import BaseRequest
+from telegram.ext import Application, MessageHandler, filters
+from bot import start_webhook, WEBHOOK_PATH
+
+SECRET = 'test-secret_123'
+
+
+class OfflineRequest(BaseRequest):
+    """Ответы Bot API без сети: getMe, setWebhook записывается"""
+
+    def __init__(self):
+        self.webhooks = []
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        if url.endswith('/getMe'):
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Test', 'username': 'test_bot'}
+        else:
+            if url.endswith('/setWebhook'):
+                self.webhooks.append(request_data.parameters)
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def update(update_id: int, message: dict = None) -> dict:
+    return {'update_id': update_id, 'message': message or {
+        'message_id': update_id, 'date': 0, 'chat': {'id': 900, 'type': 'private'},
+        'from': {'id': 900, 'is_bot': False, 'first_name': 'Test'}, 'text': f'msg {update_id}'}}
+
+
+def test_webhook_accepts_and_rejects_updates():
+    received = []
+    request = OfflineRequest()
+    port = free_port()
+
+    async def handle(update, context):
+        received.append(update.update_id)
+
+    async def scenario():
+        application = Application.builder().token('123:TEST').request(request).build()
+        application.add_handler(MessageHandler(filters.TEXT, handle))
+        await application.initialize()
+        await application.start()
+        await start_webhook(application, port=port, url='https://bot.example.com/', secret_token=SECRET)
+
+        url = f'http://127.0.0.1:{port}{WEBHOOK_PATH}'
+        headers = {'X-Telegram-Bot-Api-Secret-Token': SECRET}
+        async with httpx.AsyncClient() as client:
+            statuses = [
+                (await client.post(url, json=update(1), headers=headers)).status_code,
+                (await client.post(url, json=update(2), headers={'X-Telegram-Bot-Api-Secret-Token': 'wrong'})).status_code,
+                # обновление без обязательных полей сообщения - 400, а не упавшее соединение
+                (await client.post(url, json=update(3, {'foo': 1}), headers=headers)).status_code,
+                (await client.post(url, json=update(4), headers=headers)).status_code,
+            ]
+
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        return statuses
+
+    statuses = asyncio.run(scenario())
+    assert statuses == [200, 403, 400, 200]
+    assert received == [1, 4]
+
+    webhook = request.webhooks[0]
+    assert webhook['url'] == 'https://bot.example.com' + WEBHOOK_PATH
+    assert webhook['secret_token'] == SECRET
+    # накопленные у Telegram обновления не сбрасываются при перезапуске
+    assert not webhook.get('drop_pending_updates')
+
+
+if __name__ == '__main__':
+    test_webhook_accepts_and_rejects_updates()
+    print("All webhook tests passed")